@@ -76,9 +76,10 @@ export default function StagingTable({ files, onApprove }) {
       return file.metadata.extract;
     }
     
-    // Fall back to first 1000 chars of file content
-    if (file.content && file.content.length > 50) {
-      return file.content.substring(0, 1000) + (file.content.length > 1000 ? '...' : '');
+    // Fall back to first 1000 chars of file content (staging sends a preview, not the body)
+    const body = file.content || file.preview;
+    if (body && body.length > 50) {
+      return body.substring(0, 1000) + (body.length > 1000 ? '...' : '');
     }
     
     return 'No extract available';
@@ -17,13 +17,28 @@ export default function Home() {
     fetchFileStats();
     fetchWebhookStatus();
     
-    // Set up auto-refresh every 2 minutes
-    const interval = setInterval(() => {
-      fetchFileStats();
-      fetchWebhookStatus();
-    }, 120000);
+    // The indexer pushes ingestion, staging, approval and sync events, so
+    // stats are refetched only when something changed
+    const events = new EventSource('https://pkm-indexer-production.up.railway.app/events');
+    ['file-ingested', 'file-staged', 'file-approved', 'resync'].forEach((type) => {
+      events.addEventListener(type, fetchFileStats);
+    });
+    events.addEventListener('sync-progress', (event) => {
+      const progress = JSON.parse(event.data).data;
+      if (progress.stage === 'finished') {
+        fetchFileStats();
+      } else if (progress.total) {
+        setSyncStatus(`Syncing with Google Drive... ${progress.stage} ${progress.done + 1}/${progress.total}`);
+      }
+    });
+    
+    // Webhook expiry is time based, so its status is still refreshed, just rarely
+    const interval = setInterval(fetchWebhookStatus, 600000);
     
-    return () => clearInterval(interval);
+    return () => {
+      events.close();
+      clearInterval(interval);
+    };
   }, []);
 
   const fetchFileStats = async () => {
@@ -54,10 +69,30 @@ export default function Home() {
     }
   };
 
+  // Poll a queued backend job until it finishes and return its final record
+  const waitForJob = async (jobId, onProgress) => {
+    while (true) {
+      const response = await axios.get(`https://pkm-indexer-production.up.railway.app/jobs/${jobId}`);
+      const job = response.data;
+      if (job.status === 'succeeded' || job.status === 'failed') {
+        return job;
+      }
+      if (onProgress && job.progress) {
+        onProgress(job.progress);
+      }
+      await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+  };
+
   const triggerOrganize = async () => {
     try {
       const response = await axios.post('https://pkm-indexer-production.up.railway.app/trigger-organize');
-      alert(`${response.data.status}`);
+      const job = await waitForJob(response.data.job_id);
+      if (job.status === 'failed') {
+        alert(`Organization error: ${job.error}`);
+      } else {
+        alert(`Files processed and organized: ${job.result.success_count} successful, ${job.result.failed_files.length} failed`);
+      }
       // Refresh file stats after organizing
       fetchFileStats();
     } catch (error) {
@@ -70,21 +105,27 @@ export default function Home() {
     setSyncStatus('Syncing with Google Drive...');
     try {
       const response = await axios.post('https://pkm-indexer-production.up.railway.app/sync-drive');
+      const job = await waitForJob(response.data.job_id, (progress) => {
+        setSyncStatus(`Syncing with Google Drive... ${progress.stage} ${progress.done + 1}/${progress.total}`);
+      });
+      const result = job.result || {};
       
       // Handle response with debug info
-      if (response.data.debug) {
-        console.log("Sync debug info:", response.data.debug);
+      if (job.status === 'failed') {
+        setSyncStatus(`❌ Failed: ${job.error}`);
+      } else if (result.debug) {
+        console.log("Sync debug info:", result.debug);
         
         // Check for specific issues
-        if (response.data.debug.error) {
-          setSyncStatus(`❌ ${response.data.status}: ${response.data.debug.error}`);
-        } else if (response.data.debug.inbox_files_count === 0) {
-          setSyncStatus(`ℹ️ ${response.data.status}`);
+        if (result.debug.error) {
+          setSyncStatus(`❌ ${result.status}: ${result.debug.error}`);
+        } else if (result.debug.inbox_files_count === 0) {
+          setSyncStatus(`ℹ️ ${result.status}`);
         } else {
-          setSyncStatus(`✅ ${response.data.status}`);
+          setSyncStatus(`✅ ${result.status}`);
         }
       } else {
-        setSyncStatus(`✅ ${response.data.status}`);
+        setSyncStatus(`✅ ${result.status}`);
       }
       
       // Refresh file stats after sync
@@ -1,5 +1,5 @@
 // File: apps/pkm-app/pages/staging.js
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import StagingTable from '../components/StagingTable';
 import Link from 'next/link';
@@ -9,17 +9,47 @@ export default function Staging() {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [refreshKey, setRefreshKey] = useState(0);
+  const versionRef = useRef(null);
 
   useEffect(() => {
     fetchFiles();
   }, [refreshKey]);
 
+  // Drop approved files as they are approved anywhere, and merge in newly staged ones
+  useEffect(() => {
+    const events = new EventSource('https://pkm-indexer-production.up.railway.app/events?types=file-staged,file-approved');
+    events.addEventListener('file-approved', (event) => {
+      const { name } = JSON.parse(event.data).data;
+      setFiles(current => current.filter(file => file.name !== name));
+    });
+    events.addEventListener('file-staged', fetchChanges);
+    events.addEventListener('resync', () => setRefreshKey(prev => prev + 1));
+    return () => events.close();
+  }, []);
+
+  // Bodies are left out; the preview covers records without an extract
+  const fetchStagingPages = async (params) => {
+    const collected = [];
+    let cursor = null;
+    let first = null;
+    do {
+      const response = await axios.get('https://pkm-indexer-production.up.railway.app/staging', {
+        params: { ...params, fields: 'metadata,preview', limit: 200, ...(cursor ? { cursor } : {}) }
+      });
+      first = first || response.data;
+      collected.push(...(response.data.files || []));
+      cursor = response.data.next_cursor;
+    } while (cursor);
+    return { ...first, files: collected };
+  };
+
   const fetchFiles = async () => {
     setLoading(true);
     try {
-      const response = await axios.get('https://pkm-indexer-production.up.railway.app/staging');
-      console.log("Staging response:", response.data);
-      setFiles(response.data.files || []);
+      const data = await fetchStagingPages({});
+      console.log("Staging response:", data);
+      versionRef.current = data.version;
+      setFiles(data.files);
       setError('');
     } catch (err) {
       console.error("Failed to load staging files:", err);
@@ -29,6 +59,27 @@ export default function Staging() {
     }
   };
 
+  // Merge in only what changed since the last fetch
+  const fetchChanges = async () => {
+    if (!versionRef.current) return;
+    try {
+      const data = await fetchStagingPages({ since: versionRef.current });
+      if (data.reset) {
+        setRefreshKey(prev => prev + 1);
+        return;
+      }
+      versionRef.current = data.version;
+      const changed = new Map(data.files.map(file => [file.name, file]));
+      const removed = new Set(data.removed || []);
+      setFiles(current => [
+        ...current.filter(file => !changed.has(file.name) && !removed.has(file.name)),
+        ...data.files
+      ].sort((a, b) => a.name.localeCompare(b.name)));
+    } catch (err) {
+      console.error("Failed to load staging changes:", err);
+    }
+  };
+
   const handleApprove = async (file) => {
     try {
       setLoading(true);
@@ -0,0 +1,74 @@
+# File: apps/pkm-indexer/bench/bench_imports.py
+"""Profile cold-start import time of the indexer modules.
+
+    python bench/bench_imports.py                # main and organize
+    python bench/bench_imports.py main --top 15 --runs 5
+
+Each run imports the module in a fresh interpreter with -X importtime and
+reports the median total, plus the packages of its slowest direct
+imports by cumulative time, so regressions in cold start show up when a heavy
+dependency starts being imported eagerly again.
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+def profile_once(module):
+    """Return [(name, self_us, cumulative_us, depth)] for one cold import"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+def summarize(module, runs, top):
+    totals = []
+    packages = {}
+    for _ in range(runs):
+        rows = profile_once(module)
+        totals.append(next(cumulative for name, _, cumulative, depth in rows if name == module and depth == 0))
+        # Direct imports of the module (depth 1) carry the cost of everything they pull in
+        run = {}
+        for name, _, cumulative, depth in rows:
+            if depth == 1:
+                package = name.split(".")[0]
+                run[package] = run.get(package, 0) + cumulative
+        for package, cumulative in run.items():
+            packages.setdefault(package, []).append(cumulative)
+    slowest = sorted(
+        ((name, statistics.median(times) / 1000) for name, times in packages.items()),
+        key=lambda item: item[1], reverse=True
+    )[:top]
+    return {
+        "module": module,
+        "runs": runs,
+        "total_ms_median": round(statistics.median(totals) / 1000, 1),
+        "total_ms_min": round(min(totals) / 1000, 1),
+        "slowest_packages_ms": {name: round(ms, 1) for name, ms in slowest},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=["main", "organize"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    print(json.dumps([summarize(module, args.runs, args.top) for module in args.modules], indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# File: apps/pkm-indexer/bench/bench_pipeline.py
+"""Benchmark the organize pipeline against the local LLM stub server.
+
+    python bench/bench_pipeline.py --docs 50 --latency 0.2 --error-rate 0.1
+
+Runs in a throwaway working directory with synthetic text captures, so no
+network access, API key or real vault is needed. Reports documents per
+second, LLM calls and errors seen by the stub, the per-route metrics and
+the rate-limit dispatcher's counters.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = (
+    "knowledge graph retrieval index summary research paper model memory notes system design "
+    "learning vector search embedding pipeline capture review archive project reading"
+).split()
+
+def make_document(rng, words):
+    paragraphs = []
+    while words > 0:
+        n = min(words, rng.randint(40, 120))
+        paragraphs.append(" ".join(rng.choice(WORDS) for _ in range(n)) + ".")
+        words -= n
+    return "\n\n".join(paragraphs)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--words", type=int, default=400, help="Words per synthetic document")
+    parser.add_argument("--mode", choices=("organize", "extract"), default="organize",
+                        help="organize: full Inbox run; extract: get_extract only, with --workers threads")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rpm-limit", type=int, default=None, help="Simulated account requests-per-minute limit")
+    parser.add_argument("--rpm", type=float, default=10000, help="Dispatcher request budget per minute")
+    parser.add_argument("--tpm", type=float, default=10000000, help="Dispatcher token budget per minute")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="pkm-bench-")
+    os.chdir(workdir)
+    os.environ.setdefault("PKM_LLM_RETRY_DELAY", "0.05")
+    os.environ["PKM_LLM_RPM"] = str(args.rpm)
+    os.environ["PKM_LLM_TPM"] = str(args.tpm)
+
+    import llm
+    import llm_stub
+    import routing
+    import llm_dispatch
+    import structured
+    import organize
+
+    config = llm_stub.StubConfig(args.latency, args.jitter, args.error_rate, args.error_status,
+                                 args.retry_after, seed=args.seed, rpm_limit=args.rpm_limit)
+    server, base_url = llm_stub.start_stub_server(config=config)
+    llm.set_backend(llm.OpenAICompatibleBackend(base_url=base_url))
+
+    rng = random.Random(args.seed)
+    documents = [make_document(rng, args.words) for _ in range(args.docs)]
+
+    started = time.time()
+    if args.mode == "organize":
+        os.makedirs(organize.INBOX, exist_ok=True)
+        for i, text in enumerate(documents):
+            with open(os.path.join(organize.INBOX, f"bench_{i:04d}.txt"), "w", encoding="utf-8") as f:
+                f.write(text)
+        result = organize.organize_files()
+        succeeded, failed = result["success_count"], len(result["failed_files"])
+    else:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(lambda text: organize.get_extract(text, file_type="text"), documents))
+        failed = sum(1 for _, _, tags in results if "extraction_failed" in tags)
+        succeeded = len(results) - failed
+    elapsed = time.time() - started
+    server.shutdown()
+
+    print(json.dumps({
+        "mode": args.mode,
+        "docs": args.docs,
+        "succeeded": succeeded,
+        "failed": failed,
+        "seconds": round(elapsed, 3),
+        "docs_per_second": round(args.docs / elapsed, 2) if elapsed else None,
+        "stub": config.stats,
+        "routes": routing.route_metrics(),
+        "dispatcher": llm_dispatch.get_dispatcher().stats(),
+        "parsing": structured.parse_metrics(),
+        "workdir": workdir,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
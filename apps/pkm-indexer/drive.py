@@ -0,0 +1,110 @@
+# File: apps/pkm-indexer/drive.py
+import os
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger("pkm-indexer")
+
+SCOPES = ["https://www.googleapis.com/auth/drive"]
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)  # Refresh this long before the access token expires
+DISCOVERY_CACHE = os.environ.get("PKM_DRIVE_DISCOVERY_CACHE", "pkm/.cache/drive_v3_discovery.json")
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/drive/v3/rest"
+
+_discovery_doc = None
+_discovery_lock = threading.Lock()
+_creds = None
+_creds_lock = threading.Lock()
+_local = threading.local()
+
+# ─── DISCOVERY DOCUMENT ───────────────────────────────────────────
+
+def _load_discovery_document():
+    # 1. Our local copy from a previous start
+    try:
+        with open(DISCOVERY_CACHE, "r", encoding="utf-8") as f:
+            return json.load(f), "cache"
+    except (OSError, ValueError):
+        pass
+
+    # 2. The copy bundled with google-api-python-client, 3. the discovery service
+    from googleapiclient import discovery_cache
+    document = discovery_cache.get_static_doc("drive", "v3")
+    source = "bundled"
+    if document is None:
+        import requests
+        response = requests.get(DISCOVERY_URL, timeout=30)
+        response.raise_for_status()
+        document = response.text
+        source = "network"
+
+    try:
+        os.makedirs(os.path.dirname(DISCOVERY_CACHE) or ".", exist_ok=True)
+        tmp_path = f"{DISCOVERY_CACHE}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(document)
+        os.replace(tmp_path, DISCOVERY_CACHE)
+    except OSError as e:
+        logger.warning(f"Could not cache Drive discovery document: {e}")
+    return json.loads(document), source
+
+def discovery_document():
+    """Return the parsed Drive v3 discovery document, loaded once per process"""
+    global _discovery_doc
+    if _discovery_doc is None:
+        with _discovery_lock:
+            if _discovery_doc is None:
+                _discovery_doc, source = _load_discovery_document()
+                logger.info(f"Loaded Drive discovery document from {source}")
+    return _discovery_doc
+
+def build_service(creds):
+    """Build a Drive v3 client from the cached discovery document - no discovery request"""
+    from googleapiclient.discovery import build_from_document
+    return build_from_document(discovery_document(), credentials=creds)
+
+# ─── CLIENT PROVIDER ──────────────────────────────────────────────
+
+def is_configured():
+    return bool(os.environ.get("GOOGLE_TOKEN_JSON"))
+
+def _needs_refresh(creds):
+    if not creds.token or creds.expiry is None:
+        return True
+    # google-auth keeps expiry as a naive UTC datetime
+    return creds.expiry - datetime.utcnow() < TOKEN_REFRESH_MARGIN
+
+def get_credentials():
+    """Return the process-wide Drive credentials, refreshed before they expire.
+
+    GOOGLE_TOKEN_JSON is parsed once; every caller shares the same object,
+    so a refresh by one thread is seen by all the others.
+    """
+    global _creds
+    with _creds_lock:
+        if _creds is None:
+            token_json = os.environ.get("GOOGLE_TOKEN_JSON")
+            if not token_json:
+                raise RuntimeError("Google Drive credentials missing - set GOOGLE_TOKEN_JSON")
+            from google.oauth2.credentials import Credentials
+            _creds = Credentials.from_authorized_user_info(json.loads(token_json), SCOPES)
+        if _needs_refresh(_creds):
+            from google.auth.transport.requests import Request
+            _creds.refresh(Request())
+            logger.info(f"Refreshed Google Drive access token, valid until {_creds.expiry} UTC")
+        return _creds
+
+def get_service():
+    """Return this thread's Drive client.
+
+    The underlying httplib2 connection is not thread-safe, so each thread
+    builds its own client once, sharing the credentials and the parsed
+    discovery document. Later calls only check the token's expiry.
+    """
+    creds = get_credentials()
+    service = getattr(_local, "service", None)
+    if service is None:
+        service = build_service(creds)
+        _local.service = service
+    return service
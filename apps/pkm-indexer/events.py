@@ -0,0 +1,96 @@
+# File: apps/pkm-indexer/events.py
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+import versions
+
+# In-process pub/sub behind the /events stream. The pipeline publishes from
+# job worker threads; each subscriber is an asyncio queue fed through its
+# event loop. Recent events are kept so a reconnecting client can catch up
+# from Last-Event-ID, or is told to resync when it has fallen too far behind.
+# Ids are "<epoch>.<n>" like the staging versions, so an id from before a
+# restart is recognised as such instead of being compared with new numbers.
+EVENT_TYPES = ("file-ingested", "file-staged", "file-approved", "sync-progress")
+BACKLOG_SIZE = int(os.environ.get("PKM_EVENTS_BACKLOG", "500"))
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+_backlog = deque(maxlen=BACKLOG_SIZE)  # (sequence number, event)
+_subscribers = set()
+_lock = threading.Lock()
+_next_id = 1
+
+def publish(event_type, **data):
+    """Record an event and hand it to every subscriber; safe to call from any thread"""
+    global _next_id
+    with _lock:
+        seq = _next_id
+        event = {"id": f"{versions.EPOCH}.{seq}", "type": event_type, "ts": time.time(), "data": data}
+        _next_id += 1
+        _backlog.append((seq, event))
+        subscribers = list(_subscribers)
+    for subscriber in subscribers:
+        try:
+            subscriber.loop.call_soon_threadsafe(subscriber.offer, event)
+        except RuntimeError:
+            pass  # Its event loop has closed
+    return event
+
+def parse_event_id(value):
+    """Sequence number of an event id from this process, or None for one from another process"""
+    epoch, _, number = (value or "").partition(".")
+    return int(number) if epoch == versions.EPOCH and number.isdigit() else None
+
+def progress_publisher(event_type, forward=None, **context):
+    """Wrap a progress callback so every update is also published"""
+    def report(info):
+        publish(event_type, **context, **info)
+        if forward:
+            forward(info)
+    return report
+
+class Subscription:
+    """One client's view of the stream; iterate it to receive events.
+
+    last_event_id is the id of the last event the client saw, if any. gap is
+    set when events since then can't be replayed: it has left the backlog,
+    or it is from before a restart.
+    """
+
+    def __init__(self, last_event_id=None, types=None):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.types = set(types) if types else None
+        self.overflowed = False
+        after = parse_event_id(last_event_id)
+        with _lock:
+            _subscribers.add(self)
+            if after is None:
+                # New client, or one from another process: it can't know what it missed
+                self.gap = bool(last_event_id)
+                after = 0
+            else:
+                self.gap = not _backlog or _backlog[0][0] > after + 1
+            missed = [event for seq, event in _backlog if seq > after]
+        for event in missed:
+            self.offer(event)
+
+    def offer(self, event):
+        if self.types and event["type"] not in self.types:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def next(self, timeout):
+        """The next event, or None after timeout seconds without one"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        with _lock:
+            _subscribers.discard(self)
@@ -0,0 +1,268 @@
+# File: apps/pkm-indexer/filestats.py
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+import versions
+import metafile
+
+logger = logging.getLogger("pkm-indexer")
+
+# /file-stats is polled by the frontend, so its counters are kept up to date
+# by the code that writes, moves and deletes files (touch()) rather than by
+# listing directories per request. A periodic sweep rebuilds them from disk
+# and logs any drift, so a write path that forgets to touch() self-heals.
+INBOX = "pkm/Inbox"
+METADATA = "pkm/Processed/Metadata"
+SOURCES = "pkm/Processed/Sources"
+RECONCILE_INTERVAL = int(os.environ.get("PKM_FILE_STATS_RECONCILE", "600"))  # seconds
+MAX_TOMBSTONES = int(os.environ.get("PKM_STAGING_TOMBSTONES", "5000"))
+
+_files = {}   # path -> entry from _describe()
+_totals = None
+_lock = threading.Lock()
+_reconciler = None
+_last_reconcile = {"at": None, "drift": 0, "seconds": 0.0}
+_scanning = threading.Event()
+_touched = set()  # Paths touched while a reconcile scan is running
+# Records that left staging (approved or deleted): name -> version, oldest first.
+# Deltas older than the oldest one pruned can't be answered, only reset.
+_tombstones = OrderedDict()
+_tombstone_floor = 0
+
+# ─── FILE ENTRIES ─────────────────────────────────────────────────
+
+def _classify(path):
+    """Return (area, source type) for a tracked path, or None"""
+    directory, name = os.path.split(os.path.normpath(path))
+    if ".part-" in name:
+        return None  # Upload still streaming in
+    if directory == os.path.normpath(INBOX):
+        return "inbox", None
+    if directory == os.path.normpath(METADATA):
+        return ("metadata", None) if name.endswith(".md") else None
+    parent, source_type = os.path.split(directory)
+    if parent == os.path.normpath(SOURCES):
+        return "source", source_type
+    return None
+
+def _read_flags(path):
+    """(reviewed, failed) from a metadata file's frontmatter, read up to its closing delimiter"""
+    metadata, _ = metafile.read_header(path)
+    reviewed = metadata.get("reviewed") is True
+    failed = "extraction_failed" in metadata.get("tags", []) or metadata.get("reprocess_status") == "failed"
+    return reviewed, failed
+
+def _describe(path):
+    kind = _classify(path)
+    if kind is None:
+        return None
+    try:
+        stat = os.stat(path)
+        if not os.path.isfile(path):
+            return None
+        reviewed, failed = _read_flags(path) if kind[0] == "metadata" else (False, False)
+    except OSError:
+        return None
+    return {
+        "area": kind[0],
+        "type": kind[1],
+        "bytes": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "reviewed": reviewed,
+        "failed": failed
+    }
+
+def _same(old, new):
+    """Whether two entries describe the same file state, ignoring the version stamp"""
+    if old is None or new is None:
+        return old is new
+    return {**old, "version": None} == {**new, "version": None}
+
+# ─── COUNTERS ─────────────────────────────────────────────────────
+
+def _empty_totals():
+    return {
+        "inbox_count": 0,
+        "inbox_bytes": 0,
+        "metadata_count": 0,
+        "metadata_bytes": 0,
+        "unreviewed_count": 0,
+        "failed_count": 0,
+        "source_types": {},
+        "source_bytes": {},
+    }
+
+def _add(totals, entry, sign):
+    area = entry["area"]
+    if area == "source":
+        for key, amount in (("source_types", 1), ("source_bytes", entry["bytes"])):
+            value = totals[key].get(entry["type"], 0) + sign * amount
+            if value:
+                totals[key][entry["type"]] = value
+            else:
+                totals[key].pop(entry["type"], None)
+        return
+    totals[f"{area}_count"] += sign
+    totals[f"{area}_bytes"] += sign * entry["bytes"]
+    if area == "metadata":
+        totals["unreviewed_count"] += sign * (not entry["reviewed"])
+        totals["failed_count"] += sign * entry["failed"]
+
+def touch(*paths):
+    """Re-read the given paths after a write, move or delete and update the counters.
+
+    Safe to call for any path; untracked paths are ignored. For a move, touch
+    both the old and the new path.
+    """
+    for path in paths:
+        if not path or _classify(path) is None:
+            continue
+        path = os.path.normpath(path)
+        entry = _describe(path)
+        with _lock:
+            if _scanning.is_set():
+                _touched.add(path)
+            # Any write can change /staging, even one that leaves the counters as they were
+            version = versions.bump("files")
+            # Until the first scan builds the counters there is nothing to update
+            if _totals is not None:
+                old = _files.pop(path, None)
+                if old:
+                    _add(_totals, old, -1)
+                if entry:
+                    entry["version"] = version
+                    _files[path] = entry
+                    _add(_totals, entry, 1)
+                _track_staging(path, old, entry, version)
+
+def _track_staging(path, old, new, version):
+    """Record a tombstone when a metadata file leaves staging; call with _lock held"""
+    global _tombstone_floor
+    if (old or new)["area"] != "metadata":
+        return
+    name = os.path.basename(path)
+    if new and not new["reviewed"]:
+        _tombstones.pop(name, None)
+    elif old and not old["reviewed"]:
+        _tombstones.pop(name, None)
+        _tombstones[name] = version
+        while len(_tombstones) > MAX_TOMBSTONES:
+            _, pruned = _tombstones.popitem(last=False)
+            _tombstone_floor = max(_tombstone_floor, pruned)
+
+def _scan():
+    files = {}
+    directories = [INBOX, METADATA]
+    if os.path.isdir(SOURCES):
+        directories += [os.path.join(SOURCES, name) for name in os.listdir(SOURCES)]
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        with os.scandir(directory) as entries:
+            for item in entries:
+                path = os.path.normpath(os.path.join(directory, item.name))
+                entry = _describe(path)
+                if entry:
+                    files[path] = entry
+    return files
+
+def reconcile():
+    """Rebuild the counters from disk; returns how many files had drifted"""
+    global _files, _totals
+    started = time.time()
+    with _lock:
+        _scanning.set()
+    files = _scan()
+    totals = _empty_totals()
+    for entry in files.values():
+        _add(totals, entry, 1)
+    with _lock:
+        first_build = _totals is None
+        changed = [path for path in set(files) | set(_files) if not _same(_files.get(path), files.get(path))]
+        drift = 0 if first_build else len(set(changed) - _touched)
+        version = versions.bump("files") if first_build or changed else None
+        for path, entry in files.items():
+            old = _files.get(path)
+            entry["version"] = old["version"] if _same(old, entry) else version
+        if not first_build:
+            for path in changed:
+                _track_staging(path, _files.get(path), files.get(path), version)
+        _files, _totals = files, totals
+        touched = set(_touched)
+        _touched.clear()
+        _scanning.clear()
+    # Files touched while the scan ran may have been listed before they changed
+    touch(*touched)
+    _last_reconcile.update(at=started, drift=drift, seconds=round(time.time() - started, 3))
+    if drift:
+        logger.warning(f"File stats reconciliation corrected {drift} files")
+    return drift
+
+def snapshot():
+    """Current counters plus when they were last reconciled with the disk"""
+    if _totals is None:
+        reconcile()
+    with _lock:
+        stats = dict(_totals)
+        stats["source_types"] = dict(_totals["source_types"])
+        stats["source_bytes"] = dict(_totals["source_bytes"])
+    stats["reconciled_at"] = _last_reconcile["at"]
+    stats["reconcile_drift"] = _last_reconcile["drift"]
+    return stats
+
+# ─── STAGING ──────────────────────────────────────────────────────
+
+def staging_version():
+    """Opaque token for the current state of staging, for a later staged(since=...)"""
+    if _totals is None:
+        reconcile()
+    version, _ = versions.current("files")
+    return f"{versions.EPOCH}.{version}"
+
+def staged(after=None, since=None, limit=100):
+    """Names of unreviewed metadata records in name order, a page at a time.
+
+    after is the last name of the previous page. With since (a token from
+    staging_version()) only records created or changed after it are listed,
+    along with the names that left staging since. reset is True when the
+    token is from another process or older than the tombstones kept; the
+    full listing is returned instead. Returns (names, removed, reset, more).
+    """
+    if _totals is None:
+        reconcile()
+    since_version = None
+    reset = False
+    if since is not None:
+        epoch, _, number = since.partition(".")
+        since_version = int(number) if epoch == versions.EPOCH and number.isdigit() else None
+        reset = since_version is None or since_version < _tombstone_floor
+        if reset:
+            since_version = None
+    with _lock:
+        names = sorted(
+            os.path.basename(path) for path, entry in _files.items()
+            if entry["area"] == "metadata" and not entry["reviewed"]
+            and (since_version is None or entry["version"] > since_version)
+            and (after is None or os.path.basename(path) > after)
+        )
+        removed = [] if since_version is None else [
+            name for name, version in _tombstones.items() if version > since_version
+        ]
+    return names[:limit], removed, reset, len(names) > limit
+
+def _reconcile_loop():
+    while True:
+        try:
+            reconcile()
+        except Exception as e:
+            logger.error(f"File stats reconciliation failed: {e}")
+        time.sleep(RECONCILE_INTERVAL)
+
+def start_reconciler():
+    """Start the thread that builds the counters and then reconciles them periodically"""
+    global _reconciler
+    if _reconciler is None and RECONCILE_INTERVAL > 0:
+        _reconciler = threading.Thread(target=_reconcile_loop, name="pkm-file-stats", daemon=True)
+        _reconciler.start()
@@ -2,8 +2,10 @@
 import os
 import logging
 import json
+import heapq
+import itertools
 from datetime import datetime
-import re
+import metafile
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -15,7 +17,8 @@ def simple_text_search(query, directory="pkm", limit=3):
     Perform a simple text-based search on markdown files.
     This is a fallback when vector search is not available.
     """
-    results = []
+    results = []  # Min-heap of (score, order, result) holding the top matches
+    tiebreak = itertools.count(0, -1)  # Earlier files win ties, as with a stable sort
     query_terms = query.lower().split()
     
     try:
@@ -45,26 +48,27 @@ def simple_text_search(query, directory="pkm", limit=3):
                         # If there's any match, add to results
                         if score > 0:
                             # Extract title from frontmatter or filename
-                            title = file
-                            title_match = re.search(r"title:\s*(.+)", content)
-                            if title_match:
-                                title = title_match.group(1).strip()
+                            header, _ = metafile.split(content)
+                            title = metafile.parse_header(header).get("title") if header else None
                             
-                            results.append({
+                            result = {
                                 "score": score,
-                                "title": title,
+                                "title": str(title).strip() if title else file,
                                 "content": content,
                                 "path": file_path
-                            })
+                            }
+                            # Keep only the best matches, not the text of every matching file
+                            entry = (score, next(tiebreak), result)
+                            if len(results) < limit:
+                                heapq.heappush(results, entry)
+                            elif entry > results[0]:
+                                heapq.heapreplace(results, entry)
                     
                     except Exception as e:
                         logger.error(f"Error processing file {file_path}: {e}")
         
         # Sort by relevance score
-        results.sort(key=lambda x: x["score"], reverse=True)
-        
-        # Return top results
-        return results[:limit]
+        return [result for _, _, result in sorted(results, key=lambda entry: entry[:2], reverse=True)]
     
     except Exception as e:
         logger.error(f"Error in simple search: {e}")
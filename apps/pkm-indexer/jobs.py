@@ -0,0 +1,278 @@
+# File: apps/pkm-indexer/jobs.py
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+import traceback
+
+logger = logging.getLogger("pkm-indexer")
+
+JOBS_DB = os.environ.get("PKM_JOBS_DB", "pkm/jobs.db")
+JOB_WORKERS = int(os.environ.get("PKM_JOB_WORKERS", "2"))
+# Jobs that serialize on a shared resource (sync and organize on the Inbox)
+# get their own lane, so a backlog of them never holds the workers that
+# reprocess and other short jobs run on.
+LANE_WORKERS = {"ingest": int(os.environ.get("PKM_INGEST_WORKERS", "1"))}
+DEFAULT_LANE = "default"
+MAX_ATTEMPTS = 3  # Jobs interrupted this many times are given up on at recovery
+
+ACTIVE_STATES = ("queued", "running")
+
+_handlers = {}
+_lanes = {}  # kind -> lane
+_workers = []
+_stop = threading.Event()
+_wakeup = threading.Condition()
+_local = threading.local()
+
+# ─── STORAGE ──────────────────────────────────────────────────────
+
+def _connect():
+    """Return this thread's connection to the job database"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(JOBS_DB) or ".", exist_ok=True)
+        # Autocommit mode - transactions are opened explicitly where needed
+        conn = sqlite3.connect(JOBS_DB, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                job_key TEXT,
+                status TEXT NOT NULL,
+                payload TEXT,
+                progress TEXT,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (job_key, status)")
+        _local.conn = conn
+    return conn
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    for field in ("payload", "progress", "result"):
+        if job[field] is not None:
+            job[field] = json.loads(job[field])
+    return job
+
+# ─── PUBLIC API ───────────────────────────────────────────────────
+
+def register_handler(kind, handler, lane=DEFAULT_LANE):
+    """Register the function that runs jobs of the given kind.
+
+    Handlers are called as handler(payload, job) where job is a JobContext,
+    and must return a JSON-serializable result. Jobs run on the workers of
+    their lane, a name from LANE_WORKERS or the default lane.
+    """
+    _handlers[kind] = handler
+    _lanes[kind] = lane
+
+def enqueue(kind, payload=None, key=None, coalesce_running=True, update_queued=False):
+    """Queue a job and return its record.
+
+    If key is given and a job with the same key is already queued (or running,
+    when coalesce_running is set), that job is returned instead of a new one;
+    with update_queued, a queued job takes this payload so the latest request
+    wins. Jobs with the same key never run at the same time.
+    """
+    conn = _connect()
+    now = time.time()
+    states = ACTIVE_STATES if coalesce_running else ("queued",)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if key:
+            placeholders = ",".join("?" for _ in states)
+            existing = conn.execute(
+                f"SELECT * FROM jobs WHERE job_key = ? AND status IN ({placeholders}) ORDER BY created_at LIMIT 1",
+                (key, *states)
+            ).fetchone()
+            if existing:
+                if update_queued and existing["status"] == "queued":
+                    conn.execute(
+                        "UPDATE jobs SET payload = ?, updated_at = ? WHERE id = ?",
+                        (json.dumps(payload or {}), now, existing["id"])
+                    )
+                conn.execute("COMMIT")
+                return get_job(existing["id"])
+
+        job_id = uuid.uuid4().hex
+        conn.execute(
+            "INSERT INTO jobs (id, kind, job_key, status, payload, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+            (job_id, kind, key, json.dumps(payload or {}), now, now)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    with _wakeup:
+        _wakeup.notify_all()  # Only the job's lane can take it
+    return get_job(job_id)
+
+def get_job(job_id):
+    """Return a job record, or None if it does not exist"""
+    row = _connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _row_to_job(row)
+
+def list_jobs(status=None, limit=50):
+    """Return the most recent jobs, optionally filtered by status"""
+    if status:
+        rows = _connect().execute(
+            "SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)
+        ).fetchall()
+    else:
+        rows = _connect().execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+    return [_row_to_job(row) for row in rows]
+
+class JobContext:
+    """Handle passed to job handlers for reporting progress"""
+
+    def __init__(self, job):
+        self.id = job["id"]
+        self.kind = job["kind"]
+        self.attempts = job["attempts"]
+
+    def progress(self, info):
+        _connect().execute(
+            "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(info), time.time(), self.id)
+        )
+
+# ─── WORKERS ──────────────────────────────────────────────────────
+
+def _lane_filter(lane):
+    """SQL condition and parameters selecting the job kinds a lane runs"""
+    if lane == DEFAULT_LANE:
+        # Also picks up kinds with no handler, so they are failed rather than left queued
+        kinds = [kind for kind, kind_lane in _lanes.items() if kind_lane != DEFAULT_LANE]
+        operator = "NOT IN"
+    else:
+        kinds = [kind for kind, kind_lane in _lanes.items() if kind_lane == lane]
+        operator = "IN"
+    return f"kind {operator} ({','.join('?' for _ in kinds)})", kinds
+
+def _claim_next(lane=DEFAULT_LANE):
+    """Atomically move the lane's oldest queued job to running and return it"""
+    condition, kinds = _lane_filter(lane)
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            f"SELECT id FROM jobs WHERE status = 'queued' AND {condition} "
+            # A follow-up job waits for the running one with the same key
+            "AND (job_key IS NULL OR job_key NOT IN "
+            "(SELECT job_key FROM jobs WHERE status = 'running' AND job_key IS NOT NULL)) "
+            "ORDER BY created_at LIMIT 1", kinds
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        now = time.time()
+        conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, updated_at = ? WHERE id = ?",
+            (now, now, row["id"])
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return get_job(row["id"])
+
+def _finish(job_id, status, result=None, error=None):
+    now = time.time()
+    _connect().execute(
+        "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+        (status, json.dumps(result) if result is not None else None, error, now, now, job_id)
+    )
+    # A follow-up job with the same key may have been waiting on this one
+    with _wakeup:
+        _wakeup.notify_all()
+
+def _run_job(job):
+    handler = _handlers.get(job["kind"])
+    if handler is None:
+        _finish(job["id"], "failed", error=f"No handler registered for job kind '{job['kind']}'")
+        return
+
+    logger.info(f"Job {job['id']} ({job['kind']}) started, attempt {job['attempts']}")
+    try:
+        result = handler(job["payload"], JobContext(job))
+        _finish(job["id"], "succeeded", result=result)
+        logger.info(f"Job {job['id']} ({job['kind']}) succeeded")
+    except Exception as e:
+        logger.error(f"Job {job['id']} ({job['kind']}) failed: {e}\n{traceback.format_exc()}")
+        _finish(job["id"], "failed", error=str(e))
+
+def _worker_loop(lane):
+    while not _stop.is_set():
+        try:
+            job = _claim_next(lane)
+        except Exception as e:
+            logger.error(f"Job worker could not claim a job: {e}")
+            job = None
+
+        if job is None:
+            # Sleep until something is enqueued, with a poll as a safety net
+            with _wakeup:
+                _wakeup.wait(timeout=2)
+            continue
+
+        _run_job(job)
+
+def recover_interrupted_jobs():
+    """Requeue jobs left running by a previous process"""
+    conn = _connect()
+    now = time.time()
+    conn.execute(
+        "UPDATE jobs SET status = 'failed', error = 'Interrupted too many times', finished_at = ?, updated_at = ? "
+        "WHERE status = 'running' AND attempts >= ?",
+        (now, now, MAX_ATTEMPTS)
+    )
+    requeued = conn.execute(
+        "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'", (now,)
+    ).rowcount
+    if requeued:
+        logger.info(f"Requeued {requeued} interrupted jobs")
+    return requeued
+
+def start_workers(count=None):
+    """Recover interrupted jobs and start the worker threads of every lane"""
+    if _workers:
+        return
+    recover_interrupted_jobs()
+    _stop.clear()
+    lanes = {DEFAULT_LANE: count or JOB_WORKERS, **LANE_WORKERS}
+    for lane, workers in lanes.items():
+        for i in range(workers):
+            worker = threading.Thread(target=_worker_loop, args=(lane,), name=f"pkm-job-{lane}-{i}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+    logger.info(f"Started {len(_workers)} job workers ({', '.join(f'{lane}: {n}' for lane, n in lanes.items())})")
+
+def workers_alive():
+    """True if the worker threads are started and all still running"""
+    return bool(_workers) and all(worker.is_alive() for worker in _workers)
+
+def stop_workers(timeout=30):
+    """Ask the workers to exit once their current job is done"""
+    _stop.set()
+    with _wakeup:
+        _wakeup.notify_all()
+    for worker in _workers:
+        worker.join(timeout=timeout)
+    _workers.clear()
@@ -0,0 +1,95 @@
+# File: apps/pkm-indexer/llm.py
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# Any OpenAI-compatible endpoint works - point this at llm_stub.py for offline runs
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+LLM_TIMEOUT = float(os.environ.get("PKM_LLM_TIMEOUT", "120"))
+LLM_POOL_SIZE = int(os.environ.get("PKM_LLM_POOL_SIZE", "8"))
+MAX_RETRIES = int(os.environ.get("PKM_LLM_MAX_RETRIES", "3"))
+RETRY_DELAY = float(os.environ.get("PKM_LLM_RETRY_DELAY", "2"))  # seconds, doubled per attempt
+
+_backend = None
+_backend_lock = threading.Lock()
+
+class LLMError(Exception):
+    """A failed chat completion, with the HTTP status and headers when there was a response"""
+
+    def __init__(self, message, status=None, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+# ─── BACKENDS ─────────────────────────────────────────────────────
+
+class OpenAICompatibleBackend:
+    """Chat completions over HTTP against an OpenAI-compatible API.
+
+    One pooled session is shared by every thread, so concurrent extracts
+    reuse connections instead of opening a new TLS session per call.
+    The API key is read on each call, so it can be set after import.
+    """
+
+    def __init__(self, base_url=None, api_key=None, timeout=LLM_TIMEOUT, pool_size=LLM_POOL_SIZE):
+        self.base_url = (base_url or os.environ.get("OPENAI_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self._api_key = api_key
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @property
+    def api_key(self):
+        return self._api_key or os.environ.get("OPENAI_API_KEY")
+
+    def is_configured(self):
+        # Local endpoints such as the stub server don't need a key
+        return bool(self.api_key) or self.base_url != DEFAULT_BASE_URL
+
+    def chat(self, model, messages, max_tokens, temperature=0.7, **options):
+        """Run one chat completion and return {"content", "usage", "headers"}"""
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        payload = {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+        payload.update(options)
+
+        try:
+            response = self.session.post(
+                f"{self.base_url}/chat/completions", json=payload, headers=headers, timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            raise LLMError(f"LLM request failed: {e}") from e
+
+        if response.status_code != 200:
+            raise LLMError(
+                f"LLM API returned {response.status_code}: {response.text[:300]}",
+                status=response.status_code,
+                headers=dict(response.headers)
+            )
+        try:
+            data = response.json()
+            content = data["choices"][0]["message"]["content"] or ""
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise LLMError(f"Malformed LLM response: {response.text[:300]}", status=response.status_code) from e
+        return {"content": content, "usage": data.get("usage", {}), "headers": dict(response.headers)}
+
+# ─── PROVIDER ─────────────────────────────────────────────────────
+
+def get_backend():
+    """Return the process-wide LLM backend, creating it on first use"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = OpenAICompatibleBackend()
+    return _backend
+
+def set_backend(backend):
+    """Swap the backend, e.g. to point benchmarks at a different endpoint"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
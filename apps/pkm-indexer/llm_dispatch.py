@@ -0,0 +1,301 @@
+# File: apps/pkm-indexer/llm_dispatch.py
+import os
+import re
+import time
+import queue
+import random
+import logging
+import threading
+from concurrent.futures import Future
+import llm
+import routing
+
+logger = logging.getLogger("pkm-indexer")
+
+# Account limits; the x-ratelimit-limit-* response headers override these once seen
+LLM_RPM = float(os.environ.get("PKM_LLM_RPM", "500"))
+LLM_TPM = float(os.environ.get("PKM_LLM_TPM", "90000"))
+BURST_SECONDS = 10  # Buckets hold this many seconds of quota, so a cold start can't spend the whole minute at once
+
+# Adaptive concurrency: additive increase per success, multiplicative decrease on 429 or slow responses
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = int(os.environ.get("PKM_LLM_MAX_CONCURRENCY", "8"))
+INITIAL_CONCURRENCY = 2
+BACKOFF_FACTOR = 0.5
+LATENCY_BACKOFF_FACTOR = 0.9
+LATENCY_RATIO = 2.5  # Responses this much slower than the smoothed baseline count as congestion
+LATENCY_EWMA_ALPHA = 0.1  # Weight of each new sample in the baseline, so ordinary jitter averages out
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+# ─── TOKEN BUCKETS ────────────────────────────────────────────────
+
+class TokenBucket:
+    """Refills continuously at rate_per_minute; acquire() blocks until enough is available"""
+
+    def __init__(self, rate_per_minute):
+        self.lock = threading.Lock()
+        self.set_rate(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def set_rate(self, rate_per_minute):
+        with self.lock:
+            self.rate = rate_per_minute / 60.0
+            self.capacity = max(1.0, self.rate * BURST_SECONDS)
+            if hasattr(self, "tokens"):
+                self.tokens = min(self.tokens, self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def drain(self, remaining):
+        """Lower the level to what the server reports is left"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, remaining)
+
+    def acquire(self, amount):
+        # Requests larger than the bucket would never fit; let them through once it is full
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(min(wait, 1.0))
+
+def parse_reset(value):
+    """Parse an x-ratelimit-reset-* header such as '1s', '6m0s' or '20ms' into seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = re.findall(r"([\d.]+)(ms|s|m|h)", value)
+    return sum(float(number) * units[unit] for number, unit in parts) if parts else None
+
+# ─── DISPATCHER ───────────────────────────────────────────────────
+
+class _Request:
+    def __init__(self, model, messages, max_tokens, temperature, log_f, options):
+        self.model = model
+        self.messages = messages
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.log_f = log_f
+        self.options = {k: v for k, v in options.items() if v is not None}
+        # Providers count max_tokens against the token limit up front
+        self.cost = routing.estimate_tokens(" ".join(m.get("content") or "" for m in messages)) + max_tokens
+        self.attempt = 0
+        self.future = Future()
+
+class Dispatcher:
+    """Shared queue that every LLM call goes through.
+
+    Worker threads take requests in order, wait for request and token
+    budget, and keep in-flight calls under an adaptive limit. 429s and
+    slow responses shrink the limit; successes grow it back. Retry-After
+    and x-ratelimit-* headers pause the whole queue rather than letting
+    each caller back off (and retry) on its own.
+    """
+
+    def __init__(self, rpm=LLM_RPM, tpm=LLM_TPM, max_concurrency=MAX_CONCURRENCY):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.limit = float(min(INITIAL_CONCURRENCY, max_concurrency))
+        self.in_flight = 0
+        self.pause_until = 0.0
+        self.latency_baseline = None  # EWMA of seconds per output token (or per call without usage)
+        self.delayed = 0
+        self.queue = queue.Queue()
+        self.slots = threading.Condition()
+        self.stats_lock = threading.Lock()
+        self.counters = {"submitted": 0, "succeeded": 0, "failed": 0, "retries": 0, "rate_limited": 0}
+        self.workers = [
+            threading.Thread(target=self._worker_loop, name=f"pkm-llm-{i}", daemon=True)
+            for i in range(max_concurrency)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, model, messages, max_tokens, temperature=0.7, log_f=None, **options):
+        """Queue a chat completion and return a Future resolving to the backend response.
+
+        Extra options such as response_format are passed through to the backend.
+        """
+        request = _Request(model, messages, max_tokens, temperature, log_f, options)
+        self._count("submitted")
+        self.queue.put(request)
+        return request.future
+
+    def stats(self):
+        with self.stats_lock:
+            snapshot = dict(self.counters)
+        snapshot.update({
+            "concurrency_limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": self.queue.qsize(),
+            "delayed_retries": self.delayed,
+            "latency_baseline": round(self.latency_baseline, 6) if self.latency_baseline is not None else None,
+            "paused_for_seconds": round(max(0.0, self.pause_until - time.time()), 2),
+            "requests_per_minute": round(self.requests.rate * 60),
+            "tokens_per_minute": round(self.tokens.rate * 60),
+        })
+        return snapshot
+
+    def _count(self, name):
+        with self.stats_lock:
+            self.counters[name] += 1
+
+    def _acquire_slot(self):
+        with self.slots:
+            while self.in_flight >= int(self.limit):
+                self.slots.wait()
+            self.in_flight += 1
+
+    def _release_slot(self):
+        with self.slots:
+            self.in_flight -= 1
+            self.slots.notify_all()
+
+    def _adjust(self, rate_limited=False, latency=None, output_tokens=None):
+        with self.slots:
+            if rate_limited:
+                self.limit = max(MIN_CONCURRENCY, self.limit * BACKOFF_FACTOR)
+            elif latency is not None:
+                # Longer answers take longer, so compare time per generated token when it is known
+                sample = latency / output_tokens if output_tokens else latency
+                baseline = self.latency_baseline if self.latency_baseline is not None else sample
+                if sample > baseline * LATENCY_RATIO:
+                    self.limit = max(MIN_CONCURRENCY, self.limit * LATENCY_BACKOFF_FACTOR)
+                else:
+                    self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+                self.latency_baseline = baseline + LATENCY_EWMA_ALPHA * (sample - baseline)
+            self.slots.notify_all()
+
+    def _apply_headers(self, headers):
+        """Follow the provider's view of the limits and what is left of them"""
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            try:
+                limit = float(headers[f"x-ratelimit-limit-{kind}"])
+                if abs(limit / 60.0 - bucket.rate) > 1e-9:
+                    bucket.set_rate(limit)
+            except (KeyError, ValueError):
+                pass
+            try:
+                remaining = float(headers[f"x-ratelimit-remaining-{kind}"])
+            except (KeyError, ValueError):
+                continue
+            bucket.drain(remaining)
+            if remaining <= 0:
+                reset = parse_reset(headers.get(f"x-ratelimit-reset-{kind}"))
+                if reset:
+                    self.pause_until = max(self.pause_until, time.time() + reset)
+
+    def _retry_delay(self, request, error):
+        headers = {k.lower(): v for k, v in error.headers.items()}
+        retry_after = parse_reset(headers.get("retry-after"))
+        if retry_after is None:
+            retry_after = parse_reset(headers.get("x-ratelimit-reset-requests") or headers.get("x-ratelimit-reset-tokens"))
+        if retry_after is not None:
+            return retry_after
+        # Full jitter keeps concurrent retries from arriving together
+        return random.uniform(0, llm.RETRY_DELAY * (2 ** request.attempt))
+
+    def _handle_error(self, request, error):
+        request.attempt += 1
+        rate_limited = error.status == 429
+        if rate_limited:
+            self._count("rate_limited")
+            self._adjust(rate_limited=True)
+        retryable = error.status is None or error.status in RETRYABLE_STATUS
+        if not retryable or request.attempt >= llm.MAX_RETRIES:
+            self._count("failed")
+            request.future.set_exception(error)
+            return
+
+        delay = self._retry_delay(request, error)
+        if rate_limited:
+            # Everyone waits, not just this request
+            self.pause_until = max(self.pause_until, time.time() + delay)
+        self._count("retries")
+        print(f"🔄 LLM API error, retrying in {delay:.1f}s ({request.attempt}/{llm.MAX_RETRIES}): {error}")
+        if request.log_f:
+            request.log_f.write(f"LLM API error, retrying in {delay:.1f}s: {error}\n")
+        self._requeue_later(request, delay)
+
+    def _requeue_later(self, request, delay):
+        """Put a retry back on the queue after delay, without holding a worker meanwhile"""
+        def requeue():
+            with self.stats_lock:
+                self.delayed -= 1
+            self.queue.put(request)
+        with self.stats_lock:
+            self.delayed += 1
+        timer = threading.Timer(delay, requeue)
+        timer.daemon = True
+        timer.start()
+
+    def _worker_loop(self):
+        while True:
+            request = self.queue.get()
+            # A queue-wide pause (429, exhausted quota) holds every worker on purpose
+            wait = self.pause_until - time.time()
+            if wait > 0:
+                time.sleep(wait)
+
+            self._acquire_slot()
+            try:
+                # A pause may have started while this worker waited for a slot
+                wait = self.pause_until - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+                self.requests.acquire(1)
+                self.tokens.acquire(request.cost)
+                started = time.time()
+                try:
+                    response = llm.get_backend().chat(
+                        request.model, request.messages, request.max_tokens, temperature=request.temperature,
+                        **request.options
+                    )
+                except llm.LLMError as e:
+                    self._apply_headers(e.headers)
+                    self._handle_error(request, e)
+                    continue
+                except Exception as e:
+                    self._handle_error(request, llm.LLMError(str(e)))
+                    continue
+                self._apply_headers(response.get("headers"))
+                usage = response.get("usage") or {}
+                self._adjust(latency=time.time() - started, output_tokens=usage.get("completion_tokens"))
+                self._count("succeeded")
+                request.future.set_result(response)
+            except Exception as e:
+                logger.error(f"LLM dispatcher worker error: {e}")
+                if not request.future.done():
+                    request.future.set_exception(e)
+            finally:
+                self._release_slot()
+
+# ─── PROVIDER ─────────────────────────────────────────────────────
+
+def get_dispatcher():
+    """Return the process-wide dispatcher, starting its workers on first use"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = Dispatcher()
+    return _dispatcher
@@ -0,0 +1,162 @@
+# File: apps/pkm-indexer/llm_stub.py
+"""Local OpenAI-compatible chat completions server for offline testing.
+
+    python llm_stub.py --port 8999 --latency 0.2 --error-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8999/v1 uvicorn main:app
+
+Responses are canned JSON extracts, so the pipeline can be exercised and
+benchmarked deterministically without network access or an API key.
+--rpm-limit simulates an account limit with 429s and x-ratelimit-* headers.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_EXTRACT = {
+    "extract_title": "Stub Extract",
+    "extract_content": "Canned summary returned by the local LLM stub server.",
+    "tags": ["stub", "offline"],
+}
+
+class StubConfig:
+    """Behaviour of the stub server; adjustable while it is running"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=429, retry_after=None,
+                 response=None, seed=None, rpm_limit=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.response = response or json.dumps(CANNED_EXTRACT)
+        self.random = random.Random(seed)
+        self.rpm_limit = rpm_limit  # Simulated account limit, enforced over a sliding minute
+        self.window = []
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0}
+
+    def rate_limit_headers(self, now):
+        """Return (headers, limited) for a request arriving at now, like the OpenAI x-ratelimit-* headers"""
+        if not self.rpm_limit:
+            return {}, False
+        self.window = [t for t in self.window if t > now - 60]
+        limited = len(self.window) >= self.rpm_limit
+        if not limited:
+            self.window.append(now)
+        reset = 60 - (now - self.window[0]) if self.window else 0
+        return {
+            "x-ratelimit-limit-requests": str(self.rpm_limit),
+            "x-ratelimit-remaining-requests": str(max(0, self.rpm_limit - len(self.window))),
+            "x-ratelimit-reset-requests": f"{reset:.3f}s",
+        }, limited
+
+def _make_handler(config):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, so pooled clients reuse connections
+
+        def _send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                request = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+                return
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+
+            with config.lock:
+                config.stats["requests"] += 1
+                limit_headers, limited = config.rate_limit_headers(time.time())
+                if limited:
+                    config.stats["rate_limited"] += 1
+                delay = max(0.0, config.latency + config.random.uniform(-config.jitter, config.jitter))
+                fail = not limited and config.random.random() < config.error_rate
+                if fail:
+                    config.stats["errors"] += 1
+
+            if limited:
+                limit_headers["Retry-After"] = limit_headers["x-ratelimit-reset-requests"].rstrip("s")
+                self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, limit_headers)
+                return
+            time.sleep(delay)
+
+            if fail:
+                headers = {"Retry-After": str(config.retry_after)} if config.retry_after is not None else {}
+                self._send_json(config.error_status, {"error": {"message": "Stub error", "type": "stub_error"}}, headers)
+                return
+
+            prompt_chars = sum(len(m.get("content") or "") for m in request.get("messages", []))
+            self._send_json(200, {
+                "id": f"stub-{config.stats['requests']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": config.response},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_chars // 4,
+                    "completion_tokens": len(config.response) // 4,
+                    "total_tokens": (prompt_chars + len(config.response)) // 4,
+                },
+            }, limit_headers)
+
+        def log_message(self, format, *args):
+            pass  # Quiet - benchmarks would otherwise be dominated by request logging
+
+    return StubHandler
+
+def start_stub_server(host="127.0.0.1", port=0, config=None):
+    """Start the stub in a background thread; returns (server, base_url)"""
+    config = config or StubConfig()
+    server = ThreadingHTTPServer((host, port), _make_handler(config))
+    server.daemon_threads = True
+    server.config = config
+    threading.Thread(target=server.serve_forever, name="llm-stub", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8999)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After seconds sent with errors")
+    parser.add_argument("--response-file", help="File whose contents are returned as the completion")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--rpm-limit", type=int, default=None, help="Simulated requests-per-minute limit")
+    args = parser.parse_args()
+
+    response = None
+    if args.response_file:
+        with open(args.response_file, "r", encoding="utf-8") as f:
+            response = f.read()
+    config = StubConfig(args.latency, args.jitter, args.error_rate, args.error_status, args.retry_after, response, args.seed,
+                        args.rpm_limit)
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(config))
+    print(f"🧪 LLM stub listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 # File: apps/pkm-indexer/main.py
-from fastapi import FastAPI, Request, Response, BackgroundTasks
-from fastapi.responses import RedirectResponse, JSONResponse, FileResponse
+from fastapi import FastAPI, Request, Response, Query
+from fastapi.responses import RedirectResponse, JSONResponse, FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.encoders import jsonable_encoder
+from email.utils import formatdate, parsedate_to_datetime
 import os
 import io
 import json
@@ -9,15 +12,26 @@ import base64
 import asyncio
 import uuid
 import time
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload
-from organize import organize_files
+import threading
+import hashlib
+import itertools
 from index import indexKB, searchKB
+import jobs
+import registry
+import drive
+import metrics
+import runlog
+import filestats
+import versions
+import events
+import metafile
 import logging
 from datetime import datetime, timedelta
-import frontmatter
+
+# The Google client libraries, the extraction pipeline (organize: pdfplumber,
+# pytesseract, PIL, bs4, numpy) and the LLM modules are imported
+# where they are first used, so serving /staging or /search after a cold
+# start doesn't pay for them. bench/bench_imports.py tracks the import time.
 
 app = FastAPI()
 
@@ -40,7 +54,36 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
-SCOPES = ["https://www.googleapis.com/auth/drive"]
+# Compress larger responses - /staging carries every staged record. Uses
+# brotli when brotli-asgi is installed (falling back to gzip per client).
+# Event streams opt out by sending Content-Encoding: identity.
+COMPRESSION_MIN_SIZE = 1000
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Time every request, labelled by route template so paths with IDs share a series"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.observe(
+            "pkm_http_request_duration_seconds",
+            time.perf_counter() - started,
+            method=request.method,
+            route=route.path if route is not None else "unmatched",
+            status=str(status)
+        )
+
+SCOPES = drive.SCOPES
 REDIRECT_URI = os.environ.get("GOOGLE_REDIRECT_URI", "http://localhost:8000/oauth/callback")
 WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "https://pkm-indexer-production.up.railway.app/drive-webhook")
 CHANNEL_ID = str(uuid.uuid4())  # Unique channel ID for Google Drive notifications
@@ -55,19 +98,38 @@ CLIENT_CONFIG = {
     }
 }
 
+# Sync, organize and reprocess work runs on the job workers (see jobs.py).
+# Runs that scan pkm/Inbox hold this lock so they don't race each other; their
+# jobs share the "ingest" lane, so waiting on it never holds a reprocess worker.
+INBOX_LOCK = threading.Lock()
+
 # Store webhook data
 webhook_state = {
     "channel_id": CHANNEL_ID,
     "resource_id": None,
     "expiration": None,
     "inbox_id": None,
-    "last_renewal": None
+    "last_renewal": None,
+    "registration": "pending",  # pending, registering, registered, retrying, failed or disabled
+    "last_error": None
+}
+
+# Readiness, reported separately from liveness by /health/ready
+service_state = {
+    "started_at": time.time(),
+    "ready": False,
+    "ready_at": None
 }
 
+WEBHOOK_RETRY_DELAY = 5  # seconds, doubled per attempt
+WEBHOOK_RETRY_MAX_DELAY = 300
+WEBHOOK_MAX_ATTEMPTS = 8  # After this the 12-hourly renewal check keeps trying
+
 # ─── AUTH FLOW ─────────────────────────────────────────────────────
 
 @app.get("/auth/initiate")
 def auth_initiate():
+    from google_auth_oauthlib.flow import Flow
     flow = Flow.from_client_config(CLIENT_CONFIG, scopes=SCOPES, redirect_uri=REDIRECT_URI)
     auth_url, _ = flow.authorization_url(prompt="consent", access_type="offline")
     return RedirectResponse(auth_url)
@@ -77,6 +139,7 @@ async def auth_callback(request: Request):
     code = request.query_params.get("code")
     if not code:
         return JSONResponse(status_code=400, content={"error": "Missing auth code"})
+    from google_auth_oauthlib.flow import Flow
     flow = Flow.from_client_config(CLIENT_CONFIG, scopes=SCOPES, redirect_uri=REDIRECT_URI)
     flow.fetch_token(code=code)
     creds = flow.credentials
@@ -85,9 +148,11 @@ async def auth_callback(request: Request):
 # ─── UPLOAD HELPERS ───────────────────────────────────────────────
 
 def upload_file_to_drive(service, local_path, filename, parent_id):
+    from googleapiclient.http import MediaFileUpload
     media = MediaFileUpload(local_path, resumable=True)
     body = {"name": filename, "parents": [parent_id]}
-    uploaded = service.files().create(body=body, media_body=media, fields="id").execute()
+    with metrics.stage("sync", "upload"):
+        uploaded = service.files().create(body=body, media_body=media, fields="id").execute()
     return uploaded.get("id")
 
 def find_or_create_folder(service, parent_id, name):
@@ -107,7 +172,7 @@ def find_or_create_folder(service, parent_id, name):
 # ─── WEBHOOK MANAGEMENT ─────────────────────────────────────────────
 
 @app.post("/drive-webhook")
-async def handle_drive_webhook(request: Request, background_tasks: BackgroundTasks):
+async def handle_drive_webhook(request: Request):
     """
     Handle Google Drive webhook notifications when files change
     """
@@ -120,98 +185,73 @@ async def handle_drive_webhook(request: Request, background_tasks: BackgroundTas
     
     # Check resource state - we're interested in 'change' events
     if resource_state in ["sync", "change", "update"]:
-        # Process the notification in the background
-        background_tasks.add_task(process_drive_changes)
+        # Queue a sync job; a burst of notifications collapses into one queued sync
+        jobs.enqueue("sync", {"trigger": "webhook"}, key="sync-drive", coalesce_running=False)
         
     # Always respond with 204 No Content quickly to acknowledge receipt
     return Response(status_code=204)
 
-async def process_drive_changes():
+def process_drive_changes(progress=None):
     """
     Process changes in Google Drive inbox folder
     """
     logger.info("Processing Drive changes...")
-    try:
-        # Make sure logs directory exists
-        log_dir = "pkm/Logs"
-        os.makedirs(log_dir, exist_ok=True)
-        timestamp = int(time.time())
-        
-        # Create an initial processing log
-        with open(f"{log_dir}/webhook_process_{timestamp}.md", "w", encoding="utf-8") as f:
-            f.write(f"# Webhook Processing Started at {datetime.now().isoformat()}\n\n")
-        
-        # Call the sync_drive function to process files
-        result = sync_drive()
-        
-        # Log the result regardless of success/failure
-        with open(f"{log_dir}/webhook_sync_{timestamp}.md", "w", encoding="utf-8") as f:
-            f.write(f"# Webhook Sync at {datetime.now().isoformat()}\n\n")
-            f.write(f"## Result\n\n")
+    with runlog.open_run("webhook") as log_f:
+        try:
+            log_f.write(f"# Webhook Processing Started at {datetime.now().isoformat()}\n\n")
+
+            # Call the sync_drive function to process files
+            result = sync_drive(progress=progress)
+
+            # Log the result regardless of success/failure
+            log_f.write(f"## Result\n\n")
             if isinstance(result, dict):
-                f.write(json.dumps(result, indent=2))
-                
-                # Log detailed debug info if available
-                if 'debug' in result:
-                    f.write("\n\n## Debug Info\n\n")
-                    f.write(json.dumps(result['debug'], indent=2))
-                    
+                log_f.log(result.get("status", "Webhook sync finished"), level="error" if result.get("error") else "info",
+                          sync_log=(result.get("debug") or {}).get("log_file") or result.get("log_file"),
+                          uploaded=result.get("uploaded", []))
+
                 # Log success or failure count
                 if result.get("uploaded"):
                     logger.info(f"Webhook sync completed: {len(result.get('uploaded', []))} files processed")
-                    f.write(f"\n\n## Processed Files\n\n")
+                    log_f.write(f"\n## Processed Files\n\n")
                     for filename in result.get("uploaded", []):
-                        f.write(f"- {filename}\n")
+                        log_f.log(f"- {filename}", level="info", file=filename)
                 elif result.get("status"):
                     logger.info(f"Webhook sync completed with status: {result.get('status')}")
             else:
-                f.write(str(result))
-                
-        # If we have downloaded files but no uploads, something likely went wrong
-        if isinstance(result, dict) and result.get("downloaded") and not result.get("uploaded"):
-            skipped = result.get("skipped", [])
-            if skipped:
-                logger.error(f"Files were downloaded but not processed: {skipped}")
-                with open(f"{log_dir}/webhook_warning_{timestamp}.md", "w", encoding="utf-8") as f:
-                    f.write(f"# Webhook Warning at {datetime.now().isoformat()}\n\n")
-                    f.write(f"## Files Downloaded But Not Processed\n\n")
+                log_f.write(f"{result}\n")
+
+            # If we have downloaded files but no uploads, something likely went wrong
+            if isinstance(result, dict) and result.get("downloaded") and not result.get("uploaded"):
+                skipped = result.get("skipped", [])
+                if skipped:
+                    logger.error(f"Files were downloaded but not processed: {skipped}")
+                    log_f.write(f"\n## Warning: Files Downloaded But Not Processed\n\n")
                     for filename in skipped:
-                        f.write(f"- {filename}\n")
+                        log_f.log(f"⚠️ {filename}", level="warning", file=filename)
                     if 'error' in result:
-                        f.write(f"\n## Error\n\n{result['error']}\n")
+                        log_f.log(f"Error: {result['error']}", level="error")
                     if 'debug' in result and result['debug'].get('error'):
-                        f.write(f"\n## Debug Error\n\n{result['debug']['error']}\n")
-    except Exception as e:
-        logger.error(f"Error processing Drive changes: {str(e)}")
-        
-        # Create a detailed error log
-        try:
-            log_dir = "pkm/Logs"
-            os.makedirs(log_dir, exist_ok=True)
-            timestamp = int(time.time())
-            with open(f"{log_dir}/webhook_error_{timestamp}.md", "w", encoding="utf-8") as f:
-                f.write(f"# Webhook Error at {datetime.now().isoformat()}\n\n")
-                f.write(f"## Error\n\n")
-                f.write(str(e))
-                f.write("\n\n## Traceback\n\n```\n")
-                import traceback
-                f.write(traceback.format_exc())
-                f.write("\n```\n")
-        except Exception as log_error:
-            logger.error(f"Failed to create error log: {log_error}")
+                        log_f.log(f"Debug error: {result['debug']['error']}", level="error")
+
+            return result
+        except Exception as e:
+            logger.error(f"Error processing Drive changes: {str(e)}")
+            import traceback
+            log_f.log(f"Webhook error: {str(e)}", level="error", traceback=traceback.format_exc())
+            raise
 
 def setup_webhook_registration():
     """
     Set up or renew Google Drive webhook for the PKM/Inbox folder
     """
     try:
-        token_json = os.environ.get("GOOGLE_TOKEN_JSON")
-        if not token_json:
+        if not drive.is_configured():
             logger.error("Google Drive credentials missing - can't set up webhook")
+            webhook_state["registration"] = "disabled"
             return False
             
-        creds = Credentials.from_authorized_user_info(json.loads(token_json), SCOPES)
-        drive_service = build('drive', 'v3', credentials=creds)
+        drive_service = drive.get_service()
         
         # First, find or create the PKM/Inbox folder
         pkm_id = find_pkm_folder(drive_service)
@@ -263,11 +303,15 @@ def setup_webhook_registration():
         webhook_state["expiration"] = response.get("expiration")
         webhook_state["last_renewal"] = datetime.now().isoformat()
         
+        webhook_state["registration"] = "registered"
+        webhook_state["last_error"] = None
+        
         logger.info(f"Webhook set up successfully. Channel ID: {webhook_state['channel_id']}, Expires: {webhook_expiration}")
         
         return True
     except Exception as e:
         logger.error(f"Webhook setup error: {str(e)}")
+        webhook_state["last_error"] = str(e)
         return False
 
 def check_webhook_expiration():
@@ -293,11 +337,17 @@ def check_webhook_expiration():
         return False
 
 @app.get("/webhook/status")
-def webhook_status():
+def webhook_status(request: Request):
     """
     Get the status of the Google Drive webhook - for monitoring only
     """
     try:
+        # The state is a handful of fields, so its ETag is a digest rather than a counter
+        tag = versions.digest_etag(sorted(webhook_state.items()), webhook_state["expiration"] and
+                                   datetime.now().timestamp() * 1000 > int(webhook_state["expiration"]))
+        if not_modified(request, tag):
+            return Response(status_code=304, headers={"ETag": tag})
+
         now = datetime.now()
         is_expired = False
         
@@ -309,6 +359,8 @@ def webhook_status():
         
         status_info = {
             "is_active": is_active,
+            "registration": webhook_state["registration"],
+            "last_error": webhook_state["last_error"],
             "channel_id": webhook_state["channel_id"],
             "inbox_id": webhook_state["inbox_id"],
             "expiration": None,
@@ -320,7 +372,7 @@ def webhook_status():
             status_info["expiration"] = expiration_time.isoformat()
             status_info["time_remaining"] = str(expiration_time - now) if expiration_time > now else "Expired"
         
-        return status_info
+        return JSONResponse(content=status_info, headers={"ETag": tag, "Cache-Control": "no-cache"})
     except Exception as e:
         logger.error(f"Webhook status error: {str(e)}")
         return JSONResponse(
@@ -365,15 +417,20 @@ def find_inbox_folder(service, pkm_id):
 # ─── SYNC DRIVE ───────────────────────────────────────────────────
 
 @app.post("/sync-drive")
-def sync_drive():
+def sync_drive_endpoint():
+    """Queue a Google Drive sync and return its job ID"""
+    job = jobs.enqueue("sync", {"trigger": "manual"}, key="sync-drive", coalesce_running=False)
+    return job_accepted(job, "Drive sync queued")
+
+def sync_drive(progress=None, log_run_id=None):
+    # Sync errors are appended to the same run, so one run ID covers the whole sync
+    log_run_id = log_run_id or runlog.new_run_id("sync")
+    # Progress also goes out as sync-progress events, including organize's per-file updates
+    progress = events.progress_publisher("sync-progress", progress, run_id=log_run_id)
+    progress({"stage": "started"})
     try:
-        # Create a log directory if it doesn't exist
-        logs_path = "pkm/Logs"
-        os.makedirs(logs_path, exist_ok=True)
-        timestamp = int(time.time())
-        
         # Start a log entry for this sync operation
-        with open(f"{logs_path}/sync_{timestamp}.md", "w", encoding="utf-8") as log_f:
+        with runlog.open_run("sync", run_id=log_run_id) as log_f:
             log_f.write(f"# Google Drive Sync at {datetime.now().isoformat()}\n\n")
             
             LOCAL_INBOX = "pkm/Inbox"
@@ -381,11 +438,13 @@ def sync_drive():
             LOCAL_SOURCES = "pkm/Processed/Sources"
             downloaded = []
             uploaded = []
+            duplicates = []
             debug_info = {
                 "token_exists": False,
                 "drive_folders": [],
                 "inbox_files_count": 0,
-                "error": None
+                "error": None,
+                "log_file": log_f.run_id
             }
 
             # Ensure local directories exist
@@ -393,8 +452,7 @@ def sync_drive():
             os.makedirs(LOCAL_METADATA, exist_ok=True)
             os.makedirs(LOCAL_SOURCES, exist_ok=True)
             
-            token_json = os.environ.get("GOOGLE_TOKEN_JSON")
-            if not token_json:
+            if not drive.is_configured():
                 log_f.write("❌ Failed - Google Drive credentials missing\n")
                 return {"status": "Failed - Google Drive credentials missing", "debug": debug_info}
                 
@@ -402,8 +460,8 @@ def sync_drive():
             log_f.write("✅ Google Drive credentials found\n")
             
             try:
-                creds = Credentials.from_authorized_user_info(json.loads(token_json), SCOPES)
-                service = build('drive', 'v3', credentials=creds)
+                from googleapiclient.http import MediaIoBaseDownload
+                service = drive.get_service()
                 log_f.write("✅ Authenticated with Google Drive\n")
             except Exception as auth_error:
                 log_f.write(f"❌ Authentication error: {str(auth_error)}\n")
@@ -443,7 +501,8 @@ def sync_drive():
             # 2. Download files from /Inbox
             try:
                 query_files = f"'{inbox_id}' in parents and trashed = false"
-                files_result = service.files().list(q=query_files, fields="files(id, name)").execute()
+                with metrics.stage("sync", "list"):
+                    files_result = service.files().list(q=query_files, fields="files(id, name, md5Checksum)").execute()
                 files = files_result.get('files', [])
                 
                 debug_info["inbox_files_count"] = len(files)
@@ -463,23 +522,43 @@ def sync_drive():
                 
                 log_f.write("\n## Downloading files\n\n")
                 
-                for f in files:
+                for index, f in enumerate(files):
+                    if progress:
+                        progress({"stage": "download", "done": index, "total": len(files), "file": f['name']})
                     file_id = f['id']
                     file_name = f['name']
+                    log_f.set_file(file_name)
                     local_path = os.path.join(LOCAL_INBOX, file_name)
+                    
+                    # Bytes we already processed and stored in Drive don't need downloading
+                    known = registry.find_by_md5(f['md5Checksum']) if f.get('md5Checksum') else None
+                    if known and known["drive_source_id"] and os.path.exists(os.path.join(LOCAL_METADATA, known["md_filename"])):
+                        log_f.write(f"♻️ {file_name} duplicates {known['source_name']} ({known['md_filename']}), removing from inbox... ")
+                        try:
+                            with metrics.stage("sync", "delete"):
+                                service.files().delete(fileId=file_id).execute()
+                            registry.add_alias(known["sha256"], file_name)
+                            duplicates.append(file_name)
+                            log_f.write(f"✅ Success\n")
+                        except Exception as duplicate_error:
+                            log_f.write(f"❌ Failed: {str(duplicate_error)}\n")
+                        continue
+                    
                     log_f.write(f"Downloading {file_name}... ")
                     try:
                         request = service.files().get_media(fileId=file_id)
-                        with io.FileIO(local_path, 'wb') as fh:
+                        with metrics.stage("sync", "download"), io.FileIO(local_path, 'wb') as fh:
                             downloader = MediaIoBaseDownload(fh, request)
                             done = False
                             while not done:
                                 _, done = downloader.next_chunk()
-                        downloaded.append((file_id, file_name))
+                        filestats.touch(local_path)
+                        downloaded.append((file_id, file_name, f.get('md5Checksum')))
                         log_f.write(f"✅ Success\n")
                     except Exception as individual_download_error:
                         log_f.write(f"❌ Failed: {str(individual_download_error)}\n")
                 
+                log_f.set_file(None)
                 log_f.write(f"\n✅ Downloaded {len(downloaded)} files from Google Drive Inbox\n")
             except Exception as download_error:
                 log_f.write(f"❌ Download error: {str(download_error)}\n")
@@ -489,7 +568,8 @@ def sync_drive():
             # 3. Run metadata extraction
             try:
                 log_f.write("\n## Processing files with organize_files()\n\n")
-                organize_result = organize_files()
+                from organize import organize_files
+                organize_result = organize_files(progress=progress)
                 log_f.write(f"✅ organize_files() processed {organize_result['success_count']} files successfully\n")
                 if organize_result['failed_files']:
                     log_f.write(f"⚠️ {len(organize_result['failed_files'])} files failed processing:\n")
@@ -506,15 +586,35 @@ def sync_drive():
 
             # 4. Upload files and metadata
             log_f.write("\n## Uploading processed files to Google Drive\n\n")
-            for file_id, file_name in downloaded:
-                base = os.path.splitext(file_name)[0]
-                md_filename = next((f for f in os.listdir(LOCAL_METADATA) if base in f), None)
+            duplicate_records = dict(organize_result.get("duplicates", []))
+            for index, (file_id, file_name, md5) in enumerate(downloaded):
+                if progress:
+                    progress({"stage": "upload", "done": index, "total": len(downloaded), "file": file_name})
+                log_f.set_file(file_name)
+                content = registry.find_by_md5(md5) if md5 else None
+                source_record = registry.record_for_source(file_name)
+                md_filename = source_record["md_filename"] if source_record else None
+                if file_name in duplicate_records and content:
+                    # Organize linked this copy to an existing record - point at its source
+                    file_type = content["file_type"]
+                    local_original_path = os.path.join(LOCAL_SOURCES, file_type, content["source_name"])
+                else:
+                    file_type = infer_file_type(file_name)
+                    local_original_path = os.path.join(LOCAL_SOURCES, file_type, file_name)
                 local_md_path = os.path.join(LOCAL_METADATA, md_filename) if md_filename else None
-                file_type = infer_file_type(file_name)
-                local_original_path = os.path.join(LOCAL_SOURCES, file_type, file_name)
 
                 log_f.write(f"Processing {file_name}:\n")
                 try:
+                    if content and content["drive_source_id"]:
+                        # Duplicate whose source and metadata are already in Drive
+                        log_f.write(f"  - ♻️ Duplicate of {content['source_name']}, already stored in Drive\n")
+                        log_f.write(f"  - Deleting original from inbox... ")
+                        with metrics.stage("sync", "delete"):
+                            service.files().delete(fileId=file_id).execute()
+                        duplicates.append(file_name)
+                        log_f.write(f"✅ Success\n")
+                        continue
+                    
                     # Upload metadata
                     if local_md_path and os.path.exists(local_md_path):
                         log_f.write(f"  - Uploading metadata {md_filename}... ")
@@ -530,9 +630,11 @@ def sync_drive():
                     if os.path.exists(local_original_path):
                         ft_folder_id = find_or_create_folder(service, sources_id, file_type)
                         log_f.write(f"  - Uploading source file to {file_type} folder... ")
-                        orig_id = upload_file_to_drive(service, local_original_path, file_name, ft_folder_id)
+                        orig_id = upload_file_to_drive(service, local_original_path, os.path.basename(local_original_path), ft_folder_id)
                         debug_info["drive_folders"].append(f"Uploaded source file: {file_name} to {ft_folder_id}")
                         log_f.write(f"✅ Success (ID: {orig_id})\n")
+                        if content:
+                            registry.set_drive_source(content["sha256"], orig_id)
                     else:
                         log_f.write(f"  - ❌ Missing source file at {local_original_path}\n")
                         debug_info["error"] = f"Missing source file for {file_name} at {local_original_path}"
@@ -540,7 +642,8 @@ def sync_drive():
 
                     # Delete from Inbox (only if both uploads succeeded)
                     log_f.write(f"  - Deleting original from inbox... ")
-                    delete_result = service.files().delete(fileId=file_id).execute()
+                    with metrics.stage("sync", "delete"):
+                        service.files().delete(fileId=file_id).execute()
                     debug_info["drive_folders"].append(f"Deleted inbox file: {file_id}")
                     uploaded.append(file_name)
                     log_f.write(f"✅ Success\n")
@@ -550,10 +653,15 @@ def sync_drive():
                     debug_info["error"] = f"Upload error for {file_name}: {str(e)}"
                     print(f"❌ Failed to upload/delete {file_name}: {e}")
 
+            log_f.set_file(None)
             log_f.write(f"\n## Summary\n")
             log_f.write(f"- Downloaded: {len(downloaded)} files\n")
             log_f.write(f"- Successfully processed: {len(uploaded)} files\n")
-            skipped = [f[1] for f in downloaded if f[1] not in uploaded]
+            log_f.write(f"- Duplicates linked to existing records: {len(duplicates)} files\n")
+            skipped = [f[1] for f in downloaded if f[1] not in uploaded and f[1] not in duplicates]
+            metrics.inc("pkm_files_total", len(uploaded), pipeline="sync", outcome="uploaded")
+            metrics.inc("pkm_files_total", len(duplicates), pipeline="sync", outcome="duplicate")
+            metrics.inc("pkm_files_total", len(skipped), pipeline="sync", outcome="skipped")
             if skipped:
                 log_f.write(f"- Skipped: {len(skipped)} files\n")
                 for file in skipped:
@@ -563,6 +671,7 @@ def sync_drive():
                 "status": f"✅ Synced and organized - {len(uploaded)} files successfully processed",
                 "downloaded": [f[1] for f in downloaded],
                 "uploaded": uploaded,
+                "duplicates": duplicates,
                 "skipped": skipped,
                 "debug": debug_info
             }
@@ -570,21 +679,15 @@ def sync_drive():
         logger.error(f"Sync error: {str(e)}")
         # Try to create an error log
         try:
-            logs_path = "pkm/Logs"
-            os.makedirs(logs_path, exist_ok=True)
-            timestamp = int(time.time())
-            with open(f"{logs_path}/sync_error_{timestamp}.md", "w", encoding="utf-8") as log_f:
-                log_f.write(f"# Sync Error at {datetime.now().isoformat()}\n\n")
-                log_f.write(f"Error: {str(e)}\n\n")
-                log_f.write("Traceback:\n```\n")
-                import traceback
-                log_f.write(traceback.format_exc())
-                log_f.write("\n```\n")
+            import traceback
+            with runlog.open_run("sync", run_id=log_run_id) as log_f:
+                log_f.log(f"Sync error: {str(e)}", level="error", traceback=traceback.format_exc())
         except:
             pass
         return {
             "status": f"❌ Sync failed: {str(e)}",
-            "error": str(e)
+            "error": str(e),
+            "log_file": log_run_id
         }
 
 
@@ -601,62 +704,240 @@ def infer_file_type(filename):
 
 # ─── FILE STATS ENDPOINT ────────────────────────────────────────────
 
+# ─── CONDITIONAL REQUESTS ────────────────────────────────────────
+
+def not_modified(request, tag, changed_at=None):
+    """True when the client's If-None-Match (or, lacking it, If-Modified-Since) is still current.
+
+    The ETag is the source of truth. HTTP dates only have whole seconds, so
+    If-Modified-Since only counts when the last change came strictly before it.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        return if_none_match.strip() == "*" or tag in [value.strip() for value in if_none_match.split(",")]
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and changed_at is not None:
+        try:
+            return changed_at < parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def last_modified(changed_at):
+    """Last-Modified header value for a change at changed_at.
+
+    Once that second is over, no later change can share it, so the end of the
+    second is sent and a client echoing it gets 304s. Until then the start is
+    sent, which never matches, so a second write in the same second is not hidden.
+    """
+    second = int(changed_at)
+    return formatdate(second + 1 if time.time() >= second + 1 else second, usegmt=True)
+
+def conditional_json(request, scopes, build):
+    """Serve build()'s result with an ETag from the version scopes, or 304 if unchanged.
+
+    The version is read before build() runs, so a change made while building
+    bumps it past the ETag sent and the next poll fetches the new state.
+    """
+    tag, changed_at = versions.etag(*scopes)
+    headers = {"ETag": tag, "Last-Modified": last_modified(changed_at), "Cache-Control": "no-cache"}
+    if not_modified(request, tag, changed_at):
+        return Response(status_code=304, headers=headers)
+    content = build()
+    if isinstance(content, Response):
+        return content
+    # Metadata YAML can hold dates, which JSONResponse can't serialize on its own
+    return JSONResponse(content=jsonable_encoder(content), headers=headers)
+
 @app.get("/file-stats")
-def get_file_stats():
-    """Get statistics about files in the system"""
-    stats = {
-        "inbox_count": 0,
-        "metadata_count": 0,
-        "source_types": {},
-    }
-    
-    # Count files in Inbox
-    inbox_path = "pkm/Inbox"
-    if os.path.exists(inbox_path):
-        stats["inbox_count"] = len([f for f in os.listdir(inbox_path) if os.path.isfile(os.path.join(inbox_path, f))])
-    
-    # Count metadata files
-    metadata_path = "pkm/Processed/Metadata"
-    if os.path.exists(metadata_path):
-        stats["metadata_count"] = len([f for f in os.listdir(metadata_path) if f.endswith(".md")])
-    
-    # Count source files by type
-    sources_path = "pkm/Processed/Sources"
-    if os.path.exists(sources_path):
-        for source_type in os.listdir(sources_path):
-            type_path = os.path.join(sources_path, source_type)
-            if os.path.isdir(type_path):
-                file_count = len([f for f in os.listdir(type_path) if os.path.isfile(os.path.join(type_path, f))])
-                if file_count > 0:
-                    stats["source_types"][source_type] = file_count
-    
-    return stats
+def get_file_stats(request: Request):
+    """Get statistics about files in the system from the incrementally kept counters"""
+    return conditional_json(request, ("files",), filestats.snapshot)
 
 # ─── LOGS ENDPOINT ────────────────────────────────────────────────
 
 @app.get("/logs")
-def list_logs():
-    """List all available log files"""
-    logs_path = "pkm/Logs"
-    if not os.path.exists(logs_path):
-        return {"logs": []}
-        
-    log_files = [f for f in os.listdir(logs_path) if f.endswith(".md")]
-    log_files.sort(reverse=True)  # Most recent first
-    
+def list_logs(request: Request, kind: str = None, file: str = None, level: str = None, limit: int = 50, before: float = None):
+    """List log runs, newest first.
+
+    Filter by run kind (sync, webhook, organize, reprocess, approval), or by
+    runs with lines for a file or at or above a level. Page with before=next_before.
+    """
+    if level and level not in runlog.LEVELS:
+        return JSONResponse(status_code=400, content={"error": f"level must be one of {', '.join(runlog.LEVELS)}"})
+    limit = max(1, min(limit, 500))
+
+    def build():
+        runs = runlog.list_runs(kind=kind, file=file, level=level, limit=limit, before=before)
+        return {
+            "logs": [run["run_id"] for run in runs],
+            "runs": runs,
+            "count": len(runs),
+            "next_before": runs[-1]["started_at"] if len(runs) == limit else None
+        }
+    return conditional_json(request, ("logs",), build)
+
+@app.get("/logs/entries")
+def list_log_entries(run_id: str = None, file: str = None, level: str = None, after: int = 0, limit: int = 200):
+    """Return log lines across runs, oldest first; level means at least that severe.
+
+    Page with after=next_after.
+    """
+    if level and level not in runlog.LEVELS:
+        return JSONResponse(status_code=400, content={"error": f"level must be one of {', '.join(runlog.LEVELS)}"})
+    limit = max(1, min(limit, 1000))
+    entries = runlog.read_entries(run_id=run_id, file=file, level=level, after=after, limit=limit)
+    return {
+        "entries": entries,
+        "count": len(entries),
+        "next_after": entries[-1]["id"] if len(entries) == limit else None
+    }
+
+LOG_MAX_RANGE_LINES = 5000
+LOG_MAX_RANGE_BYTES = 4 * 1024 * 1024
+LOG_FOLLOW_POLL_SECONDS = 1.0
+LOG_FOLLOW_HEARTBEAT_SECONDS = 15
+
+def parse_range(value):
+    """Parse "start-end", "start-" or "-count" into (start, end, suffix_count)"""
+    first, sep, last = value.partition("-")
+    if not sep or (first and not first.isdigit()) or (last and not last.isdigit()) or not (first or last):
+        raise ValueError(f"Invalid range: {value}")
+    if not first:
+        return None, None, int(last)
+    start, end = int(first), int(last) if last else None
+    if end is not None and end < start:
+        raise ValueError(f"Invalid range: {value}")
+    return start, end, None
+
+def log_page(log_file, run, entries, first_line, total_lines):
+    """Response for a slice of a run's lines; first_line is None for an after= page"""
     return {
-        "logs": log_files,
-        "count": len(log_files)
+        "filename": log_file,
+        "run": run,
+        "content": "".join(f"{entry['msg']}\n" for entry in entries),
+        "first_line": first_line,
+        "last_line": first_line + len(entries) - 1 if first_line is not None else None,
+        "total_lines": total_lines,
+        "next_after": entries[-1]["id"] if entries else None
     }
 
+async def follow_run(run_id, after, request):
+    """Server-sent events: every new line of a run, then an end event once it finishes.
+
+    Each event's id is the line's entry ID, so a reconnecting EventSource
+    resumes from Last-Event-ID.
+    """
+    idle = 0.0
+    while not await request.is_disconnected():
+        entries = await asyncio.to_thread(runlog.read_entries, run_id=run_id, after=after, limit=500)
+        for entry in entries:
+            yield f"id: {entry['id']}\nevent: line\ndata: {json.dumps(entry, ensure_ascii=False)}\n\n"
+            after = entry["id"]
+        if entries:
+            idle = 0.0
+            continue
+        run = await asyncio.to_thread(runlog.get_run, run_id)
+        if not run or run["status"] != "running":
+            yield f"event: end\ndata: {json.dumps(run)}\n\n"
+            return
+        await asyncio.sleep(LOG_FOLLOW_POLL_SECONDS)
+        idle += LOG_FOLLOW_POLL_SECONDS
+        if idle >= LOG_FOLLOW_HEARTBEAT_SECONDS:
+            yield ": keep-alive\n\n"
+            idle = 0.0
+
 @app.get("/logs/{log_file}")
-def get_log(log_file: str):
-    """Get the content of a specific log file"""
-    log_path = f"pkm/Logs/{log_file}"
-    
-    if not os.path.exists(log_path):
+def get_log(
+    log_file: str,
+    request: Request,
+    lines: str = None,
+    byte_range: str = Query(None, alias="bytes"),
+    tail: int = None,
+    follow: bool = False,
+    after: int = None
+):
+    """Get a run's log, or a legacy .md log file, whole or in part.
+
+    lines=10-200 (1-based, inclusive) or tail=N return part of a log;
+    bytes=0-65535 reads a byte range of a markdown file. follow=true streams
+    a run's new lines as server-sent events, starting after the tail if given.
+    """
+    try:
+        line_range = parse_range(lines) if lines else None
+        byte_span = parse_range(byte_range) if byte_range else None
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    if tail is not None and not 0 < tail <= LOG_MAX_RANGE_LINES:
+        return JSONResponse(status_code=400, content={"error": f"tail must be between 1 and {LOG_MAX_RANGE_LINES}"})
+
+    run = runlog.get_run(log_file)
+    if run:
+        if byte_span:
+            return JSONResponse(status_code=400, content={"error": "Byte ranges apply to markdown log files; use lines or tail for runs"})
+        if follow:
+            if after is None:
+                after = int(request.headers.get("last-event-id") or 0)
+                if tail:
+                    entries = runlog.tail_run(log_file, tail)
+                    after = entries[0]["id"] - 1 if entries else 0
+            return StreamingResponse(
+                follow_run(log_file, after, request),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Content-Encoding": "identity"}
+            )
+        total = runlog.count_entries(log_file)
+        if after is not None:
+            entries = runlog.read_entries(run_id=log_file, after=after, limit=LOG_MAX_RANGE_LINES)
+            return log_page(log_file, run, entries, None, total)
+        if tail:
+            entries = runlog.tail_run(log_file, tail)
+            return log_page(log_file, run, entries, total - len(entries) + 1, total)
+        if line_range:
+            start, end, suffix = line_range
+            if suffix is not None:
+                entries = runlog.tail_run(log_file, min(suffix, LOG_MAX_RANGE_LINES))
+                return log_page(log_file, run, entries, total - len(entries) + 1, total)
+            start = max(start, 1)
+            count = min((end or start + LOG_MAX_RANGE_LINES - 1) - start + 1, LOG_MAX_RANGE_LINES)
+            entries = runlog.read_run_lines(log_file, start - 1, count)
+            return log_page(log_file, run, entries, start, total)
+        return {"filename": log_file, "content": runlog.render_markdown(log_file), "run": run}
+
+    # Markdown logs written before the JSON-lines sink, or by PKM_MARKDOWN_LOGS
+    log_path = os.path.join(runlog.LOG_DIR, os.path.basename(log_file))
+    if not log_file.endswith(".md") or not os.path.exists(log_path):
         return JSONResponse(status_code=404, content={"error": "Log file not found"})
-        
+    if follow:
+        return JSONResponse(status_code=400, content={"error": "follow is only available for runs"})
+
+    if byte_span:
+        start, end, suffix = byte_span
+        size = os.path.getsize(log_path)
+        if suffix is not None:
+            start, end = max(0, size - suffix), None
+        if end is None or end - start + 1 > LOG_MAX_RANGE_BYTES:
+            end = start + LOG_MAX_RANGE_BYTES - 1
+        data, size = runlog.read_file_range(log_path, start, end)
+        return {
+            "filename": log_file,
+            "content": data.decode("utf-8", errors="replace"),
+            "start": start,
+            "end": start + len(data) - 1,
+            "size": size
+        }
+    if tail:
+        return {"filename": log_file, "content": "".join(f"{line}\n" for line in runlog.tail_file(log_path, tail))}
+    if line_range:
+        start, end, suffix = line_range
+        if suffix is not None:
+            return {"filename": log_file, "content": "".join(f"{line}\n" for line in runlog.tail_file(log_path, min(suffix, LOG_MAX_RANGE_LINES)))}
+        start = max(start, 1)
+        end = min(end or start + LOG_MAX_RANGE_LINES - 1, start + LOG_MAX_RANGE_LINES - 1)
+        with open(log_path, "r", encoding="utf-8") as f:
+            selected = list(itertools.islice(f, start - 1, end))
+        return {"filename": log_file, "content": "".join(selected), "first_line": start, "last_line": start + len(selected) - 1}
+
     with open(log_path, "r", encoding="utf-8") as f:
         content = f.read()
         
@@ -664,92 +945,104 @@ def get_log(log_file: str):
 
 # ─── STAGING AND APPROVAL ENDPOINTS ─────────────────────────────────
 
+STAGING_PAGE_SIZE = 100
+STAGING_MAX_PAGE_SIZE = 500
+STAGING_FIELDS = ("metadata", "content", "preview")
+STAGING_PREVIEW_CHARS = 1000
+
 @app.get("/staging")
-def get_staging():
-    """List files in staging that need review"""
-    metadata_path = "pkm/Processed/Metadata"
-    if not os.path.exists(metadata_path):
-        return {"files": []}
-        
+def get_staging(request: Request, cursor: str = None, limit: int = STAGING_PAGE_SIZE, fields: str = "metadata", since: str = None):
+    """List files in staging that need review, a page at a time.
+
+    fields picks what each record carries besides its name: metadata,
+    content (the full body), preview (its first 1000 characters) or
+    metadata.<key>. Pass next_cursor back as cursor for the next page.
+    since=<version> returns only records created or changed since that
+    version, plus the names that left staging in "removed"; when paging a
+    delta, keep the version from its first page for the next one.
+    """
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    invalid = [field for field in requested if field not in STAGING_FIELDS and not field.startswith("metadata.")]
+    if invalid:
+        return JSONResponse(status_code=400, content={"error": f"Unknown fields: {', '.join(invalid)}"})
+    limit = max(1, min(limit, STAGING_MAX_PAGE_SIZE))
+    return conditional_json(request, ("files",), lambda: list_staging(cursor, limit, requested, since))
+
+def list_staging(cursor, limit, fields, since):
+    # Taken before listing, so anything changed meanwhile is sent again in the next delta
+    version = filestats.staging_version()
+    names, removed, reset, more = filestats.staged(after=cursor, since=since, limit=limit)
+
+    # Bodies are only read as far as the requested fields need
+    if "content" in fields:
+        body_chars = None
+    elif "preview" in fields:
+        body_chars = STAGING_PREVIEW_CHARS
+    else:
+        body_chars = 0
+
     staging_files = []
-    
-    for filename in os.listdir(metadata_path):
-        if not filename.endswith(".md"):
-            continue
-            
-        file_path = os.path.join(metadata_path, filename)
-        try:
-            # Use frontmatter to properly parse the YAML frontmatter
-            with open(file_path, "r", encoding="utf-8") as f:
-                content = f.read()
-            
-            # Check if this is a frontmatter file
-            if not content.startswith("---"):
-                continue
-                
-            # Use the frontmatter library for more reliable parsing
-            post = frontmatter.loads(content)
-            
-            # Extract metadata and content
-            metadata = dict(post.metadata)
-            file_content = post.content
-            
-            # Only include files that haven't been reviewed yet
-            # Check for various forms of the "reviewed" field
-            is_reviewed = False
-            if "reviewed" in metadata:
-                # Handle different formats of the reviewed field
-                if isinstance(metadata["reviewed"], bool):
-                    is_reviewed = metadata["reviewed"]
-                elif isinstance(metadata["reviewed"], str):
-                    is_reviewed = metadata["reviewed"].lower() == "true"
-                    
-            # Include the file if it hasn't been reviewed
-            if not is_reviewed:
-                # Process tags to ensure they're always a list
-                if "tags" in metadata:
-                    # Handle YAML formatted tags (with newlines and dashes)
-                    if isinstance(metadata["tags"], str):
-                        if metadata["tags"].startswith("\n-"):
-                            tags = [tag.strip() for tag in metadata["tags"].split("\n-") if tag.strip()]
-                            metadata["tags"] = tags
-                        # Handle array-like string format
-                        elif metadata["tags"].startswith("[") and metadata["tags"].endswith("]"):
-                            tags_str = metadata["tags"][1:-1].strip()
-                            metadata["tags"] = [tag.strip().strip("'\"") for tag in tags_str.split(",") if tag.strip()]
-                        # Handle comma-separated string format  
-                        elif "," in metadata["tags"]:
-                            metadata["tags"] = [tag.strip() for tag in metadata["tags"].split(",") if tag.strip()]
-                        # Handle single tag as string
-                        else:
-                            metadata["tags"] = [metadata["tags"]]
-                
-                # Ensure we have the extract content
-                if "extract_content" not in metadata and "extract" in metadata:
-                    metadata["extract_content"] = metadata["extract"]
-                
-                # Add debugging log
-                print(f"Adding file to staging: {filename}, reviewed = {is_reviewed}")
-                
-                # Add to staging files list
-                staging_files.append({
-                    "name": filename,
-                    "metadata": metadata,
-                    "content": file_content
-                })
-                
-                # Log for debugging
-                print(f"Added staging file: {filename}")
-                if "tags" in metadata:
-                    print(f"  Tags: {metadata['tags']}")
-                if "extract_content" in metadata:
-                    print(f"  Extract length: {len(metadata['extract_content'])} chars")
-                
-        except Exception as e:
-            print(f"Error processing {filename}: {e}")
+    for filename in names:
+        record = read_staging_record(filename, body_chars)
+        if record:
+            staging_files.append(project_staging_record(record, fields))
     
     print(f"Returning {len(staging_files)} files for staging")
-    return {"files": staging_files}
+    response = {
+        "files": staging_files,
+        "next_cursor": names[-1] if more else None,
+        "version": version
+    }
+    if since is not None:
+        response["removed"] = removed
+        response["reset"] = reset
+    return response
+
+def project_staging_record(record, fields):
+    """Keep only the requested fields of a staging record; the name is always included"""
+    projected = {"name": record["name"]}
+    for field in fields:
+        if field == "content":
+            projected["content"] = record["content"]
+        elif field == "preview":
+            projected["preview"] = record["content"][:STAGING_PREVIEW_CHARS]
+        elif field == "metadata":
+            projected["metadata"] = record["metadata"]
+        else:
+            key = field.split(".", 1)[1]
+            if key in record["metadata"]:
+                projected.setdefault("metadata", {})[key] = record["metadata"][key]
+    return projected
+
+def read_staging_record(filename, body_chars=None):
+    """Parse one metadata file into a staging record, or None if it is reviewed or unreadable.
+
+    Only the frontmatter is parsed; the body is read up to body_chars
+    characters (all of it for None, none for 0).
+    """
+    file_path = os.path.join("pkm/Processed/Metadata", filename)
+    try:
+        metadata, body_offset = metafile.read_header(file_path)
+        
+        # Not a frontmatter file
+        if not metadata:
+            return None
+        
+        # Only include files that haven't been reviewed yet
+        if metadata.get("reviewed") is True:
+            return None
+        
+        # Ensure we have the extract content
+        if "extract_content" not in metadata and "extract" in metadata:
+            metadata["extract_content"] = metadata["extract"]
+        
+        file_content = "" if body_chars == 0 else metafile.read_body(file_path, body_offset, body_chars)
+        return {"name": filename, "metadata": metadata, "content": file_content}
+    except Exception as e:
+        print(f"Error processing {filename}: {e}")
+        return None
+
+BULK_APPROVE_MAX = 500
 
 @app.post("/approve")
 async def approve_file(payload: dict):
@@ -757,251 +1050,309 @@ async def approve_file(payload: dict):
     file_data = payload.get("file")
     if not file_data:
         return JSONResponse(status_code=400, content={"error": "Missing file data"})
-        
+    
+    # File I/O, the job enqueue and the log writes all block, so keep them off the event loop
+    status_code, content = await asyncio.to_thread(approve_single, file_data)
+    if status_code == 200:
+        return content
+    return JSONResponse(status_code=status_code, content=content)
+
+def approve_single(file_data):
+    # Create a log for this operation
+    with runlog.open_run("approval") as log_f:
+        log_f.set_file(file_data.get("name"))
+        log_f.write(f"# File Approval at {datetime.now().isoformat()}\n\n")
+        return approve_record(file_data, log_f)
+
+@app.post("/approve/bulk")
+async def approve_bulk(payload: dict):
+    """Approve or request reprocessing for many staged files in one request.
+
+    Takes {"files": [...]}, each entry shaped like /approve's "file". Every
+    record is written atomically on its own, so one failure leaves the others
+    in place; reprocess requests are queued as jobs. The batch shares one log run.
+    """
+    files = payload.get("files")
+    if not isinstance(files, list) or not files:
+        return JSONResponse(status_code=400, content={"error": "Missing files list"})
+    if len(files) > BULK_APPROVE_MAX:
+        return JSONResponse(status_code=400, content={"error": f"At most {BULK_APPROVE_MAX} files per request"})
+    return await asyncio.to_thread(approve_batch, files)
+
+def approve_batch(files):
+    results = []
+    with runlog.open_run("approval", title=f"Bulk approval of {len(files)} files") as log_f:
+        log_f.write(f"# Bulk Approval of {len(files)} files at {datetime.now().isoformat()}\n\n")
+        for file_data in files:
+            name = file_data.get("name") if isinstance(file_data, dict) else None
+            log_f.set_file(name)
+            if name is None:
+                status_code, content = 400, {"error": "Missing file name"}
+            else:
+                status_code, content = approve_record(file_data, log_f)
+            results.append({"name": name, "status_code": status_code, **content})
+        log_f.set_file(None)
+
+        approved = sum(1 for result in results if result["status_code"] == 200)
+        queued = sum(1 for result in results if result["status_code"] == 202)
+        failed = len(results) - approved - queued
+        log_f.write(f"\n## Summary\n")
+        log_f.write(f"- Approved: {approved}\n")
+        log_f.write(f"- Reprocessing queued: {queued}\n")
+        if failed:
+            log_f.log(f"- Failed: {failed}", level="error")
+
+    return {
+        "status": f"Approved {approved}, queued {queued} for reprocessing, {failed} failed",
+        "approved": approved,
+        "reprocess_queued": queued,
+        "failed": failed,
+        "results": results,
+        "log_file": log_f.run_id
+    }
+
+def write_text_atomic(file_path, text):
+    """Write text beside file_path and rename it into place, so readers never see a partial file"""
+    temp_path = f"{file_path}.tmp-{uuid.uuid4().hex}"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    filestats.touch(file_path)
+
+def approve_record(file_data, log_f):
+    """Save one staged record, or queue it for reprocessing, logging to log_f.
+
+    Returns (status_code, content): 200 when saved, 202 with the job when
+    reprocessing was queued, or an error status with {"error": ...}.
+    """
     file_name = file_data.get("name")
-    metadata = file_data.get("metadata", {})
-    content = file_data.get("content", "")
+    content = file_data.get("content")
     
-    if not file_name:
-        return JSONResponse(status_code=400, content={"error": "Missing file name"})
+    if not file_name or os.path.basename(file_name) != file_name:
+        return 400, {"error": "Missing or invalid file name"}
 
     # Get full file path
     file_path = f"pkm/Processed/Metadata/{file_name}"
+    if not os.path.exists(file_path):
+        return 404, {"error": f"File not found: {file_name}"}
     
-    # Create logs directory if it doesn't exist
-    logs_path = "pkm/Logs"
-    os.makedirs(logs_path, exist_ok=True)
-    timestamp = int(time.time())
+    # The client's fields are merged over the stored ones, so a partial record
+    # (or none at all) doesn't drop the title, tags or source
+    stored_metadata, stored_body = metafile.load(file_path)
+    metadata = {**stored_metadata, **(file_data.get("metadata") or {})}
     
-    # Create a log for this operation
-    log_file = f"{logs_path}/approval_{timestamp}.md"
-    with open(log_file, "w", encoding="utf-8") as log_f:
-        log_f.write(f"# File Approval at {datetime.now().isoformat()}\n\n")
-        log_f.write(f"File: {file_name}\n")
-        log_f.write(f"Action: {metadata.get('reprocess_status', 'save')}\n\n")
+    # /staging omits bodies by default, so no content means keep the stored body
+    if content is None:
+        content = stored_body
+    
+    log_f.write(f"File: {file_name}\n")
+    log_f.write(f"Action: {metadata.get('reprocess_status', 'save')}\n\n")
 
-        # Handle reprocess request
-        if metadata.get("reprocess_status") == "requested":
-            try:
-                log_f.write(f"## Reprocessing requested\n")
-                
-                # Update the file with reprocessing status
-                metadata["reprocess_status"] = "in_progress"
-                
-                # Format tags for YAML
-                if "tags" in metadata and isinstance(metadata["tags"], list):
-                    tags_yaml = "\n- " + "\n- ".join(metadata["tags"])
-                    metadata["tags"] = tags_yaml
-                
-                # Rebuild the file with updated metadata
-                metadata_lines = []
-                for key, value in metadata.items():
-                    metadata_lines.append(f"{key}: {value}")
-                    
-                file_content = "---\n" + "\n".join(metadata_lines) + "\n---\n\n" + content
-                
-                # Save the updated file
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write(file_content)
-                
-                log_f.write(f"Updated metadata with reprocess_status = in_progress\n")
-                
-                # Get the source file info for reprocessing
-                source_file = metadata.get("source")
-                file_type = metadata.get("file_type", "unknown")
-                
-                if source_file and file_type:
-                    source_path = f"pkm/Processed/Sources/{file_type}/{source_file}"
-                    
-                    log_f.write(f"Source file: {source_path}\n")
-                    
-                    if os.path.exists(source_path):
-                        # Create a temporary copy in the inbox to reprocess
-                        inbox_path = "pkm/Inbox"
-                        os.makedirs(inbox_path, exist_ok=True)
-                        temp_path = os.path.join(inbox_path, source_file)
-                        
-                        # Copy the source file to inbox
-                        import shutil
-                        shutil.copy(source_path, temp_path)
-                        log_f.write(f"Copied source file to inbox: {temp_path}\n")
-                        
-                        # Save reprocessing notes to a separate file for AI to use
-                        if metadata.get("reprocess_notes"):
-                            notes_file = os.path.join(inbox_path, f"{os.path.splitext(source_file)[0]}_reprocess_notes.txt")
-                            with open(notes_file, "w", encoding="utf-8") as f:
-                                f.write(metadata.get("reprocess_notes", ""))
-                            log_f.write(f"Created reprocessing notes file: {notes_file}\n")
-                        
-                        # Now trigger organize_files to process it
-                        log_f.write(f"Triggering organize_files()\n")
-                        
-                        try:
-                            # Run organize_files directly
-                            result = organize_files()
-                            
-                            log_f.write(f"organize_files() result:\n")
-                            log_f.write(f"- Success count: {result['success_count']}\n")
-                            log_f.write(f"- Failed files: {result['failed_files']}\n")
-                            
-                            # Update the metadata file with reprocess complete status
-                            # First reload the file to get any changes from organize_files
-                            try:
-                                # Look for newly generated metadata file
-                                new_md_filename = None
-                                metadata_path = "pkm/Processed/Metadata"
-                                today = datetime.now().strftime("%Y-%m-%d")
-                                
-                                # First try with today's date
-                                potential_name = f"{today}_{os.path.splitext(source_file)[0]}.md"
-                                if os.path.exists(os.path.join(metadata_path, potential_name)):
-                                    new_md_filename = potential_name
-                                else:
-                                    # Try finding by base name
-                                    base_name = os.path.splitext(source_file)[0]
-                                    for f in os.listdir(metadata_path):
-                                        if base_name in f and f.endswith(".md") and f != file_name:
-                                            new_md_filename = f
-                                            break
-                                
-                                if new_md_filename:
-                                    log_f.write(f"Found new metadata file: {new_md_filename}\n")
-                                    
-                                    # Now we need to:
-                                    # 1. Delete the original metadata file
-                                    # 2. Return information about the new file
-                                    try:
-                                        # Remove the old metadata file
-                                        if os.path.exists(file_path):
-                                            os.remove(file_path)
-                                            log_f.write(f"Deleted original metadata file: {file_path}\n")
-                                    except Exception as remove_error:
-                                        log_f.write(f"Error removing original file: {str(remove_error)}\n")
-                                    
-                                    return {
-                                        "status": "reprocessed",
-                                        "filename": file_name,
-                                        "new_filename": new_md_filename,
-                                        "message": "File reprocessed successfully"
-                                    }
-                                else:
-                                    log_f.write(f"No new metadata file found after reprocessing\n")
-                                    
-                                    # Update the original file to mark reprocessing as complete but failed
-                                    with open(file_path, "r", encoding="utf-8") as f:
-                                        content = f.read()
-                                    
-                                    # Update the reprocess status
-                                    if "reprocess_status: in_progress" in content:
-                                        content = content.replace("reprocess_status: in_progress", "reprocess_status: failed")
-                                    
-                                    with open(file_path, "w", encoding="utf-8") as f:
-                                        f.write(content)
-                                    
-                                    log_f.write(f"Updated original file with reprocess_status = failed\n")
-                                    
-                                    return {
-                                        "status": "reprocess_failed",
-                                        "filename": file_name,
-                                        "message": "Reprocessing failed - no new metadata found"
-                                    }
-                                
-                            except Exception as post_process_error:
-                                log_f.write(f"Error after organize_files: {str(post_process_error)}\n")
-                                return JSONResponse(
-                                    status_code=500, 
-                                    content={
-                                        "status": "reprocess_error",
-                                        "error": f"Error after reprocessing: {str(post_process_error)}"
-                                    }
-                                )
-                            
-                        except Exception as organize_error:
-                            log_f.write(f"Error running organize_files: {str(organize_error)}\n")
-                            
-                            # Update the status to indicate failure
-                            with open(file_path, "r", encoding="utf-8") as f:
-                                content = f.read()
-                            
-                            # Update the reprocess status
-                            if "reprocess_status: in_progress" in content:
-                                content = content.replace("reprocess_status: in_progress", "reprocess_status: failed")
-                            
-                            with open(file_path, "w", encoding="utf-8") as f:
-                                f.write(content)
-                            
-                            return JSONResponse(
-                                status_code=500, 
-                                content={
-                                    "status": "reprocess_error",
-                                    "error": f"Failed to reprocess: {str(organize_error)}"
-                                }
-                            )
-                            
-                    else:
-                        log_f.write(f"Source file not found: {source_path}\n")
-                        return JSONResponse(
-                            status_code=404, 
-                            content={"error": f"Source file not found: {source_path}"}
-                        )
-                else:
-                    log_f.write(f"Missing source info: file={source_file}, type={file_type}\n")
-                    return JSONResponse(
-                        status_code=400, 
-                        content={"error": "Missing source file information"}
-                    )
-                    
-            except Exception as e:
-                log_f.write(f"Reprocessing error: {str(e)}\n")
-                return JSONResponse(
-                    status_code=500, 
-                    content={"error": f"Failed to queue reprocessing: {str(e)}"}
-                )
-        
-        # Standard approval flow (Save)
+    # Handle reprocess request
+    if metadata.get("reprocess_status") == "requested":
         try:
-            log_f.write(f"## Saving file\n")
-            
-            # Format tags for YAML
-            if "tags" in metadata and isinstance(metadata["tags"], list):
-                tags_yaml = "\n- " + "\n- ".join(metadata["tags"])
-                metadata["tags"] = tags_yaml
+            log_f.write(f"## Reprocessing requested\n")
             
-            # Make sure reviewed is set to true
-            metadata["reviewed"] = "true"
+            # Get the source file info for reprocessing
+            source_file = metadata.get("source")
+            file_type = metadata.get("file_type", "unknown")
             
-            # Rebuild the file with updated metadata
-            metadata_lines = []
-            for key, value in metadata.items():
-                metadata_lines.append(f"{key}: {value}")
+            if not (source_file and file_type):
+                log_f.write(f"Missing source info: file={source_file}, type={file_type}\n")
+                return 400, {"error": "Missing source file information"}
                 
-            file_content = "---\n" + "\n".join(metadata_lines) + "\n---\n\n" + content
+            source_path = f"pkm/Processed/Sources/{file_type}/{source_file}"
+            log_f.write(f"Source file: {source_path}\n")
             
-            # Save the updated file
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(file_content)
+            if not os.path.exists(source_path):
+                log_f.write(f"Source file not found: {source_path}\n")
+                return 404, {"error": f"Source file not found: {source_path}"}
+            
+            # Only mark the record once the job can actually run, so a rejected
+            # request doesn't leave it stuck in in_progress
+            metadata["reprocess_status"] = "in_progress"
+            write_text_atomic(file_path, metafile.dumps(metadata, content))
+            log_f.write(f"Updated metadata with reprocess_status = in_progress\n")
                 
-            log_f.write(f"File saved successfully\n")
+            # Reprocessing runs OCR and OpenAI calls, so hand it to the job workers.
+            # A request made while one is running queues a follow-up with its notes.
+            job = jobs.enqueue("reprocess", {
+                "file_name": file_name,
+                "source_file": source_file,
+                "source_path": source_path,
+                "reprocess_notes": metadata.get("reprocess_notes", ""),
+                "reprocess_rounds": metadata.get("reprocess_rounds", 1),
+                "log_file": log_f.run_id
+            }, key=f"reprocess:{file_name}", coalesce_running=False, update_queued=True)
+            log_f.write(f"Queued reprocess job: {job['id']}\n")
+            return 202, job_summary(job, "reprocess_queued", filename=file_name)
                 
-            return {"status": "approved", "filename": file_name}
         except Exception as e:
-            log_f.write(f"Save error: {str(e)}\n")
-            return JSONResponse(status_code=500, content={"error": f"Failed to approve: {str(e)}"})
+            log_f.write(f"Reprocessing error: {str(e)}\n")
+            if metadata.get("reprocess_status") == "in_progress":
+                mark_reprocess_failed(file_path)
+            return 500, {"error": f"Failed to queue reprocessing: {str(e)}"}
+    
+    # Standard approval flow (Save)
+    try:
+        log_f.write(f"## Saving file\n")
+        
+        # Make sure reviewed is set to true
+        metadata["reviewed"] = True
+        
+        # Save the updated file
+        write_text_atomic(file_path, metafile.dumps(metadata, content))
+            
+        log_f.write(f"File saved successfully\n")
+        events.publish("file-approved", name=file_name)
+            
+        return 200, {"status": "approved", "filename": file_name}
+    except Exception as e:
+        log_f.write(f"Save error: {str(e)}\n")
+        return 500, {"error": f"Failed to approve: {str(e)}"}
+
+def mark_reprocess_failed(file_path):
+    """Flip reprocess_status from in_progress to failed in a metadata file"""
+    metadata, body = metafile.load(file_path)
+    if metadata.get("reprocess_status") == "in_progress":
+        metadata["reprocess_status"] = "failed"
+        write_text_atomic(file_path, metafile.dumps(metadata, body))
+
+def reprocess_metadata_file(payload, log_f):
+    """Re-run extraction for a staged file's source and swap in the new metadata"""
+    file_name = payload["file_name"]
+    file_path = f"pkm/Processed/Metadata/{file_name}"
+    
+    from organize import reprocess_file
+    try:
+        record = reprocess_file(
+            payload["source_path"],
+            notes=payload.get("reprocess_notes") or None,
+            reprocess_rounds=payload.get("reprocess_rounds", 1),
+            log_f=log_f
+        )
+    except Exception as reprocess_error:
+        log_f.write(f"Error reprocessing: {str(reprocess_error)}\n")
+        mark_reprocess_failed(file_path)
+        log_f.write(f"Updated original file with reprocess_status = failed\n")
+        raise Exception(f"Failed to reprocess: {str(reprocess_error)}")
+    
+    new_md_filename = record["md_filename"]
+    log_f.write(f"New metadata file: {new_md_filename}\n")
+    from organize import publish_staged
+    publish_staged(record, replaces=file_name)
+    
+    # Remove the old metadata file unless the new one replaced it in place
+    if new_md_filename != file_name:
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                filestats.touch(file_path)
+                log_f.write(f"Deleted original metadata file: {file_path}\n")
+        except Exception as remove_error:
+            log_f.write(f"Error removing original file: {str(remove_error)}\n")
+    
+    return {
+        "status": "reprocessed",
+        "filename": file_name,
+        "new_filename": new_md_filename,
+        "message": "File reprocessed successfully"
+    }
+
+# ─── JOBS ─────────────────────────────────────────────────────────
+
+def run_sync_job(payload, job):
+    """Job handler: sync the Drive Inbox (webhook runs keep their own logs)"""
+    with INBOX_LOCK:
+        if payload.get("trigger") == "webhook":
+            result = process_drive_changes(progress=job.progress)
+        else:
+            result = sync_drive(progress=job.progress)
+    if isinstance(result, dict):
+        events.publish(
+            "sync-progress",
+            stage="finished",
+            status=result.get("status"),
+            uploaded=len(result.get("uploaded", [])),
+            duplicates=len(result.get("duplicates", [])),
+            skipped=len(result.get("skipped", []))
+        )
+    return result
+
+def run_organize_job(payload, job):
+    """Job handler: process everything in pkm/Inbox"""
+    with INBOX_LOCK:
+        from organize import organize_files
+        return organize_files(progress=job.progress)
+
+def run_reprocess_job(payload, job):
+    """Job handler: reprocess one staged file, appending to its approval log"""
+    with runlog.open_run("approval", run_id=payload["log_file"]) as log_f:
+        log_f.set_file(payload["file_name"])
+        log_f.write(f"\n## Reprocess job {job.id} started at {datetime.now().isoformat()}\n")
+        return reprocess_metadata_file(payload, log_f)
+
+jobs.register_handler("sync", run_sync_job, lane="ingest")
+jobs.register_handler("organize", run_organize_job, lane="ingest")
+jobs.register_handler("reprocess", run_reprocess_job)
+
+def job_summary(job, status, **extra):
+    """Body pointing the client at the job's status endpoint"""
+    return {
+        "status": status,
+        "job_id": job["id"],
+        "job_status": job["status"],
+        "status_url": f"/jobs/{job['id']}",
+        **extra
+    }
+
+def job_accepted(job, status, **extra):
+    """202 response pointing the client at the job's status endpoint"""
+    return JSONResponse(status_code=202, content=job_summary(job, status, **extra))
+
+@app.get("/jobs")
+def list_jobs(status: str = None, limit: int = 50):
+    """List recent jobs, newest first"""
+    return {"jobs": jobs.list_jobs(status=status, limit=min(limit, 500))}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Get the status, progress and result of a job"""
+    job = jobs.get_job(job_id)
+    if not job:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return job
 
 # ─── PROCESS FILES ENDPOINT ─────────────────────────────────────────
 
 @app.post("/trigger-organize")
 def trigger_organize():
-    """Trigger the file organization process"""
-    try:
-        result = organize_files()
-        return {
-            "status": f"Files processed and organized: {result['success_count']} successful, {len(result['failed_files'])} failed",
-            "log_file": result['log_file'],
-            "failed_files": result['failed_files']
-        }
-    except Exception as e:
-        return {"status": f"Organization error: {str(e)}", "error": str(e)}
+    """Queue the file organization process and return its job ID"""
+    job = jobs.enqueue("organize", key="organize", coalesce_running=False)
+    return job_accepted(job, f"Organize job queued: {job['id']}")
+
+# ─── LLM ROUTING ───────────────────────────────────────────────────
+
+@app.get("/llm/routes")
+def llm_routes():
+    """Per-route call counts, token budgets, latency and estimated cost, plus dispatcher and parse counters"""
+    import routing
+    import llm_dispatch
+    import structured
+    return {
+        "models": {"fast": routing.MODEL_FAST, "strong": routing.MODEL_STRONG},
+        "budget": routing.LLM_BUDGET,
+        "max_input_tokens": routing.MAX_INPUT_TOKENS,
+        "max_cost_per_doc": routing.MAX_COST_PER_DOC,
+        "routes": routing.route_metrics(),
+        "dispatcher": llm_dispatch.get_dispatcher().stats(),
+        "parsing": structured.parse_metrics()
+    }
 
 # ─── SEARCH ENDPOINT ───────────────────────────────────────────────
 
@@ -1043,13 +1394,128 @@ async def upload_file(folder: str, payload: dict):
     except:
         return JSONResponse(status_code=400, content={"error": "Invalid base64 content"})
         
+    # Exact copies of processed content link to the existing record instead
+    if folder == "Inbox":
+        existing = await asyncio.to_thread(link_duplicate_upload, filename, hashlib.sha256(content_bytes).hexdigest())
+        if existing:
+            return {"status": "duplicate", "duplicate_of": existing["md_filename"]}
+    
     # Save the file
     file_path = os.path.join(folder_path, filename)
-    with open(file_path, "wb") as f:
-        f.write(content_bytes)
+    await asyncio.to_thread(write_upload_bytes, file_path, content_bytes)
         
     return {"status": f"File uploaded to {folder}/{filename}"}
 
+def link_duplicate_upload(filename, sha256):
+    """Return the existing record for already-processed bytes, recording the alias"""
+    existing = registry.find_by_hash(sha256)
+    if not existing or not os.path.exists(os.path.join("pkm/Processed/Metadata", existing["md_filename"])):
+        return None
+    registry.add_alias(sha256, os.path.basename(filename))
+    logger.info(f"Upload {filename} duplicates {existing['source_name']}, linked to {existing['md_filename']}")
+    return existing
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def write_upload_bytes(file_path, content_bytes):
+    """Save a whole upload held in memory"""
+    with open(file_path, "wb") as f:
+        f.write(content_bytes)
+    filestats.touch(file_path)
+
+def resolve_upload_path(folder, filename):
+    """Map an upload target to a path under pkm/, or None if it would escape it"""
+    filename = os.path.basename(filename or "")
+    folder_path = os.path.normpath(os.path.join("pkm", folder))
+    if not filename or folder_path != "pkm" and not folder_path.startswith("pkm" + os.sep):
+        return None
+    return os.path.join(folder_path, filename)
+
+async def write_upload_stream(chunks, file_path, find_duplicate=None):
+    """Write an async stream of byte chunks to file_path, hashing as it goes.
+
+    Data lands in a temporary file that is renamed into place only once the
+    whole body has arrived, so readers never see a partial upload. Before the
+    rename, find_duplicate(sha256) may return an existing record; the upload
+    is then discarded instead. Returns (sha256, size, duplicate record or None).
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temp_path = f"{file_path}.part-{uuid.uuid4().hex}"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        # Disk writes and the registry lookup run in worker threads, off the event loop
+        with open(temp_path, "wb") as f:
+            async for chunk in chunks:
+                digest.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+                size += len(chunk)
+        sha256 = digest.hexdigest()
+        duplicate = await asyncio.to_thread(find_duplicate, sha256) if find_duplicate else None
+        if duplicate:
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return sha256, size, duplicate
+
+async def iter_upload_file(upload):
+    """Yield an UploadFile's contents in fixed-size chunks"""
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+@app.post("/upload/{folder}/stream")
+async def upload_file_stream(folder: str, request: Request, filename: str = None, process: bool = False):
+    """Upload a file as a raw request body or multipart form, streaming it to disk.
+
+    Memory use stays flat regardless of file size. With process=true an
+    upload to the Inbox is queued for organizing straight away.
+    """
+    if process and folder != "Inbox":
+        return JSONResponse(status_code=400, content={"error": "Only Inbox uploads can be queued for processing"})
+    
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        # Multipart parts are spooled to a temporary file by the form parser
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or not hasattr(upload, "read"):
+            return JSONResponse(status_code=400, content={"error": "Missing 'file' form field"})
+        filename = filename or upload.filename
+        chunks = iter_upload_file(upload)
+    else:
+        chunks = request.stream()
+    
+    file_path = resolve_upload_path(folder, filename)
+    if not file_path:
+        return JSONResponse(status_code=400, content={"error": "Missing or invalid filename or folder"})
+    
+    # Exact copies of processed content link to the existing record instead.
+    # Checked before the rename, so an organize run never sees the copy in the Inbox.
+    find_duplicate = (lambda sha256: link_duplicate_upload(file_path, sha256)) if folder == "Inbox" else None
+    sha256, size, existing = await write_upload_stream(chunks, file_path, find_duplicate)
+    logger.info(f"Streamed upload {file_path}: {size} bytes, sha256 {sha256}")
+    if existing:
+        return {"status": "duplicate", "duplicate_of": existing["md_filename"], "sha256": sha256, "size": size}
+    filestats.touch(file_path)
+    
+    response = {
+        "status": f"File uploaded to {folder}/{os.path.basename(file_path)}",
+        "sha256": sha256,
+        "size": size
+    }
+    if process:
+        job = jobs.enqueue("organize", key="organize", coalesce_running=False)
+        response["job_id"] = job["id"]
+        response["status_url"] = f"/jobs/{job['id']}"
+    return response
+
 # ─── ROOT ENDPOINT ───────────────────────────────────────────────
 
 @app.get("/")
@@ -1057,24 +1523,130 @@ def root():
     return {"status": "PKM Indexer is running", "endpoints": [
         "/staging - Get files ready for review",
         "/approve - Approve a file from staging",
+        "/approve/bulk - Approve or reprocess many staged files at once",
         "/trigger-organize - Process new files",
         "/sync-drive - Sync with Google Drive",
         "/search - Search the knowledge base",
         "/upload/{folder} - Upload a file to a folder",
+        "/upload/{folder}/stream - Stream a raw or multipart upload to a folder",
         "/logs - View processing logs",
         "/file-stats - Get file statistics",
-        "/webhook/status - Check automatic sync status"
+        "/webhook/status - Check automatic sync status",
+        "/jobs/{job_id} - Check the progress of a queued job",
+        "/events - Server-sent events for ingestion, staging, approval and sync progress",
+        "/llm/routes - Per-route LLM usage metrics",
+        "/metrics - Prometheus metrics",
+        "/health - Liveness check",
+        "/health/ready - Readiness check"
     ]}
 
-# ─── BACKGROUND TASK TO CHECK WEBHOOK EXPIRATION ─────────────────
+# ─── EVENTS ──────────────────────────────────────────────────────
+
+EVENTS_HEARTBEAT_SECONDS = 15
+
+@app.get("/events")
+async def event_stream(request: Request, types: str = None):
+    """Server-sent events for file-ingested, file-staged, file-approved and sync-progress.
+
+    types=file-staged,file-approved limits the stream. Reconnecting clients
+    get what they missed from Last-Event-ID; a resync event means that was
+    too far back and the client should refetch instead.
+    """
+    wanted = [name for name in types.split(",") if name] if types else None
+    if wanted and not set(wanted) <= set(events.EVENT_TYPES):
+        return JSONResponse(status_code=400, content={"error": f"types must be among {', '.join(events.EVENT_TYPES)}"})
+    last_event_id = request.headers.get("last-event-id")
+
+    async def stream():
+        subscription = events.Subscription(last_event_id=last_event_id, types=wanted)
+        try:
+            yield "retry: 3000\n\n"
+            if subscription.gap:
+                yield "event: resync\ndata: {}\n\n"
+            while not await request.is_disconnected():
+                if subscription.overflowed:
+                    # A client this far behind refetches rather than replaying a partial stream
+                    yield "event: resync\ndata: {}\n\n"
+                    return
+                event = await subscription.next(EVENTS_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Content-Encoding": "identity"}
+    )
+
+# ─── METRICS ─────────────────────────────────────────────────────
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Pipeline stage timings, request latency and LLM counters in Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# ─── HEALTH ──────────────────────────────────────────────────────
+
+@app.get("/health")
+def health():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "ok", "uptime_seconds": round(time.time() - service_state["started_at"], 1)}
+
+@app.get("/health/ready")
+def health_ready():
+    """Readiness: startup finished and the job workers are running.
+
+    Webhook registration runs in the background and is reported here, but
+    a slow or failing Drive API does not make the service unready.
+    """
+    checks = {
+        "startup_complete": service_state["ready"],
+        "job_workers": jobs.workers_alive(),
+        "storage_writable": os.access("pkm", os.W_OK),
+    }
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "checks": checks,
+            "webhook": webhook_state["registration"],
+            "ready_at": service_state["ready_at"]
+        }
+    )
+
+# ─── BACKGROUND TASK TO REGISTER AND RENEW THE WEBHOOK ───────────
+
+async def register_webhook_with_retry():
+    """Register the Drive webhook off the startup path, backing off between failures"""
+    delay = WEBHOOK_RETRY_DELAY
+    for attempt in range(1, WEBHOOK_MAX_ATTEMPTS + 1):
+        webhook_state["registration"] = "registering"
+        # The Drive calls block, so they run on a worker thread
+        if await asyncio.to_thread(setup_webhook_registration):
+            return True
+        if webhook_state["registration"] == "disabled":
+            return False
+        webhook_state["registration"] = "retrying"
+        logger.warning(f"Webhook registration attempt {attempt} failed, retrying in {delay}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, WEBHOOK_RETRY_MAX_DELAY)
+    webhook_state["registration"] = "failed"
+    logger.error(f"Webhook registration failed after {WEBHOOK_MAX_ATTEMPTS} attempts")
+    return False
 
 async def renew_webhook_if_needed():
-    """Periodic task to check and renew webhook if needed"""
+    """Register the webhook, then periodically check and renew it"""
+    await register_webhook_with_retry()
     while True:
         try:
-            check_webhook_expiration()
             # Check every 12 hours
             await asyncio.sleep(12 * 60 * 60)
+            await asyncio.to_thread(check_webhook_expiration)
         except Exception as e:
             logger.error(f"Error in webhook renewal background task: {str(e)}")
             # Still sleep before retrying
@@ -1084,14 +1656,25 @@ async def renew_webhook_if_needed():
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize the system on startup"""
+    """Initialize the system on startup without waiting on Google Drive"""
     try:
-        # Set up the webhook immediately on startup
-        setup_webhook_registration()
-        logger.info("Startup: Webhook setup initiated")
+        # Start the job workers, picking up anything a previous process left behind
+        jobs.start_workers()
         
-        # Start background task to periodically check and renew webhook
+        # Count files in the background, then keep the counters reconciled
+        filestats.start_reconciler()
+        
+        # Register the webhook in the background, then keep it renewed
         asyncio.create_task(renew_webhook_if_needed())
-        logger.info("Started webhook renewal background task")
+        logger.info("Startup: Webhook registration started in the background")
+        
+        service_state["ready"] = True
+        service_state["ready_at"] = datetime.now().isoformat()
     except Exception as e:
-        logger.error(f"Error during application startup: {str(e)}")
\ No newline at end of file
+        logger.error(f"Error during application startup: {str(e)}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Let in-flight jobs finish before the process exits"""
+    # Joining the worker threads blocks, so it runs off the event loop
+    await asyncio.to_thread(jobs.stop_workers)
\ No newline at end of file
@@ -0,0 +1,166 @@
+# File: apps/pkm-indexer/metafile.py
+import os
+import re
+import codecs
+import yaml
+
+# Reading and writing the metadata records in pkm/Processed/Metadata: YAML
+# frontmatter between "---" lines, then the body. Records are written in one
+# canonical form (safe YAML, fields in the order given, multi-line text as
+# literal blocks) so they always load back as they were saved. Older records
+# hand-built by /approve aren't always valid YAML; those fall back to a
+# line-by-line parse. bench/bench_frontmatter.py compares this with the
+# python-frontmatter library.
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_BaseDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+DELIMITER = "---"
+BOOL_FIELDS = ("reviewed",)
+LIST_FIELDS = ("tags", "referenced_urls", "referenced_resources")
+HEADER_READ_BYTES = 8192
+# Frontmatter that hasn't ended by here is treated as absent rather than read on
+MAX_HEADER_BYTES = int(os.environ.get("PKM_MAX_HEADER_BYTES", str(256 * 1024)))
+_CLOSING = re.compile(r"^---[ \t]*$", re.MULTILINE)
+_CLOSING_BYTES = re.compile(rb"^---[ \t]*\r?$", re.MULTILINE)
+_LEGACY_KEY = re.compile(r"^([A-Za-z_][\w-]*):(?:\s(.*)|$)")
+
+class Dumper(_BaseDumper):
+    pass
+
+def _represent_str(dumper, value):
+    style = "|" if "\n" in value else None
+    return dumper.represent_scalar("tag:yaml.org,2002:str", value, style=style)
+
+Dumper.add_representer(str, _represent_str)
+
+# ─── PARSING ──────────────────────────────────────────────────────
+
+def split(text):
+    """Return (frontmatter text, body) without parsing the YAML; frontmatter is None if absent"""
+    if not text.startswith(DELIMITER):
+        return None, text
+    first_line_end = text.find("\n")
+    if first_line_end == -1 or text[:first_line_end].strip() != DELIMITER:
+        return None, text
+    closing = _CLOSING.search(text, first_line_end + 1)
+    if closing is None:
+        return None, text
+    header = text[first_line_end + 1:closing.start()]
+    return header, text[closing.end():].lstrip("\r\n")
+
+def _parse_legacy(header):
+    """Line-by-line parse for records that were hand-built rather than dumped"""
+    metadata = {}
+    key = None
+    for line in header.splitlines():
+        match = _LEGACY_KEY.match(line)
+        if match:
+            key = match.group(1)
+            metadata[key] = (match.group(2) or "").strip()
+        elif key is None:
+            continue
+        elif line.startswith("- "):
+            if not isinstance(metadata[key], list):
+                metadata[key] = [metadata[key]] if metadata[key] else []
+            metadata[key].append(line[2:].strip())
+        elif isinstance(metadata[key], str):
+            metadata[key] = f"{metadata[key]}\n{line}" if metadata[key] else line
+    return metadata
+
+def _as_list(value):
+    if value is None or value == "":
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip() for item in value if str(item).strip()]
+    value = str(value).strip()
+    if "\n" in value or value.startswith("- "):
+        items = (line.strip().lstrip("-").strip() for line in value.splitlines())
+        return [item for item in items if item]
+    if value.startswith("[") and value.endswith("]"):
+        value = value[1:-1]
+    return [item.strip().strip("'\"") for item in value.split(",") if item.strip().strip("'\"")]
+
+def normalize(metadata):
+    """Coerce the fields the pipeline relies on to their schema types"""
+    metadata = dict(metadata)
+    for key in BOOL_FIELDS:
+        if isinstance(metadata.get(key), str):
+            metadata[key] = metadata[key].strip().strip("'\"").lower() == "true"
+    for key in LIST_FIELDS:
+        if key in metadata and not isinstance(metadata[key], list):
+            metadata[key] = _as_list(metadata[key])
+    return metadata
+
+def parse_header(header):
+    """Parse frontmatter text into a normalized dict"""
+    try:
+        metadata = yaml.load(header, Loader=Loader)
+    except yaml.YAMLError:
+        metadata = _parse_legacy(header)
+    if not isinstance(metadata, dict):
+        metadata = {}
+    return normalize(metadata)
+
+def loads(text):
+    """Return (metadata, body) for a record's text; metadata is {} without frontmatter"""
+    header, body = split(text)
+    if header is None:
+        return {}, body
+    return parse_header(header), body
+
+def load(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return loads(f.read())
+
+# ─── BOUNDED READS ────────────────────────────────────────────────
+
+def read_header(path, max_bytes=MAX_HEADER_BYTES):
+    """Parse only a record's frontmatter, reading the file a block at a time.
+
+    Returns (metadata, body_offset), where body_offset is the byte offset to
+    pass to read_body(). Without frontmatter, or if it doesn't end within
+    max_bytes, returns ({}, 0).
+    """
+    with open(path, "rb") as f:
+        data = f.read(HEADER_READ_BYTES)
+        first_line_end = data.find(b"\n")
+        if first_line_end == -1 or data[:first_line_end].strip() != DELIMITER.encode():
+            return {}, 0
+        scanned = first_line_end + 1
+        while True:
+            closing = _CLOSING_BYTES.search(data, scanned)
+            if closing:
+                break
+            # Rescan the last partial line once the next block arrives
+            scanned = max(first_line_end + 1, data.rfind(b"\n") + 1)
+            block = f.read(HEADER_READ_BYTES) if len(data) < max_bytes else b""
+            if not block:
+                return {}, 0
+            data += block
+    header = data[first_line_end + 1:closing.start()].decode("utf-8", errors="replace")
+    return parse_header(header), closing.end()
+
+def read_body(path, offset=0, max_chars=None):
+    """Read a record's body from the offset read_header() returned, or only its first max_chars"""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        # A character is at most 4 bytes in UTF-8; the slack covers the newlines stripped below
+        data = f.read() if max_chars is None else f.read(max_chars * 4 + 8)
+    # Not final, so a character cut off by a bounded read is dropped rather than mangled
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    body = decoder.decode(data, final=max_chars is None).replace("\r\n", "\n").lstrip("\n")
+    return body if max_chars is None else body[:max_chars]
+
+# ─── WRITING ──────────────────────────────────────────────────────
+
+def dumps(metadata, body=""):
+    """Render a record in canonical form"""
+    header = yaml.dump(
+        normalize(metadata),
+        Dumper=Dumper,
+        sort_keys=False,
+        allow_unicode=True,
+        default_flow_style=False,
+        width=4096
+    )
+    return f"{DELIMITER}\n{header}{DELIMITER}\n\n{body}"
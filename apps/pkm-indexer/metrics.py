@@ -0,0 +1,144 @@
+# File: apps/pkm-indexer/metrics.py
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+# Seconds; covers everything from a header parse to a slow OCR pass or LLM call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_families = {}
+_lock = threading.Lock()
+
+# ─── REGISTRY ─────────────────────────────────────────────────────
+
+def _family(name, kind, help_text, buckets=None):
+    with _lock:
+        family = _families.get(name)
+        if family is None:
+            family = {"kind": kind, "help": help_text, "buckets": buckets, "series": {}}
+            _families[name] = family
+        return family
+
+def counter(name, help_text):
+    """Declare a counter; declaring one twice returns the same family"""
+    return _family(name, "counter", help_text)
+
+def histogram(name, help_text, buckets=DEFAULT_BUCKETS):
+    return _family(name, "histogram", help_text, tuple(buckets))
+
+def inc(name, amount=1, **labels):
+    family = _families[name]
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        family["series"][key] = family["series"].get(key, 0) + amount
+
+def observe(name, value, **labels):
+    family = _families[name]
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        series = family["series"].get(key)
+        if series is None:
+            series = family["series"][key] = {"buckets": [0] * len(family["buckets"]), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(family["buckets"]):
+            if value <= bound:
+                series["buckets"][i] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+# ─── PIPELINE STAGES ──────────────────────────────────────────────
+
+histogram("pkm_stage_duration_seconds", "Time spent in each pipeline stage")
+counter("pkm_stage_errors_total", "Pipeline stages that raised")
+counter("pkm_files_total", "Files handled by the pipeline, by outcome")
+histogram("pkm_http_request_duration_seconds", "HTTP request latency by route")
+
+@contextmanager
+def stage(pipeline, name):
+    """Time a block as one pipeline stage, counting it as an error if it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc("pkm_stage_errors_total", pipeline=pipeline, stage=name)
+        raise
+    finally:
+        observe("pkm_stage_duration_seconds", time.perf_counter() - started, pipeline=pipeline, stage=name)
+
+# ─── EXPOSITION ───────────────────────────────────────────────────
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _render_family(lines, name, family):
+    lines.append(f"# HELP {name} {family['help']}")
+    lines.append(f"# TYPE {name} {family['kind']}")
+    for key, value in sorted(family["series"].items()):
+        if family["kind"] != "histogram":
+            lines.append(f"{name}{_labels(key)} {_number(value)}")
+            continue
+        for bound, count in zip(family["buckets"], value["buckets"]):
+            lines.append(f"{name}_bucket{_labels(key + (('le', _number(float(bound))),))} {count}")
+        lines.append(f"{name}_bucket{_labels(key + (('le', '+Inf'),))} {value['count']}")
+        lines.append(f"{name}_sum{_labels(key)} {_number(value['sum'])}")
+        lines.append(f"{name}_count{_labels(key)} {value['count']}")
+
+def _llm_families():
+    """Fold the LLM route, dispatcher and parse counters in, if those modules are loaded.
+
+    They are imported lazily, so a process that hasn't run an extract yet
+    simply has none to report.
+    """
+    families = {}
+    routing = sys.modules.get("routing")
+    if routing is not None:
+        routes = routing.route_metrics()
+        for metric, field, kind, help_text in (
+            ("pkm_llm_calls_total", "calls", "counter", "LLM calls by route"),
+            ("pkm_llm_errors_total", "errors", "counter", "Failed LLM calls by route"),
+            ("pkm_llm_input_tokens_total", "input_tokens", "counter", "Input tokens sent, by route"),
+            ("pkm_llm_estimated_cost_dollars_total", "estimated_cost", "counter", "Estimated LLM spend by route"),
+            ("pkm_llm_latency_seconds_total", "latency_seconds_total", "counter", "Total LLM call time by route"),
+        ):
+            families[metric] = {"kind": kind, "help": help_text, "series": {
+                (("model", entry["model"]), ("route", route)): entry[field] for route, entry in routes.items()
+            }}
+    llm_dispatch = sys.modules.get("llm_dispatch")
+    if llm_dispatch is not None and llm_dispatch._dispatcher is not None:
+        stats = llm_dispatch._dispatcher.stats()
+        for field in ("submitted", "succeeded", "failed", "retries", "rate_limited"):
+            families[f"pkm_llm_dispatch_{field}_total"] = {
+                "kind": "counter", "help": f"LLM dispatcher requests {field.replace('_', ' ')}", "series": {(): stats[field]}
+            }
+        for field in ("concurrency_limit", "in_flight", "queued"):
+            families[f"pkm_llm_dispatch_{field}"] = {
+                "kind": "gauge", "help": f"LLM dispatcher {field.replace('_', ' ')}", "series": {(): stats[field]}
+            }
+    structured = sys.modules.get("structured")
+    if structured is not None:
+        parsing = structured.parse_metrics()
+        families["pkm_llm_parse_total"] = {"kind": "counter", "help": "Extract replies by parse outcome", "series": {
+            (("outcome", outcome),): parsing[outcome]
+            for outcome in ("parsed", "repaired", "invalid", "model_retries", "model_retry_parsed", "fallback")
+        }}
+    return families
+
+def render():
+    """Return every metric in the Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        for name, family in sorted(_families.items()):
+            _render_family(lines, name, family)
+    for name, family in sorted(_llm_families().items()):
+        _render_family(lines, name, family)
+    return "\n".join(lines) + "\n"
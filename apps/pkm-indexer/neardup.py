@@ -0,0 +1,83 @@
+# File: apps/pkm-indexer/neardup.py
+import os
+import re
+import hashlib
+import numpy as np
+import registry
+
+# MinHash over word shingles, indexed with banded LSH. With 16 bands of 8
+# rows, pairs above ~0.7 Jaccard similarity almost always share a bucket;
+# the threshold check on the estimated similarity does the final filtering.
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+MIN_TOKENS = 20  # Shorter texts are too small to compare meaningfully
+
+NEAR_DUP_MODE = os.environ.get("PKM_NEAR_DUP_MODE", "skip")  # skip, flag or off
+NEAR_DUP_THRESHOLD = float(os.environ.get("PKM_NEAR_DUP_THRESHOLD", "0.9"))
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(20250520)  # Fixed seed - stored signatures must stay comparable
+_A = _rng.randint(1, _PRIME, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, _PRIME, size=NUM_PERM, dtype=np.uint64)
+
+def _shingle_hashes(text):
+    tokens = re.findall(r"\w+", text.lower())
+    if len(tokens) < MIN_TOKENS:
+        return None
+    shingles = {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles)
+    )
+
+def signature(text):
+    """Return the MinHash signature of a text as a uint32 array, or None if it is too short"""
+    hashes = _shingle_hashes(text)
+    if hashes is None:
+        return None
+    sig = np.full(NUM_PERM, _PRIME, dtype=np.uint64)
+    # One universal hash per permutation; a < 2^31 and x < 2^31 keeps a*x+b inside uint64.
+    # Shingles are processed in blocks so long documents don't build a huge matrix.
+    for start in range(0, len(hashes), 4096):
+        block = hashes[start:start + 4096] % _PRIME
+        np.minimum(sig, ((np.outer(block, _A) + _B) % _PRIME).min(axis=0), out=sig)
+    return sig.astype(np.uint32)
+
+def band_keys(sig):
+    """Hash each band of a signature into its LSH bucket key"""
+    return [
+        hashlib.blake2b(sig[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8).hexdigest()
+        for band in range(BANDS)
+    ]
+
+def similarity(sig_a, sig_b):
+    """Estimate the Jaccard similarity of two texts from their signatures"""
+    return float(np.mean(sig_a == sig_b))
+
+def find_near_duplicate(sig, metadata_dir, exclude=None):
+    """Return (md_filename, similarity) of the closest indexed record above the threshold, or None"""
+    if sig is None:
+        return None
+    best = None
+    for md_filename in registry.lsh_candidates(band_keys(sig)):
+        if md_filename == exclude:
+            continue
+        if not os.path.exists(os.path.join(metadata_dir, md_filename)):
+            # The record was deleted or replaced since it was indexed
+            registry.remove_signature(md_filename)
+            continue
+        stored = registry.get_signature(md_filename)
+        if stored is None:
+            continue
+        score = similarity(sig, np.frombuffer(stored, dtype=np.uint32))
+        if score >= NEAR_DUP_THRESHOLD and (best is None or score > best[1]):
+            best = (md_filename, score)
+    return best
+
+def index_signature(md_filename, sig):
+    """Store a record's signature so later captures can be matched against it"""
+    if sig is not None:
+        registry.store_signature(md_filename, sig.tobytes(), band_keys(sig))
@@ -2,18 +2,25 @@
 import os
 import shutil
 import time
-import frontmatter
-import openai
 import re
-import json
 from pathlib import Path
-import pdfplumber
-import pytesseract
-from PIL import Image
-import requests
-from bs4 import BeautifulSoup
+import registry
+import neardup
+import routing
+import summarize
+import llm
+import llm_dispatch
+import structured
+import metrics
+import runlog
+import filestats
+import events
+import metafile
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+INBOX = "pkm/Inbox"
+META_OUT = "pkm/Processed/Metadata"
+SOURCE_OUT = "pkm/Processed/Sources"
+REPROCESS_NOTES_SUFFIX = "_reprocess_notes.txt"
 
 def infer_file_type(filename):
     ext = Path(filename).suffix.lower()
@@ -26,6 +33,7 @@ def infer_file_type(filename):
 
 def extract_text_from_pdf(path):
     try:
+        import pdfplumber  # Heavy extractors load on first use, not at import
         with pdfplumber.open(path) as pdf:
             text = "\n".join(page.extract_text() or "" for page in pdf.pages)
             
@@ -117,6 +125,9 @@ def process_linkedin_pdf(text, path):
 
 def extract_text_from_image(path):
     try:
+        import pytesseract
+        from PIL import Image
+        
         # Open and process image
         image = Image.open(path)
         
@@ -126,11 +137,13 @@ def extract_text_from_image(path):
         # Approach 1: Original with adjusted threshold
         img1 = image.convert("L")
         img1 = img1.point(lambda x: 0 if x < 120 else 255)  # Lowered threshold
-        texts.append(pytesseract.image_to_string(img1, lang="eng"))
+        with metrics.stage("organize", "ocr_eng"):
+            texts.append(pytesseract.image_to_string(img1, lang="eng"))
         
         # Approach 2: Try Danish language if available
         try:
-            texts.append(pytesseract.image_to_string(img1, lang="dan"))
+            with metrics.stage("organize", "ocr_dan"):
+                texts.append(pytesseract.image_to_string(img1, lang="dan"))
         except:
             # If Danish not installed, try with English
             pass
@@ -142,15 +155,18 @@ def extract_text_from_image(path):
         
         # Try multilingual if available
         try:
-            texts.append(pytesseract.image_to_string(img3, lang="dan+eng"))
+            with metrics.stage("organize", "ocr_upsampled_dan_eng"):
+                texts.append(pytesseract.image_to_string(img3, lang="dan+eng"))
         except:
-            texts.append(pytesseract.image_to_string(img3, lang="eng"))
+            with metrics.stage("organize", "ocr_upsampled_eng"):
+                texts.append(pytesseract.image_to_string(img3, lang="eng"))
         
         # Approach 4: Higher contrast for slide presentations
         img4 = image.convert("L")
         # Apply more aggressive contrast for presentation slides
         img4 = img4.point(lambda x: 0 if x < 180 else 255)
-        texts.append(pytesseract.image_to_string(img4, lang="eng"))
+        with metrics.stage("organize", "ocr_contrast_eng"):
+            texts.append(pytesseract.image_to_string(img4, lang="eng"))
         
         # Use the longest text result that isn't just garbage
         valid_texts = [t for t in texts if len(t.strip()) > 20]
@@ -216,6 +232,9 @@ def extract_urls(text):
     return all_urls, filtered_links
 
 def enrich_urls(urls, potential_titles=None):
+    import requests
+    from bs4 import BeautifulSoup
+    
     enriched = []
     metadata = {}
     
@@ -287,10 +306,34 @@ def enrich_urls(urls, potential_titles=None):
     print("🔍 Enriched URLs block:\n", "\n".join(enriched))
     return "\n".join(enriched), metadata
 
-def get_extract(content, file_type=None, urls_metadata=None, log_f=None, is_linkedin=False):
+def chat_completion(model, messages, max_tokens, temperature=0.7, route=None, log_f=None, **options):
+    """Send a chat request through the shared rate-limited dispatcher and return the reply text.
+
+    Retries and backoff happen in the dispatcher, which honours Retry-After
+    and the rate-limit headers for every caller at once.
+    """
+    started = time.time()
+    try:
+        response = llm_dispatch.get_dispatcher().submit(
+            model,
+            messages,
+            max_tokens,
+            temperature=temperature,  # 0.7 balances creativity and accuracy
+            log_f=log_f,
+            **options
+        ).result()
+    except Exception:
+        if route:
+            routing.record_call(route, time.time() - started, ok=False)
+        raise
+    if route:
+        routing.record_call(route, time.time() - started)
+    return response["content"]
+
+def get_extract(content, file_type=None, urls_metadata=None, log_f=None, is_linkedin=False, notes=None):
     try:
         # Check if OpenAI API key is configured
-        if not openai.api_key:
+        if not llm.get_backend().is_configured():
             error_msg = "OpenAI API key not configured. Please set OPENAI_API_KEY environment variable."
             print(f"🚫 Error: {error_msg}")
             if log_f:
@@ -299,29 +342,28 @@ def get_extract(content, file_type=None, urls_metadata=None, log_f=None, is_link
         
         print("🧠 Content sent to GPT (preview):\n", content[:500])
         
-        # Determine appropriate extract length based on content
+        # Pick model tier, output budget and input budget from token counts and content type
         content_length = len(content)
-        if content_length < 1000:
-            # For very short content, keep extract concise
-            extract_length = 200
-            model = "gpt-4"
-        elif content_length < 5000:
-            # For medium content, medium extract
-            extract_length = 500
-            model = "gpt-4"
-        else:
-            # For longer, complex content, allow longer extracts
-            extract_length = 2000  # Up to ~400 words for complex content
-            model = "gpt-4"  # Better for complex content
-        
-        # Check if this appears to be a resource list/links-heavy doc
-        has_resource_patterns = (
-            "resources" in content.lower() and 
-            (content.count("\n1)") > 1 or content.count("\n2)") > 1)
-        )
+        route = routing.choose_route(content, file_type=file_type, is_linkedin=is_linkedin, urls_metadata=urls_metadata)
+        model = route["model"]
+        extract_length = route["max_tokens"]
+        body = routing.truncate_to_tokens(content, route["input_tokens"])
+        if log_f:
+            log_f.write(f"LLM route: {route['name']} ({route['content_tokens']} content tokens, "
+                        f"{route['input_tokens']} sent, max {extract_length} out, ~${route['estimated_cost']})\n")
+        
+        # Long documents: summarize every chunk and extract from the summaries instead of the first part only.
+        # Chunk summaries are cached, so a reprocess with new notes only reruns this final call.
+        if summarize.CHUNKED_SUMMARIES and route["content_tokens"] > route["input_tokens"]:
+            try:
+                body = summarize.condense(content, route["input_tokens"], chat_completion, log_f=log_f)
+            except Exception as chunk_error:
+                print(f"⚠️ Chunked summary failed, using truncated content: {chunk_error}")
+                if log_f:
+                    log_f.write(f"Chunked summary failed, using truncated content: {chunk_error}\n")
         
         # Different prompt based on content type
-        if has_resource_patterns:
+        if route["content_type"] == "resource_list":
             # For resource-list style documents
             prompt = (
                 "You are analyzing a document that appears to be a resource list with references, links, and learning materials.\n\n"
@@ -334,27 +376,27 @@ def get_extract(content, file_type=None, urls_metadata=None, log_f=None, is_link
                 "4. Any referenced websites, tools, or platforms\n\n"
                 "Respond in this JSON format:\n"
                 "{\n  \"extract_title\": \"...\",\n  \"extract_content\": \"...\",\n  \"tags\": [\"tag1\", \"tag2\"]\n}\n\n"
-                f"Content:\n{content[:5000]}"
+                f"Content:\n{body}"
             )
-        elif is_linkedin:
+        elif route["content_type"] == "linkedin":
             prompt = (
                 "You are analyzing a LinkedIn post. Create a clear title and detailed summary that captures "
                 "the key points, insights, and any URLs/resources mentioned in the post. Ignore promotional content.\n\n"
                 "Focus on what makes this post valuable for knowledge management purposes.\n\n"
                 "Respond in this JSON format:\n"
                 "{\n  \"extract_title\": \"...\",\n  \"extract_content\": \"...\",\n  \"tags\": [\"tag1\", \"tag2\"]\n}\n\n"
-                f"LinkedIn Post Content:\n{content[:5000]}"
+                f"LinkedIn Post Content:\n{body}"
             )
-        elif file_type == "image":
+        elif route["content_type"] == "ocr":
             prompt = (
                 "You are analyzing text extracted from an image via OCR. The text may have errors or be incomplete.\n\n"
                 "Create a meaningful title and summary of what this image contains, plus relevant tags.\n\n"
                 "For complex content, provide a detailed summary that captures the key information.\n\n"
                 "Respond in this JSON format:\n"
                 "{\n  \"extract_title\": \"...\",\n  \"extract_content\": \"...\",\n  \"tags\": [\"tag1\", \"tag2\"]\n}\n\n"
-                f"OCR Text:\n{content[:5000]}"
+                f"OCR Text:\n{body}"
             )
-        elif urls_metadata and len(urls_metadata) > 0:
+        elif route["content_type"] == "urls":
             # Create a summary of URLs for the prompt
             url_summary = "\n".join([f"- {data['title']}: {data['url']}" for url, data in urls_metadata.items()])
             
@@ -366,7 +408,7 @@ def get_extract(content, file_type=None, urls_metadata=None, log_f=None, is_link
                 f"{url_summary}\n\n"
                 "Respond in this JSON format:\n"
                 "{\n  \"extract_title\": \"...\",\n  \"extract_content\": \"...\",\n  \"tags\": [\"tag1\", \"tag2\"]\n}\n\n"
-                f"Content:\n{content[:5000]}"
+                f"Content:\n{body}"
             )
         else:
             prompt = (
@@ -374,137 +416,126 @@ def get_extract(content, file_type=None, urls_metadata=None, log_f=None, is_link
                 "For complex or information-rich content, provide a detailed summary that captures the key points.\n\n"
                 "Respond in this JSON format:\n"
                 "{\n  \"extract_title\": \"...\",\n  \"extract_content\": \"...\",\n  \"tags\": [\"tag1\", \"tag2\"]\n}\n\n"
-                f"Content:\n{content[:5000]}"
+                f"Content:\n{body}"
             )
         
+        # Reviewer notes from a reprocess request steer the new extract
+        if notes:
+            prompt += f"\n\nReviewer notes on the previous extract - take these into account:\n{notes}"
+        
         # Log the prompt for debugging
         if log_f:
             log_f.write(f"OpenAI Prompt: {prompt[:500]}...\n")
         
-        # Add retries for API call reliability
-        max_retries = 3
-        retry_delay = 2  # seconds
+        messages = [
+            {"role": "system", "content": "You analyze content and extract semantic meaning. Respond with a single JSON object."},
+            {"role": "user", "content": prompt}
+        ]
+        response_format = structured.response_format(model)
+        raw = chat_completion(
+            model,
+            messages,
+            max_tokens=extract_length,  # Dynamic based on content
+            route=route,
+            log_f=log_f,
+            response_format=response_format
+        )
         
-        for attempt in range(max_retries):
-            try:
-                response = openai.ChatCompletion.create(
-                    model=model,
-                    messages=[
-                        {"role": "system", "content": "You analyze content and extract semantic meaning."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=extract_length,  # Dynamic based on content
-                    temperature=0.7  # Balanced between creativity and accuracy
-                )
-                
-                # Process the raw response
-                raw = response["choices"][0]["message"]["content"]
-                
-                # Log the raw response for debugging
-                if log_f:
-                    log_f.write(f"OpenAI Raw Response: {raw[:500]}...\n")
-                
-                # Try to parse as JSON
-                try:
-                    parsed = json.loads(raw)
-                    
-                    # Validate the expected fields
-                    if "extract_title" not in parsed or "extract_content" not in parsed:
-                        if log_f:
-                            log_f.write(f"JSON parsing successful but missing required fields. Got: {list(parsed.keys())}\n")
-                        # Try a fallback approach - extract from raw text if possible
-                        title_match = re.search(r'"extract_title":\s*"([^"]+)"', raw)
-                        content_match = re.search(r'"extract_content":\s*"([^"]+)"', raw)
-                        tags_match = re.search(r'"tags":\s*\[(.*?)\]', raw)
-                        
-                        title = title_match.group(1) if title_match else "Extracted Title"
-                        extract = content_match.group(1) if content_match else raw
-                        
-                        if tags_match:
-                            tags_str = tags_match.group(1)
-                            tags = [tag.strip('"\'') for tag in tags_str.split(',')]
-                        else:
-                            tags = ["extracted"]
-                            
-                        return title, extract, tags
-                    
-                    # Get the extracted information
-                    title = parsed.get("extract_title", "Untitled")
-                    extract = parsed.get("extract_content", "No summary generated.")
-                    tags = parsed.get("tags", ["untagged"])
-                    
-                    # Basic validation
-                    if not title or title == "Untitled":
-                        # Try to generate a title from the first line of content
-                        first_line = content.split('\n')[0].strip()
-                        if len(first_line) > 5 and len(first_line) < 100:
-                            title = first_line
-                    
-                    # Make sure extract isn't empty
-                    if not extract or extract == "No summary." or extract == "No summary generated.":
-                        if content_length < 1000:
-                            # For short content, just use the original
-                            extract = content
-                        else:
-                            # For longer content, use the first 500 chars
-                            extract = content[:500] + "... (Extract generation failed, showing original content preview)"
-                    
-                    # Make sure we have some tags
-                    if not tags or tags == ["untagged"]:
-                        # Generate some basic tags from content
-                        if "AI" in content:
-                            tags.append("AI")
-                        if "book" in content.lower() or "publication" in content.lower():
-                            tags.append("Reading")
-                        if "research" in content.lower():
-                            tags.append("Research")
-                        if file_type:
-                            tags.append(file_type.capitalize())
-                    
-                    return title, extract, tags
-                    
-                except json.JSONDecodeError as json_err:
-                    if log_f:
-                        log_f.write(f"JSON parsing error: {str(json_err)}\nRaw text: {raw[:500]}...\n")
-                    
-                    # Attempt to extract meaningful content from non-JSON response
-                    lines = raw.split('\n')
-                    title = "Untitled"
-                    for line in lines:
-                        if "title" in line.lower() and ":" in line:
-                            title = line.split(":", 1)[1].strip().strip('"\'')
-                            break
-                    
-                    # Just use the raw output as the extract
-                    extract = raw
-                    
-                    # Generate basic tags
-                    tags = []
-                    for line in lines:
-                        if "tags" in line.lower() and ":" in line:
-                            tags_part = line.split(":", 1)[1].strip()
-                            tags = [t.strip().strip('",[]') for t in tags_part.split(",")]
-                            break
-                    
-                    if not tags:
-                        tags = ["extracted"]
-                        if file_type:
-                            tags.append(file_type.capitalize())
-                    
-                    return title, extract, tags
-                
-            except Exception as api_error:
-                if attempt < max_retries - 1:
-                    print(f"🔄 OpenAI API error, retrying ({attempt+1}/{max_retries}): {str(api_error)}")
-                    if log_f:
-                        log_f.write(f"OpenAI API error, retrying: {str(api_error)}\n")
-                    time.sleep(retry_delay * (2 ** attempt))  # Exponential backoff
+        # Log the raw response for debugging
+        if log_f:
+            log_f.write(f"OpenAI Raw Response: {raw[:500]}...\n")
+        
+        # Strict JSON first, then a local repair; only then pay for one more model round trip
+        parsed, method = structured.parse_extract(raw)
+        structured.count(method or "invalid")
+        if parsed is None:
+            structured.count("model_retries")
+            if log_f:
+                log_f.write("Reply was not a valid extract object, asking the model once more\n")
+            raw = chat_completion(
+                model,
+                messages + [
+                    {"role": "assistant", "content": raw},
+                    {"role": "user", "content": (
+                        "That reply was not a valid JSON object. Reply again with only the JSON object, "
+                        "with the keys extract_title, extract_content and tags."
+                    )}
+                ],
+                max_tokens=extract_length,
+                route=route,
+                log_f=log_f,
+                response_format=response_format
+            )
+            parsed, method = structured.parse_extract(raw)
+            structured.count(method or "invalid")
+            if parsed is not None:
+                structured.count("model_retry_parsed")
+        elif method == "repaired" and log_f:
+            log_f.write("Extract JSON repaired from the first balanced object in the reply\n")
+        
+        if parsed is not None:
+            title = parsed["extract_title"]
+            extract = parsed["extract_content"]
+            tags = parsed["tags"]
+            
+            # Make sure extract isn't empty
+            if extract in ("No summary.", "No summary generated."):
+                if content_length < 1000:
+                    # For short content, just use the original
+                    extract = content
                 else:
-                    # Last attempt failed, raise the error to be caught by outer try-except
-                    raise api_error
+                    # For longer content, use the first 500 chars
+                    extract = content[:500] + "... (Extract generation failed, showing original content preview)"
+            
+            # Make sure we have some tags
+            if not tags or tags == ["untagged"]:
+                tags = []
+                # Generate some basic tags from content
+                if "AI" in content:
+                    tags.append("AI")
+                if "book" in content.lower() or "publication" in content.lower():
+                    tags.append("Reading")
+                if "research" in content.lower():
+                    tags.append("Research")
+                if file_type:
+                    tags.append(file_type.capitalize())
+            
+            return title, extract, tags
         
-        # If we got here, all retries failed
-        raise Exception("All OpenAI API retries failed")
+        # Last resort: salvage what we can from a reply that never became valid JSON
+        structured.count("fallback")
+        if log_f:
+            log_f.write(f"Extract parsing failed, using heuristics. Raw text: {raw[:500]}...\n")
+        
+        lines = raw.split('\n')
+        title_match = re.search(r'"extract_title":\s*"([^"]+)"', raw)
+        title = title_match.group(1) if title_match else "Untitled"
+        if not title_match:
+            for line in lines:
+                if "title" in line.lower() and ":" in line:
+                    title = line.split(":", 1)[1].strip().strip('",\'')
+                    break
+        
+        content_match = re.search(r'"extract_content":\s*"([^"]+)"', raw)
+        extract = content_match.group(1) if content_match else raw
+        
+        tags = []
+        tags_match = re.search(r'"tags":\s*\[(.*?)\]', raw)
+        if tags_match:
+            tags = [tag.strip().strip('"\'') for tag in tags_match.group(1).split(',') if tag.strip()]
+        else:
+            for line in lines:
+                if "tags" in line.lower() and ":" in line:
+                    tags_part = line.split(":", 1)[1].strip()
+                    tags = [t.strip().strip('",[]') for t in tags_part.split(",") if t.strip()]
+                    break
+        
+        if not tags:
+            tags = ["extracted"]
+            if file_type:
+                tags.append(file_type.capitalize())
+        
+        return title, extract, tags
         
     except Exception as e:
         if log_f:
@@ -522,42 +553,293 @@ def get_extract(content, file_type=None, urls_metadata=None, log_f=None, is_link
         
         return error_title, error_extract, fallback_tags
 
-def organize_files():
-    inbox = "pkm/Inbox"
-    meta_out = "pkm/Processed/Metadata"
-    source_out = "pkm/Processed/Sources"
-    logs = "pkm/Logs"
+def reuse_extract(md_path):
+    """Return (title, extract, tags) from an existing record, or None if it has no usable extract"""
+    matched, _ = metafile.load(md_path)
+    tags = matched.get("tags") or []
+    if "extraction_failed" in tags or not matched.get("extract_content"):
+        return None
+    title = matched.get("extract_title") or matched.get("title")
+    return title, matched["extract_content"], list(tags)
+
+def process_file(input_path, log_f, reprocess_notes=None, move_source=True, extra_metadata=None, content_hash=None, check_near_duplicates=True):
+    """Extract, enrich and summarize one file and write its metadata record.
+
+    Returns the new record. Raises if the metadata could not be written.
+    """
+    filename = os.path.basename(input_path)
+    file_type = infer_file_type(filename)
+    sha256, md5 = content_hash or registry.hash_file(input_path)
+    size = os.path.getsize(input_path)
+
+    log_f.write(f"- File type detected: {file_type}\n")
+
+    # Extract text based on file type
+    if file_type == "pdf":
+        with metrics.stage("organize", "pdfplumber"):
+            text_content = extract_text_from_pdf(input_path)
+        extraction_method = "pdfplumber"
+
+        # Check if this is a LinkedIn post
+        is_linkedin = "linkedin.com" in text_content.lower() or "Profile viewers" in text_content[:500]
+    elif file_type == "image":
+        text_content = extract_text_from_image(input_path)
+        extraction_method = "ocr"
+        is_linkedin = False
+    else:
+        with metrics.stage("organize", "decode"):
+            with open(input_path, "rb") as f:
+                raw_bytes = f.read()
+            try:
+                text_content = raw_bytes.decode("utf-8")
+            except UnicodeDecodeError:
+                text_content = raw_bytes.decode("latin-1")
+        extraction_method = "decode"
+        is_linkedin = False
+
+    log_f.write(f"- Extraction method: {extraction_method}\n")
+    log_f.write(f"- Text content length: {len(text_content)} characters\n")
+    log_f.write(f"- Preview:\n```\n{text_content[:500]}\n```\n")
+
+    # Enhanced URL processing
+    urls, potential_titles = extract_urls(text_content)
+    log_f.write(f"- Detected URLs: {urls}\n")
+    log_f.write(f"- Potential titles: {potential_titles[:5]}\n")
+
+    # For resource lists, store the list of references in metadata
+    if file_type == "pdf" and ("resources" in text_content.lower() or text_content.count("\n1)") > 1):
+        has_resource_patterns = True
+        log_f.write(f"- Detected resource list pattern\n")
+    else:
+        has_resource_patterns = False
+
+    urls_metadata = {}
+
+    # Special handling for resource lists - add potential titles as "reference links"
+    if file_type == "pdf" and ("resources" in text_content.lower() or text_content.count("\n1)") > 1):
+        if len(potential_titles) > 3:  # If we found several potential resource titles
+            log_f.write(f"- Detected resource list with {len(potential_titles)} potential references\n")
+
+            # Store reference metadata
+            for title in potential_titles:
+                urls_metadata[title] = {
+                    "title": title,
+                    "description": "Referenced resource",
+                    "url": f"reference:{title}"  # Use a special prefix to indicate this isn't a real URL
+                }
+
+    if urls:
+        with metrics.stage("organize", "url_enrichment"):
+            enriched, url_data = enrich_urls(urls, potential_titles)
+        # Update the metadata with real URL data
+        urls_metadata.update(url_data)
+
+        # Add the enriched URLs to a separate section
+        url_section = "\n\n---\n\n## Referenced Links\n" + enriched
+        log_f.write(f"- Added enriched URL section\n")
+
+    base_name = Path(filename).stem
+    today = time.strftime("%Y-%m-%d")
+    md_filename = f"{today}_{base_name}.md"
+    log_f.write(f"- Output metadata filename: {md_filename}\n")
+
+    # Near-identical captures (re-exports, re-screenshots) are caught before the LLM stage
+    with metrics.stage("organize", "near_duplicate"):
+        text_signature = neardup.signature(text_content)
+        near_duplicate = None
+        if check_near_duplicates and neardup.NEAR_DUP_MODE != "off":
+            near_duplicate = neardup.find_near_duplicate(text_signature, META_OUT, exclude=md_filename)
+        if near_duplicate:
+            log_f.write(f"- ♻️ Near-duplicate of {near_duplicate[0]} (similarity {near_duplicate[1]:.2f})\n")
+
+    reused = None
+    if near_duplicate and neardup.NEAR_DUP_MODE == "skip":
+        reused = reuse_extract(os.path.join(META_OUT, near_duplicate[0]))
+
+    if reused:
+        title, extract, tags = reused
+        log_f.write(f"- Skipping OpenAI call, reusing extract from {near_duplicate[0]}\n")
+    else:
+        # Get extract from GPT
+        log_f.write(f"- Generating extract via OpenAI API\n")
+        try:
+            # If there are reprocessing notes, include them in the log
+            if reprocess_notes:
+                log_f.write(f"- Using reprocessing notes: {reprocess_notes}\n")
+
+            # Call OpenAI API with a higher timeout
+            with metrics.stage("organize", "llm"):
+                title, extract, tags = get_extract(text_content, file_type, urls_metadata, log_f, is_linkedin, notes=reprocess_notes)
+            log_f.write(f"- Extract generated successfully\n")
+            log_f.write(f"- Title: {title}\n")
+            log_f.write(f"- Tags: {tags}\n")
+            log_f.write(f"- Extract length: {len(extract)} characters\n")
+        except Exception as extract_error:
+            log_f.write(f"- ❌ Extract generation failed: {str(extract_error)}\n")
+            title = "Extraction Failed: " + base_name
+            extract = f"Failed to generate extract: {str(extract_error)}\n\nContent preview:\n{text_content[:500]}..."
+            tags = ["extraction_failed", "needs_review"]
+
+    # Default category based on file type
+    if is_linkedin:
+        category = "LinkedIn Post"
+    else:
+        category = "Reference" if file_type == "pdf" else "Image" if file_type == "image" else "Note"
+
+    # Try to improve tags when we have little information
+    if tags == ["uncategorized"] or tags == ["untagged"]:
+        if file_type == "pdf" and "AI" in text_content:
+            tags = ["AI", "Document", "Reference"]
+        elif file_type == "image" and extraction_method == "ocr":
+            tags = ["Image", "Slide", "Presentation"]
+
+    metadata = {
+        "title": title,
+        "date": today,
+        "file_type": file_type,
+        "source": filename,
+        "source_url": None,
+        "tags": tags,
+        "category": category,
+        "author": "Unknown",
+        "extract_title": title,
+        "extract_content": extract,
+        "reviewed": False,
+        "parse_status": "success",
+        "extraction_method": extraction_method,
+        "reprocess_status": "none",
+        "reprocess_rounds": "0",
+        "content_hash": sha256
+    }
+
+    # Add reprocessing notes if they exist
+    if reprocess_notes:
+        metadata["reprocess_notes"] = reprocess_notes
+
+    if near_duplicate:
+        metadata["near_duplicate_of"] = near_duplicate[0]
+        metadata["near_duplicate_score"] = round(near_duplicate[1], 3)
+
+    if extra_metadata:
+        metadata.update(extra_metadata)
+
+    # Store URL information if relevant
+    if urls:
+        metadata["referenced_urls"] = urls
+        # Store url titles in a more accessible format
+        url_titles = {}
+        for url, data in urls_metadata.items():
+            url_titles[url] = data.get("title", "Unknown")
+        metadata["url_titles"] = url_titles
+        metadata["url_section"] = url_section
+
+    # For resource lists, store the list of references in metadata
+    if has_resource_patterns and len(potential_titles) > 3:
+        metadata["referenced_resources"] = potential_titles
+
+    # For short documents, keep the full content regardless of file type
+    # This applies to all file types where we've extracted text
+    keep_full_content = (
+        len(text_content) < 10000 or  # Any text under 10K chars
+        len(urls) > 0                 # Any content with URLs
+    )
+
+    log_f.write(f"- Keeping full content: {keep_full_content}\n")
+
+    body = text_content if keep_full_content else "[Content omitted]"
+
+    # Save the metadata file
+    meta_path = os.path.join(META_OUT, md_filename)
+    log_f.write(f"- Writing metadata to: {meta_path}\n")
+
+    try:
+        with metrics.stage("organize", "frontmatter_write"), open(meta_path, "w", encoding="utf-8") as f:
+            f.write(metafile.dumps(metadata, body))
+        filestats.touch(meta_path)
+        log_f.write(f"- ✅ Metadata file written successfully\n")
+    except Exception as write_error:
+        log_f.write(f"- ❌ Failed to write metadata file: {str(write_error)}\n")
+        raise Exception(f"Failed to write metadata: {str(write_error)}")
+
+    # Remember these bytes so later copies link here instead of being reprocessed
+    registry.register_content(sha256, md5, size, file_type, filename, md_filename)
+    registry.set_source_record(filename, md_filename, file_type)
+    neardup.index_signature(md_filename, text_signature)
+
+    source_path = input_path
+    if move_source:
+        # Move the original file to appropriate source directory
+        dest_dir = os.path.join(SOURCE_OUT, file_type)
+        os.makedirs(dest_dir, exist_ok=True)
+        dest_path = os.path.join(dest_dir, filename)
+
+        log_f.write(f"- Moving original file to: {dest_path}\n")
+        try:
+            with metrics.stage("organize", "move"):
+                shutil.move(input_path, dest_path)
+            filestats.touch(input_path, dest_path)
+            source_path = dest_path
+            log_f.write(f"- ✅ Original file moved successfully\n")
+        except Exception as move_error:
+            log_f.write(f"- ❌ Failed to move original file: {str(move_error)}\n")
+            # We've created the metadata, so count it as a partial success
+            log_f.write(f"- ⚠️ Metadata created but original file not moved\n")
+
+    return {
+        "md_filename": md_filename,
+        "meta_path": meta_path,
+        "source_path": source_path,
+        "metadata": metadata
+    }
+
+
+def publish_staged(record, replaces=None):
+    """Tell /events listeners a record is waiting for review"""
+    metadata = record["metadata"]
+    events.publish(
+        "file-staged",
+        name=record["md_filename"],
+        title=metadata.get("title"),
+        extract_title=metadata.get("extract_title"),
+        file_type=metadata.get("file_type"),
+        tags=metadata.get("tags", []),
+        replaces=replaces
+    )
+
+def organize_files(progress=None):
+    """Process every file in pkm/Inbox, reporting per-file progress to the optional callback."""
+    inbox = INBOX
 
-    # Create a detailed log of this run
     os.makedirs(inbox, exist_ok=True)
-    os.makedirs(meta_out, exist_ok=True)
-    os.makedirs(source_out, exist_ok=True)
-    os.makedirs(logs, exist_ok=True)
+    os.makedirs(META_OUT, exist_ok=True)
+    os.makedirs(SOURCE_OUT, exist_ok=True)
 
-    log_file_path = os.path.join(logs, f"log_organize_{int(time.time())}.md")
-    
     # Return value to indicate success
     success_count = 0
     failed_files = []
+    duplicates = []
     
-    with open(log_file_path, "a", encoding="utf-8") as log_f:
+    # Create a detailed log of this run
+    with runlog.open_run("organize") as log_f:
         log_f.write(f"# Organize run at {time.time()}\n\n")
-        log_f.write(f"OpenAI API Key status: {bool(openai.api_key)}\n\n")
+        log_f.write(f"OpenAI API Key status: {llm.get_backend().is_configured()}\n\n")
 
-        files = [f for f in os.listdir(inbox) if os.path.isfile(os.path.join(inbox, f))]
+        files = [
+            f for f in os.listdir(inbox)
+            if os.path.isfile(os.path.join(inbox, f)) and not f.endswith(REPROCESS_NOTES_SUFFIX)
+        ]
         log_f.write(f"Found files in Inbox: {files}\n")
 
-        for filename in files:
+        for index, filename in enumerate(files):
+            if progress:
+                progress({"stage": "organize", "done": index, "total": len(files), "file": filename})
+            log_f.set_file(filename)
             try:
                 log_f.write(f"\n\n## Processing {filename}\n")
                 input_path = os.path.join(inbox, filename)
-                file_type = infer_file_type(filename)
-
-                log_f.write(f"- File type detected: {file_type}\n")
                 
                 # Check for reprocessing notes
-                reprocess_notes_filename = f"{os.path.splitext(filename)[0]}_reprocess_notes.txt"
-                reprocess_notes_path = os.path.join(inbox, reprocess_notes_filename)
+                reprocess_notes_path = os.path.join(inbox, f"{os.path.splitext(filename)[0]}{REPROCESS_NOTES_SUFFIX}")
                 reprocess_notes = None
                 
                 if os.path.exists(reprocess_notes_path):
@@ -565,210 +847,79 @@ def organize_files():
                         reprocess_notes = f.read().strip()
                     log_f.write(f"- Found reprocessing notes: {reprocess_notes[:100]}...\n")
                 
-                # Extract text based on file type
-                if file_type == "pdf":
-                    text_content = extract_text_from_pdf(input_path)
-                    extraction_method = "pdfplumber"
-                    
-                    # Check if this is a LinkedIn post
-                    is_linkedin = "linkedin.com" in text_content.lower() or "Profile viewers" in text_content[:500]
-                elif file_type == "image":
-                    text_content = extract_text_from_image(input_path)
-                    extraction_method = "ocr"
-                    is_linkedin = False
-                else:
-                    with open(input_path, "rb") as f:
-                        raw_bytes = f.read()
-                    try:
-                        text_content = raw_bytes.decode("utf-8")
-                        extraction_method = "decode"
-                    except UnicodeDecodeError:
-                        text_content = raw_bytes.decode("latin-1")
-                        extraction_method = "decode"
-                    is_linkedin = False
-
-                log_f.write(f"- Extraction method: {extraction_method}\n")
-                log_f.write(f"- Text content length: {len(text_content)} characters\n")
-                log_f.write(f"- Preview:\n```\n{text_content[:500]}\n```\n")
-
-                # Enhanced URL processing
-                urls, potential_titles = extract_urls(text_content)
-                log_f.write(f"- Detected URLs: {urls}\n")
-                log_f.write(f"- Potential titles: {potential_titles[:5]}\n")
-                
-                # For resource lists, store the list of references in metadata
-                if file_type == "pdf" and ("resources" in text_content.lower() or text_content.count("\n1)") > 1):
-                    has_resource_patterns = True
-                    log_f.write(f"- Detected resource list pattern\n")
-                else:
-                    has_resource_patterns = False
-                
-                urls_metadata = {}
-                
-                # Special handling for resource lists - add potential titles as "reference links"
-                if file_type == "pdf" and ("resources" in text_content.lower() or text_content.count("\n1)") > 1):
-                    if len(potential_titles) > 3:  # If we found several potential resource titles
-                        log_f.write(f"- Detected resource list with {len(potential_titles)} potential references\n")
-                        
-                        # Store reference metadata
-                        for title in potential_titles:
-                            urls_metadata[title] = {
-                                "title": title,
-                                "description": "Referenced resource",
-                                "url": f"reference:{title}"  # Use a special prefix to indicate this isn't a real URL
-                            }
-                
-                if urls:
-                    enriched, url_data = enrich_urls(urls, potential_titles)
-                    # Update the metadata with real URL data
-                    urls_metadata.update(url_data)
-                    
-                    # Add the enriched URLs to a separate section
-                    url_section = "\n\n---\n\n## Referenced Links\n" + enriched
-                    log_f.write(f"- Added enriched URL section\n")
-
-                base_name = Path(filename).stem
-                today = time.strftime("%Y-%m-%d")
-                md_filename = f"{today}_{base_name}.md"
-                log_f.write(f"- Output metadata filename: {md_filename}\n")
-
-                # Get extract from GPT
-                log_f.write(f"- Generating extract via OpenAI API\n")
-                try:
-                    # If there are reprocessing notes, include them in the log
-                    if reprocess_notes:
-                        log_f.write(f"- Using reprocessing notes: {reprocess_notes}\n")
-                    
-                    # Call OpenAI API with a higher timeout
-                    title, extract, tags = get_extract(text_content, file_type, urls_metadata, log_f, is_linkedin)
-                    log_f.write(f"- Extract generated successfully\n")
-                    log_f.write(f"- Title: {title}\n")
-                    log_f.write(f"- Tags: {tags}\n")
-                    log_f.write(f"- Extract length: {len(extract)} characters\n")
-                except Exception as extract_error:
-                    log_f.write(f"- ❌ Extract generation failed: {str(extract_error)}\n")
-                    title = "Extraction Failed: " + base_name
-                    extract = f"Failed to generate extract: {str(extract_error)}\n\nContent preview:\n{text_content[:500]}..."
-                    tags = ["extraction_failed", "needs_review"]
-
-                # Default category based on file type
-                if is_linkedin:
-                    category = "LinkedIn Post"
-                else:
-                    category = "Reference" if file_type == "pdf" else "Image" if file_type == "image" else "Note"
-                
-                # Try to improve tags when we have little information
-                if tags == ["uncategorized"] or tags == ["untagged"]:
-                    if file_type == "pdf" and "AI" in text_content:
-                        tags = ["AI", "Document", "Reference"]
-                    elif file_type == "image" and extraction_method == "ocr":
-                        tags = ["Image", "Slide", "Presentation"]
-
-                metadata = {
-                    "title": title,
-                    "date": today,
-                    "file_type": file_type,
-                    "source": filename,
-                    "source_url": None,
-                    "tags": tags,
-                    "category": category,
-                    "author": "Unknown",
-                    "extract_title": title,
-                    "extract_content": extract,
-                    "reviewed": False,
-                    "parse_status": "success",
-                    "extraction_method": extraction_method,
-                    "reprocess_status": "none",
-                    "reprocess_rounds": "0"
-                }
-                
-                # Add reprocessing notes if they exist
-                if reprocess_notes:
-                    metadata["reprocess_notes"] = reprocess_notes
-                
-                # Store URL information if relevant
-                if urls:
-                    metadata["referenced_urls"] = urls
-                    # Store url titles in a more accessible format
-                    url_titles = {}
-                    for url, data in urls_metadata.items():
-                        url_titles[url] = data.get("title", "Unknown")
-                    metadata["url_titles"] = url_titles
-                    metadata["url_section"] = url_section
-                
-                # For resource lists, store the list of references in metadata
-                if has_resource_patterns and len(potential_titles) > 3:
-                    metadata["referenced_resources"] = potential_titles
-                
-                # For short documents, keep the full content regardless of file type
-                # This applies to all file types where we've extracted text
-                keep_full_content = (
-                    len(text_content) < 10000 or  # Any text under 10K chars
-                    len(urls) > 0                 # Any content with URLs
-                )
-                
-                log_f.write(f"- Keeping full content: {keep_full_content}\n")
-                
-                # Create the frontmatter post
-                post = frontmatter.Post(
-                    content=text_content if keep_full_content else "[Content omitted]",
-                    **metadata
-                )
-
-                # Save the metadata file
-                meta_path = os.path.join(meta_out, md_filename)
-                log_f.write(f"- Writing metadata to: {meta_path}\n")
-                
-                try:
-                    with open(meta_path, "w", encoding="utf-8") as f:
-                        f.write(frontmatter.dumps(post))
-                    log_f.write(f"- ✅ Metadata file written successfully\n")
-                except Exception as write_error:
-                    log_f.write(f"- ❌ Failed to write metadata file: {str(write_error)}\n")
-                    failed_files.append((filename, f"Failed to write metadata: {str(write_error)}"))
-                    continue
-
-                # Move the original file to appropriate source directory
-                dest_dir = os.path.join(source_out, file_type)
-                os.makedirs(dest_dir, exist_ok=True)
-                dest_path = os.path.join(dest_dir, filename)
-                
-                log_f.write(f"- Moving original file to: {dest_path}\n")
-                try:
-                    shutil.move(input_path, dest_path)
-                    log_f.write(f"- ✅ Original file moved successfully\n")
-                    
-                    # Also remove reprocessing notes file if it exists
+                # Exact copies of an already processed source link to its record
+                with metrics.stage("organize", "hash"):
+                    sha256, md5 = registry.hash_file(input_path)
+                existing = registry.find_by_hash(sha256)
+                if existing and os.path.exists(os.path.join(META_OUT, existing["md_filename"])):
+                    log_f.write(f"- ♻️ Duplicate of {existing['source_name']}, linked to {existing['md_filename']}\n")
+                    registry.add_alias(sha256, filename)
+                    registry.set_source_record(filename, existing["md_filename"], existing["file_type"])
+                    # The bytes are already stored once in Processed/Sources
+                    os.remove(input_path)
                     if os.path.exists(reprocess_notes_path):
                         os.remove(reprocess_notes_path)
-                        log_f.write(f"- ✅ Removed reprocessing notes file\n")
-                except Exception as move_error:
-                    log_f.write(f"- ❌ Failed to move original file: {str(move_error)}\n")
-                    # If we can't move the file but we've created the metadata, 
-                    # count it as a partial success
-                    if os.path.exists(meta_path):
-                        log_f.write(f"- ⚠️ Metadata created but original file not moved\n")
-                    else:
-                        failed_files.append((filename, f"Failed to move file: {str(move_error)}"))
-                        continue
+                    filestats.touch(input_path, reprocess_notes_path)
+                    duplicates.append((filename, existing["md_filename"]))
+                    metrics.inc("pkm_files_total", pipeline="organize", outcome="duplicate")
+                    events.publish("file-ingested", file=filename, md_filename=existing["md_filename"], duplicate_of=existing["source_name"])
+                    continue
+                
+                record = process_file(input_path, log_f, reprocess_notes=reprocess_notes, content_hash=(sha256, md5))
+                
+                # Also remove reprocessing notes file if it exists
+                if os.path.exists(reprocess_notes_path):
+                    os.remove(reprocess_notes_path)
+                    filestats.touch(reprocess_notes_path)
+                    log_f.write(f"- ✅ Removed reprocessing notes file\n")
 
                 log_f.write(f"✅ File {filename} processed successfully\n")
                 success_count += 1
+                metrics.inc("pkm_files_total", pipeline="organize", outcome="processed")
+                events.publish("file-ingested", file=filename, md_filename=record["md_filename"], file_type=record["metadata"]["file_type"])
+                publish_staged(record)
 
             except Exception as e:
                 log_f.write(f"❌ Error processing {filename}: {str(e)}\n")
                 print(f"❌ ERROR in organize_files(): {e}")
                 failed_files.append((filename, str(e)))
+                metrics.inc("pkm_files_total", pipeline="organize", outcome="failed")
                 continue
+        log_f.set_file(None)
 
-    print(f"🏁 organize_files() complete. Processed {success_count} files successfully. Failed: {len(failed_files)}")
+    print(f"🏁 organize_files() complete. Processed {success_count} files successfully. Failed: {len(failed_files)}. Duplicates: {len(duplicates)}")
     
     # Return a summary of what happened
     return {
         "success_count": success_count,
         "failed_files": failed_files,
-        "log_file": log_file_path
+        "duplicates": duplicates,
+        "log_file": log_f.run_id
     }
 
+def reprocess_file(source_path, notes=None, reprocess_rounds=1, log_f=None):
+    """Re-run the pipeline for exactly one source already in Processed/Sources.
+
+    Unlike organize_files this never scans pkm/Inbox, so its cost doesn't
+    depend on the Inbox backlog. Returns the new record from process_file.
+    """
+    if log_f is None:
+        with runlog.open_run("reprocess") as own_log_f:
+            return reprocess_file(source_path, notes, reprocess_rounds, own_log_f)
+
+    log_f.write(f"\n\n## Reprocessing {os.path.basename(source_path)}\n")
+
+    os.makedirs(META_OUT, exist_ok=True)
+    record = process_file(
+        source_path,
+        log_f,
+        reprocess_notes=notes,
+        move_source=False,
+        check_near_duplicates=False,
+        extra_metadata={"reprocess_status": "complete", "reprocess_rounds": str(reprocess_rounds)}
+    )
+    log_f.write(f"✅ Reprocessed into {record['md_filename']}\n")
+    return record
+
 if __name__ == "__main__":
     organize_files()
\ No newline at end of file
@@ -0,0 +1,209 @@
+# File: apps/pkm-indexer/registry.py
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+REGISTRY_DB = os.environ.get("PKM_REGISTRY_DB", "pkm/registry.db")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_local = threading.local()
+
+# ─── STORAGE ──────────────────────────────────────────────────────
+
+def connect():
+    """Return this thread's connection to the registry database"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(REGISTRY_DB) or ".", exist_ok=True)
+        conn = sqlite3.connect(REGISTRY_DB, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS content_hashes (
+                sha256 TEXT PRIMARY KEY,
+                md5 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                file_type TEXT NOT NULL,
+                source_name TEXT NOT NULL,
+                md_filename TEXT NOT NULL,
+                drive_source_id TEXT,
+                first_seen REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS content_hashes_md5 ON content_hashes (md5)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS source_records (
+                source_name TEXT PRIMARY KEY,
+                md_filename TEXT NOT NULL,
+                file_type TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS minhash_signatures (
+                md_filename TEXT PRIMARY KEY,
+                signature BLOB NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS lsh_buckets (
+                band INTEGER NOT NULL,
+                bucket TEXT NOT NULL,
+                md_filename TEXT NOT NULL,
+                PRIMARY KEY (band, bucket, md_filename)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS lsh_buckets_record ON lsh_buckets (md_filename)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS content_aliases (
+                alias_name TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                seen_at REAL NOT NULL,
+                PRIMARY KEY (alias_name, sha256)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunk_summaries (
+                chunk_hash TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        _local.conn = conn
+    return conn
+
+def _row(row):
+    return dict(row) if row is not None else None
+
+# ─── CONTENT HASHES ───────────────────────────────────────────────
+
+def hash_file(path):
+    """Return the (sha256, md5) hex digests of a file, read in chunks.
+
+    md5 is kept alongside sha256 because it is the checksum Google Drive
+    reports, which lets sync spot duplicates before downloading them.
+    """
+    sha256 = hashlib.sha256()
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+            md5.update(chunk)
+    return sha256.hexdigest(), md5.hexdigest()
+
+def find_by_hash(sha256):
+    """Return the registered source with these exact bytes, or None"""
+    return _row(connect().execute("SELECT * FROM content_hashes WHERE sha256 = ?", (sha256,)).fetchone())
+
+def find_by_md5(md5):
+    """Return the registered source matching a Drive md5Checksum, or None"""
+    return _row(connect().execute("SELECT * FROM content_hashes WHERE md5 = ?", (md5,)).fetchone())
+
+def register_content(sha256, md5, size, file_type, source_name, md_filename):
+    """Record which source and metadata file hold these bytes"""
+    connect().execute(
+        """
+        INSERT INTO content_hashes (sha256, md5, size, file_type, source_name, md_filename, first_seen)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (sha256) DO UPDATE SET
+            file_type = excluded.file_type,
+            source_name = excluded.source_name,
+            md_filename = excluded.md_filename
+        """,
+        (sha256, md5, size, file_type, source_name, md_filename, time.time())
+    )
+
+def add_alias(sha256, alias_name):
+    """Link a duplicate arrival's filename to the content it duplicates"""
+    connect().execute(
+        "INSERT OR REPLACE INTO content_aliases (alias_name, sha256, seen_at) VALUES (?, ?, ?)",
+        (alias_name, sha256, time.time())
+    )
+
+def set_drive_source(sha256, drive_source_id):
+    """Remember that these bytes are already stored in Drive's Processed/Sources"""
+    connect().execute(
+        "UPDATE content_hashes SET drive_source_id = ? WHERE sha256 = ?", (drive_source_id, sha256)
+    )
+
+# ─── SOURCE TO METADATA MAP ───────────────────────────────────────
+
+def set_source_record(source_name, md_filename, file_type):
+    """Point a source filename at the metadata record describing it.
+
+    This is the authoritative link between a source and its metadata file;
+    it is written whenever organize writes or links a record.
+    """
+    connect().execute(
+        "INSERT OR REPLACE INTO source_records (source_name, md_filename, file_type, updated_at) VALUES (?, ?, ?, ?)",
+        (source_name, md_filename, file_type, time.time())
+    )
+
+def record_for_source(source_name):
+    """Return {source_name, md_filename, file_type} for a source filename, or None"""
+    return _row(connect().execute("SELECT * FROM source_records WHERE source_name = ?", (source_name,)).fetchone())
+
+# ─── NEAR-DUPLICATE SIGNATURES ────────────────────────────────────
+
+def store_signature(md_filename, signature, band_keys):
+    """Save a record's MinHash signature and its LSH band buckets"""
+    conn = connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM lsh_buckets WHERE md_filename = ?", (md_filename,))
+        conn.execute(
+            "INSERT OR REPLACE INTO minhash_signatures (md_filename, signature, updated_at) VALUES (?, ?, ?)",
+            (md_filename, signature, time.time())
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO lsh_buckets (band, bucket, md_filename) VALUES (?, ?, ?)",
+            [(band, bucket, md_filename) for band, bucket in enumerate(band_keys)]
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def lsh_candidates(band_keys):
+    """Return records sharing at least one LSH bucket with these band keys"""
+    conn = connect()
+    candidates = set()
+    for band, bucket in enumerate(band_keys):
+        rows = conn.execute(
+            "SELECT md_filename FROM lsh_buckets WHERE band = ? AND bucket = ?", (band, bucket)
+        ).fetchall()
+        candidates.update(row["md_filename"] for row in rows)
+    return candidates
+
+def get_signature(md_filename):
+    """Return a record's stored MinHash signature bytes, or None"""
+    row = connect().execute(
+        "SELECT signature FROM minhash_signatures WHERE md_filename = ?", (md_filename,)
+    ).fetchone()
+    return row["signature"] if row else None
+
+def remove_signature(md_filename):
+    """Forget the signature of a record that no longer exists"""
+    conn = connect()
+    conn.execute("DELETE FROM lsh_buckets WHERE md_filename = ?", (md_filename,))
+    conn.execute("DELETE FROM minhash_signatures WHERE md_filename = ?", (md_filename,))
+
+# ─── CHUNK SUMMARIES ──────────────────────────────────────────────
+
+def get_chunk_summary(chunk_hash):
+    """Return the cached summary of a chunk, or None"""
+    row = connect().execute(
+        "SELECT summary FROM chunk_summaries WHERE chunk_hash = ?", (chunk_hash,)
+    ).fetchone()
+    return row["summary"] if row else None
+
+def store_chunk_summary(chunk_hash, model, summary):
+    """Cache a chunk summary so reprocessing only reruns the reduce step"""
+    connect().execute(
+        "INSERT OR REPLACE INTO chunk_summaries (chunk_hash, model, summary, created_at) VALUES (?, ?, ?, ?)",
+        (chunk_hash, model, summary, time.time())
+    )
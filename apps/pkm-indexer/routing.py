@@ -0,0 +1,159 @@
+# File: apps/pkm-indexer/routing.py
+import os
+import re
+import json
+import math
+import threading
+
+try:
+    import tiktoken
+except ImportError:  # Optional - fall back to the local estimator
+    tiktoken = None
+
+# Model tiers. Short notes go to the fast model; only long or dense documents pay for the strong one.
+MODEL_FAST = os.environ.get("PKM_MODEL_FAST", "gpt-3.5-turbo")
+MODEL_STRONG = os.environ.get("PKM_MODEL_STRONG", "gpt-4")
+
+# Input budget sent to the model; replaces the old blind content[:5000] (~1250 tokens)
+MAX_INPUT_TOKENS = int(os.environ.get("PKM_LLM_MAX_INPUT_TOKENS", "1500"))
+# Upper bound on the estimated cost of one extract, in USD (0 disables the check)
+MAX_COST_PER_DOC = float(os.environ.get("PKM_LLM_MAX_COST_PER_DOC", "0.25"))
+# cost: prefer the fast model, quality: prefer the strong one, balanced: decide by content
+LLM_BUDGET = os.environ.get("PKM_LLM_BUDGET", "balanced")
+
+SHORT_TOKENS = 400
+LONG_TOKENS = 1200
+
+# USD per 1K tokens (input, output); override with PKM_MODEL_PRICES='{"model": [in, out]}'
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4": (0.03, 0.06),
+}
+MODEL_PRICES.update({k: tuple(v) for k, v in json.loads(os.environ.get("PKM_MODEL_PRICES", "{}")).items()})
+
+_encoding = None
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+# ─── TOKEN ESTIMATION ─────────────────────────────────────────────
+
+def estimate_tokens(text):
+    """Count tokens with tiktoken when installed, otherwise estimate locally.
+
+    The local estimate splits into words and punctuation and charges long
+    words one token per ~4 characters, which is close enough for budgeting.
+    """
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        return len(_encoding.encode(text, disallowed_special=()))
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in re.findall(r"\w+|[^\w\s]", text))
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to roughly max_tokens, preferring a paragraph or sentence boundary"""
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+    # Scale the cut point by the token ratio, refining for uneven token density
+    cut = int(len(text) * max_tokens / total)
+    for _ in range(3):
+        tokens = estimate_tokens(text[:cut])
+        if abs(tokens - max_tokens) <= max_tokens * 0.05:
+            break
+        cut = min(len(text), int(cut * max_tokens / max(tokens, 1)))
+    head = text[:cut]
+    for boundary in ("\n\n", "\n", ". "):
+        index = head.rfind(boundary)
+        if index > cut * 0.8:
+            return head[:index + len(boundary)].rstrip()
+    return head
+
+# ─── ROUTING ──────────────────────────────────────────────────────
+
+def classify_content(content, file_type=None, is_linkedin=False, urls_metadata=None):
+    """Name the kind of content, in the same precedence get_extract uses for prompts"""
+    if "resources" in content.lower() and (content.count("\n1)") > 1 or content.count("\n2)") > 1):
+        return "resource_list"
+    if is_linkedin:
+        return "linkedin"
+    if file_type == "image":
+        return "ocr"
+    if urls_metadata:
+        return "urls"
+    return "text"
+
+def estimate_cost(model, input_tokens, output_tokens):
+    price_in, price_out = MODEL_PRICES.get(model, MODEL_PRICES["gpt-4"])
+    return (input_tokens * price_in + output_tokens * price_out) / 1000
+
+def choose_route(content, file_type=None, is_linkedin=False, urls_metadata=None):
+    """Pick the model, output budget and input budget for one extract"""
+    content_type = classify_content(content, file_type, is_linkedin, urls_metadata)
+    tokens = estimate_tokens(content)
+    input_tokens = min(tokens, MAX_INPUT_TOKENS)
+    dense = content_type == "resource_list" or (content_type == "urls" and len(urls_metadata) >= 3)
+
+    if tokens < SHORT_TOKENS and not dense:
+        size, max_tokens = "short", 300
+    elif tokens < LONG_TOKENS and not dense:
+        size, max_tokens = "medium", 600
+    else:
+        size, max_tokens = "long", 1500
+
+    if LLM_BUDGET == "cost":
+        strong = False
+    elif LLM_BUDGET == "quality":
+        strong = size != "short"
+    else:
+        strong = size == "long" or dense
+    model = MODEL_STRONG if strong else MODEL_FAST
+
+    # Stay inside the per-document cost ceiling, first by downgrading, then by sending less
+    if MAX_COST_PER_DOC and estimate_cost(model, input_tokens, max_tokens) > MAX_COST_PER_DOC:
+        model = MODEL_FAST
+    if MAX_COST_PER_DOC:
+        price_in, price_out = MODEL_PRICES.get(model, MODEL_PRICES["gpt-4"])
+        affordable = int((MAX_COST_PER_DOC * 1000 - max_tokens * price_out) / price_in)
+        input_tokens = min(tokens, max(SHORT_TOKENS, min(input_tokens, affordable)))
+
+    return {
+        "name": f"{content_type}/{size}/{model}",
+        "content_type": content_type,
+        "model": model,
+        "max_tokens": max_tokens,
+        "input_tokens": input_tokens,
+        "content_tokens": tokens,
+        "estimated_cost": round(estimate_cost(model, input_tokens, max_tokens), 5),
+    }
+
+# ─── METRICS ──────────────────────────────────────────────────────
+
+def record_call(route, latency, ok=True):
+    """Accumulate per-route call counts, token budgets, latency and errors"""
+    with _metrics_lock:
+        entry = _metrics.setdefault(route["name"], {
+            "model": route["model"],
+            "calls": 0,
+            "errors": 0,
+            "input_tokens": 0,
+            "max_output_tokens": 0,
+            "estimated_cost": 0.0,
+            "latency_seconds_total": 0.0,
+        })
+        entry["calls"] += 1
+        entry["errors"] += 0 if ok else 1
+        entry["input_tokens"] += route["input_tokens"]
+        entry["max_output_tokens"] += route["max_tokens"]
+        entry["estimated_cost"] += route["estimated_cost"]
+        entry["latency_seconds_total"] += latency
+
+def route_metrics():
+    """Return a snapshot of the per-route metrics"""
+    with _metrics_lock:
+        snapshot = {name: dict(entry) for name, entry in _metrics.items()}
+    for entry in snapshot.values():
+        entry["latency_seconds_avg"] = entry["latency_seconds_total"] / entry["calls"] if entry["calls"] else 0.0
+    return snapshot
@@ -0,0 +1,446 @@
+# File: apps/pkm-indexer/runlog.py
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import versions
+
+# Every sync, webhook, organize, reprocess and approval run logs to one shared
+# JSON-lines sink instead of its own markdown file. Lines go to rotating
+# segment files; an SQLite index keeps each line's run, file, level and byte
+# offset, so /logs can page and filter without listing or reading segments.
+LOG_DIR = os.environ.get("PKM_LOG_DIR", "pkm/Logs")
+LOG_INDEX_DB = os.environ.get("PKM_LOG_INDEX_DB", os.path.join(LOG_DIR, "index.db"))
+MAX_SEGMENT_BYTES = int(os.environ.get("PKM_LOG_MAX_BYTES", str(16 * 1024 * 1024)))
+MAX_SEGMENT_AGE = int(os.environ.get("PKM_LOG_MAX_AGE", str(24 * 60 * 60)))  # seconds
+KEEP_SEGMENTS = int(os.environ.get("PKM_LOG_KEEP_SEGMENTS", "30"))
+# Also render each run to pkm/Logs/<run_id>.md, like the old per-run logs
+MARKDOWN_LOGS = os.environ.get("PKM_MARKDOWN_LOGS", "false").lower() == "true"
+
+INDEX_FLUSH_ROWS = 100
+INDEX_FLUSH_SECONDS = 1.0
+LEVELS = ("info", "warning", "error")
+
+_local = threading.local()
+_sink = None
+_sink_lock = threading.Lock()
+
+# ─── INDEX ────────────────────────────────────────────────────────
+
+def connect():
+    """Return this thread's connection to the log index"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(LOG_INDEX_DB) or ".", exist_ok=True)
+        conn = sqlite3.connect(LOG_INDEX_DB, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                title TEXT,
+                status TEXT NOT NULL,
+                lines INTEGER NOT NULL DEFAULT 0,
+                warnings INTEGER NOT NULL DEFAULT 0,
+                errors INTEGER NOT NULL DEFAULT 0,
+                started_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                finished_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS runs_started ON runs (started_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT NOT NULL,
+                ts REAL NOT NULL,
+                level TEXT NOT NULL,
+                file TEXT,
+                segment TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_run ON entries (run_id, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_file ON entries (file, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_level ON entries (level, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_segment ON entries (segment)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS segments (
+                name TEXT PRIMARY KEY,
+                started_at REAL NOT NULL,
+                bytes INTEGER NOT NULL DEFAULT 0,
+                closed INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        _local.conn = conn
+    return conn
+
+# ─── SINK ─────────────────────────────────────────────────────────
+
+class _Sink:
+    """Appends JSON lines to the active segment and batches index rows"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.segment = None
+        self.segment_started = 0.0
+        self.handle = None
+        self.pending = []
+        self.run_counts = {}
+        self.last_flush = time.time()
+        os.makedirs(LOG_DIR, exist_ok=True)
+        row = connect().execute(
+            "SELECT name, started_at FROM segments WHERE closed = 0 ORDER BY started_at DESC LIMIT 1"
+        ).fetchone()
+        if row and os.path.exists(os.path.join(LOG_DIR, row["name"])):
+            self._open(row["name"], row["started_at"])
+
+    def _open(self, name, started_at):
+        self.segment = name
+        self.segment_started = started_at
+        self.handle = open(os.path.join(LOG_DIR, name), "ab")
+
+    def _rotate(self):
+        """Close the active segment, start a new one and apply retention"""
+        conn = connect()
+        if self.handle:
+            self.handle.close()
+            conn.execute("UPDATE segments SET closed = 1 WHERE name = ?", (self.segment,))
+        now = time.time()
+        name = f"events-{int(now)}-{uuid.uuid4().hex[:6]}.jsonl"
+        conn.execute("INSERT INTO segments (name, started_at) VALUES (?, ?)", (name, now))
+        self._open(name, now)
+
+        expired = conn.execute(
+            "SELECT name FROM segments ORDER BY started_at DESC LIMIT -1 OFFSET ?", (KEEP_SEGMENTS,)
+        ).fetchall()
+        for row in expired:
+            try:
+                os.remove(os.path.join(LOG_DIR, row["name"]))
+            except FileNotFoundError:
+                pass
+            conn.execute("DELETE FROM entries WHERE segment = ?", (row["name"],))
+            conn.execute("DELETE FROM segments WHERE name = ?", (row["name"],))
+        if expired:
+            conn.execute("DELETE FROM runs WHERE status != 'running' AND run_id NOT IN (SELECT DISTINCT run_id FROM entries)")
+
+    def append(self, record):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self.lock:
+            if (self.handle is None or self.handle.tell() + len(line) > MAX_SEGMENT_BYTES
+                    or time.time() - self.segment_started > MAX_SEGMENT_AGE):
+                self._flush_locked()
+                self._rotate()
+            offset = self.handle.tell()
+            self.handle.write(line)
+            self.handle.flush()
+            self.pending.append((record["run_id"], record["ts"], record["level"], record.get("file"),
+                                 self.segment, offset, len(line)))
+            counts = self.run_counts.setdefault(record["run_id"], {"lines": 0, "warning": 0, "error": 0})
+            counts["lines"] += 1
+            if record["level"] in ("warning", "error"):
+                counts[record["level"]] += 1
+            versions.bump("logs")
+            if len(self.pending) >= INDEX_FLUSH_ROWS or time.time() - self.last_flush >= INDEX_FLUSH_SECONDS:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if not self.pending:
+            return
+        conn = connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO entries (run_id, ts, level, file, segment, offset, length) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self.pending
+            )
+            now = time.time()
+            for run_id, counts in self.run_counts.items():
+                conn.execute(
+                    "UPDATE runs SET lines = lines + ?, warnings = warnings + ?, errors = errors + ?, updated_at = ? WHERE run_id = ?",
+                    (counts["lines"], counts["warning"], counts["error"], now, run_id)
+                )
+            if self.segment:
+                conn.execute("UPDATE segments SET bytes = ? WHERE name = ?", (self.handle.tell(), self.segment))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.pending = []
+        self.run_counts = {}
+        self.last_flush = time.time()
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+def _get_sink():
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = _Sink()
+    return _sink
+
+def flush():
+    """Write buffered index rows so readers see every line logged so far"""
+    if _sink is not None:
+        _sink.flush()
+
+# ─── RUNS ─────────────────────────────────────────────────────────
+
+def infer_level(text):
+    """Map the emoji and prefixes the pipeline already writes onto a level"""
+    lowered = text.lower().lstrip("#- \n")
+    if "❌" in text or lowered.startswith(("error", "failed")) or " error:" in lowered:
+        return "error"
+    if "⚠️" in text or lowered.startswith("warning"):
+        return "warning"
+    return "info"
+
+def new_run_id(kind):
+    return f"{kind}_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+
+class RunLog:
+    """Log of one run, with the file-like write() the pipeline already uses.
+
+    Text written with write() is buffered until a newline, so a line
+    assembled from several writes ("Downloading x... " then "✅ Success")
+    becomes one record. Each record carries the run ID, level and the file
+    being handled (see set_file()).
+    """
+
+    def __init__(self, kind, run_id=None, title=None):
+        self.kind = kind
+        self.run_id = run_id or new_run_id(kind)
+        self.file = None
+        self.buffer = ""
+        self.closed = False
+        self.markdown = None
+        self.sink = _get_sink()
+        now = time.time()
+        connect().execute(
+            """
+            INSERT INTO runs (run_id, kind, title, status, started_at, updated_at) VALUES (?, ?, ?, 'running', ?, ?)
+            ON CONFLICT (run_id) DO UPDATE SET status = 'running', finished_at = NULL, updated_at = excluded.updated_at
+            """,
+            (self.run_id, kind, title, now, now)
+        )
+        if MARKDOWN_LOGS:
+            self.markdown = open(os.path.join(LOG_DIR, f"{self.run_id}.md"), "a", encoding="utf-8")
+
+    @property
+    def name(self):
+        return self.run_id
+
+    def set_file(self, filename):
+        """Attribute the following lines to this file, or to no file with None"""
+        self._emit_buffer()
+        self.file = filename
+
+    def write(self, text):
+        if self.markdown:
+            self.markdown.write(text)
+        self.buffer += text
+        if self.buffer.endswith("\n"):
+            self._emit_buffer()
+        return len(text)
+
+    def log(self, message, level=None, file=None, **fields):
+        """Write one structured record; extra fields are stored alongside the message"""
+        self._emit_buffer()
+        if self.markdown:
+            self.markdown.write(message.rstrip("\n") + "\n")
+        self._emit(message, level, file, fields)
+
+    def _emit_buffer(self):
+        text, self.buffer = self.buffer, ""
+        if text.strip():
+            self._emit(text, None, None, None)
+
+    def _emit(self, message, level, file, fields):
+        message = message.strip("\n")
+        record = {
+            "ts": time.time(),
+            "run_id": self.run_id,
+            "kind": self.kind,
+            "level": level or infer_level(message),
+            "file": file or self.file,
+            "msg": message,
+        }
+        if fields:
+            record["fields"] = fields
+        self.sink.append(record)
+
+    def flush(self):
+        self._emit_buffer()
+        if self.markdown:
+            self.markdown.flush()
+        self.sink.flush()
+
+    def close(self, status="finished"):
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        if self.markdown:
+            self.markdown.close()
+        now = time.time()
+        connect().execute(
+            "UPDATE runs SET status = ?, finished_at = ?, updated_at = ? WHERE run_id = ?",
+            (status, now, now, self.run_id)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.log(f"Run aborted: {exc}", level="error")
+        self.close("failed" if exc_type is not None else "finished")
+        return False
+
+def open_run(kind, run_id=None, title=None):
+    """Start a run log, or continue an existing one when run_id is given"""
+    return RunLog(kind, run_id=run_id, title=title)
+
+# ─── QUERIES ──────────────────────────────────────────────────────
+
+def get_run(run_id):
+    flush()
+    row = connect().execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+    return dict(row) if row else None
+
+def at_least(level):
+    """The levels a level filter matches: it means "at least this severe" everywhere"""
+    return LEVELS[LEVELS.index(level):]
+
+def list_runs(kind=None, file=None, level=None, limit=50, before=None):
+    """Return runs newest first, filtered by kind or by having lines for a file or of at least a level.
+
+    before is the started_at of the last run on the previous page.
+    """
+    flush()
+    clauses, params = [], []
+    if kind:
+        clauses.append("kind = ?")
+        params.append(kind)
+    if file:
+        clauses.append("run_id IN (SELECT run_id FROM entries WHERE file = ?)")
+        params.append(file)
+    if level:
+        levels = at_least(level)
+        clauses.append(f"run_id IN (SELECT run_id FROM entries WHERE level IN ({','.join('?' for _ in levels)}))")
+        params.extend(levels)
+    if before is not None:
+        clauses.append("started_at < ?")
+        params.append(before)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = connect().execute(
+        f"SELECT * FROM runs {where} ORDER BY started_at DESC LIMIT ?", (*params, limit)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+def _read_lines(rows):
+    """Read the indexed lines by seeking into their segments"""
+    entries = []
+    handles = {}
+    try:
+        for row in rows:
+            handle = handles.get(row["segment"])
+            if handle is None:
+                try:
+                    handle = handles[row["segment"]] = open(os.path.join(LOG_DIR, row["segment"]), "rb")
+                except FileNotFoundError:
+                    continue
+            handle.seek(row["offset"])
+            record = json.loads(handle.read(row["length"]).decode("utf-8"))
+            record["id"] = row["id"]
+            entries.append(record)
+    finally:
+        for handle in handles.values():
+            handle.close()
+    return entries
+
+def read_entries(run_id=None, file=None, level=None, after=0, limit=200):
+    """Return log records in order, starting after the entry ID `after`"""
+    flush()
+    clauses, params = ["id > ?"], [after]
+    if run_id:
+        clauses.append("run_id = ?")
+        params.append(run_id)
+    if file:
+        clauses.append("file = ?")
+        params.append(file)
+    if level:
+        levels = at_least(level)
+        clauses.append(f"level IN ({','.join('?' for _ in levels)})")
+        params.extend(levels)
+    rows = connect().execute(
+        f"SELECT * FROM entries WHERE {' AND '.join(clauses)} ORDER BY id LIMIT ?", (*params, limit)
+    ).fetchall()
+    return _read_lines(rows)
+
+def count_entries(run_id):
+    flush()
+    return connect().execute("SELECT COUNT(*) FROM entries WHERE run_id = ?", (run_id,)).fetchone()[0]
+
+def read_run_lines(run_id, start=0, count=200):
+    """Return lines start..start+count of a run (0-based), via the (run_id, id) index"""
+    flush()
+    rows = connect().execute(
+        "SELECT * FROM entries WHERE run_id = ? ORDER BY id LIMIT ? OFFSET ?", (run_id, count, start)
+    ).fetchall()
+    return _read_lines(rows)
+
+def tail_run(run_id, count):
+    """Return the last count lines of a run"""
+    flush()
+    rows = connect().execute(
+        "SELECT * FROM entries WHERE run_id = ? ORDER BY id DESC LIMIT ?", (run_id, count)
+    ).fetchall()
+    return _read_lines(reversed(rows))
+
+def render_markdown(run_id):
+    """Render a run the way the old markdown logs read"""
+    lines = []
+    after = 0
+    while True:
+        entries = read_entries(run_id=run_id, after=after, limit=1000)
+        if not entries:
+            break
+        lines.extend(entry["msg"] for entry in entries)
+        after = entries[-1]["id"]
+    return "\n".join(lines) + "\n" if lines else ""
+
+# ─── MARKDOWN FILES ───────────────────────────────────────────────
+
+TAIL_BLOCK_SIZE = 64 * 1024
+
+def read_file_range(path, start, end=None):
+    """Read bytes start..end (inclusive) of a file; returns (data, size)"""
+    size = os.path.getsize(path)
+    end = size - 1 if end is None else min(end, size - 1)
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(max(0, end - start + 1)), size
+
+def tail_file(path, count):
+    """Return the last count lines of a file, reading backwards in blocks"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        # One extra newline: the file's own trailing newline doesn't start a line
+        while position > 0 and data.count(b"\n") <= count:
+            step = min(TAIL_BLOCK_SIZE, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    return lines[-count:] if count else []
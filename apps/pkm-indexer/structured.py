@@ -0,0 +1,107 @@
+# File: apps/pkm-indexer/structured.py
+import os
+import json
+import threading
+
+# Ask for JSON mode where the model supports it: auto (by model name), on or off
+JSON_MODE = os.environ.get("PKM_LLM_JSON_MODE", "auto")
+JSON_MODE_MODELS = ("gpt-3.5-turbo", "gpt-4o", "gpt-4-turbo", "gpt-4-1106", "gpt-4-0125", "gpt-4.1")
+
+_metrics = {"parsed": 0, "repaired": 0, "invalid": 0, "model_retries": 0, "model_retry_parsed": 0, "fallback": 0}
+_metrics_lock = threading.Lock()
+
+def response_format(model):
+    """Return the response_format option for a model, or None when JSON mode is not used"""
+    if JSON_MODE == "off":
+        return None
+    if JSON_MODE == "on" or model.startswith(JSON_MODE_MODELS):
+        return {"type": "json_object"}
+    return None
+
+# ─── PARSING ──────────────────────────────────────────────────────
+
+def first_balanced_json(text):
+    """Return the first balanced {...} object in text, skipping braces inside strings, or None"""
+    start = text.find("{")
+    while start != -1:
+        depth, in_string, escaped = 0, False, False
+        for i in range(start, len(text)):
+            char = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    return text[start:i + 1]
+        start = text.find("{", start + 1)
+    return None
+
+def validate_extract(value):
+    """Check a parsed reply against the extract schema, coercing near misses.
+
+    The schema is {"extract_title": str, "extract_content": str, "tags": [str]}
+    with non-empty title and content. Returns the normalised dict, or None
+    if it cannot be used. Tags given
+    as a comma-separated string are split; a missing tag list becomes [].
+    """
+    if not isinstance(value, dict):
+        return None
+    title = value.get("extract_title")
+    content = value.get("extract_content")
+    if not isinstance(title, str) or not title.strip() or not isinstance(content, str) or not content.strip():
+        return None
+    tags = value.get("tags", [])
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    if not isinstance(tags, list):
+        return None
+    tags = [str(tag).strip().strip("#") for tag in tags if str(tag).strip()]
+    return {"extract_title": title.strip(), "extract_content": content.strip(), "tags": tags}
+
+def parse_extract(raw):
+    """Parse a model reply into an extract dict.
+
+    Tries strict JSON first, then one cheap repair - the first balanced
+    JSON object in the text, which handles code fences and chatter around
+    the object. Returns (extract, method) with method "parsed" or "repaired",
+    or (None, None) when neither yields a valid extract.
+    """
+    try:
+        extract = validate_extract(json.loads(raw))
+        if extract:
+            return extract, "parsed"
+    except ValueError:
+        pass
+    candidate = first_balanced_json(raw)
+    if candidate and candidate != raw.strip():
+        try:
+            extract = validate_extract(json.loads(candidate))
+            if extract:
+                return extract, "repaired"
+        except ValueError:
+            pass
+    return None, None
+
+# ─── METRICS ──────────────────────────────────────────────────────
+
+def count(name):
+    with _metrics_lock:
+        _metrics[name] += 1
+
+def parse_metrics():
+    """Return a snapshot of the parse, repair and retry counters"""
+    with _metrics_lock:
+        snapshot = dict(_metrics)
+    total = snapshot["parsed"] + snapshot["repaired"] + snapshot["invalid"]
+    snapshot["repair_rate"] = snapshot["repaired"] / total if total else 0.0
+    snapshot["failure_rate"] = snapshot["invalid"] / total if total else 0.0
+    return snapshot
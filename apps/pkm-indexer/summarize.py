@@ -0,0 +1,146 @@
+# File: apps/pkm-indexer/summarize.py
+import os
+import re
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import registry
+import routing
+
+# Long documents are summarized chunk by chunk (map) and the extract is written
+# from the chunk summaries (reduce) instead of from a truncated prefix.
+CHUNKED_SUMMARIES = os.environ.get("PKM_CHUNKED_SUMMARIES", "true").lower() == "true"
+CHUNK_TOKENS = int(os.environ.get("PKM_CHUNK_TOKENS", "1200"))
+CHUNK_CONCURRENCY = int(os.environ.get("PKM_CHUNK_CONCURRENCY", "4"))
+MAX_CHUNKS = int(os.environ.get("PKM_MAX_CHUNKS", "40"))
+CHUNK_SUMMARY_TOKENS = 250
+MAP_MODEL = routing.MODEL_FAST
+
+# Bump when the map prompt changes so stale cached summaries are not reused
+PROMPT_VERSION = "1"
+
+MAP_PROMPT = (
+    "You are summarizing one section of a longer document. Write a dense summary of this section "
+    "that keeps its key points, names, figures, titles and any URLs or resources it mentions. "
+    "Do not add an introduction or commentary; respond with the summary only.\n\n"
+    "Section {index} of {total}:\n{text}"
+)
+
+_HEADING = re.compile(r"^(#{1,6}\s|\d+(\.\d+)*[.)]?\s+[A-Z]|[A-Z][A-Z0-9 ,:&'-]{3,80}$)")
+
+# ─── CHUNKING ─────────────────────────────────────────────────────
+
+def _split_oversize(unit, max_tokens):
+    """Break a paragraph that is larger than a chunk on lines, then sentences"""
+    for pattern in (r"\n", r"(?<=[.!?])\s+"):
+        pieces = [p for p in re.split(pattern, unit) if p.strip()]
+        if len(pieces) > 1:
+            return [part for piece in pieces for part in
+                    (_split_oversize(piece, max_tokens) if routing.estimate_tokens(piece) > max_tokens else [piece])]
+    # No boundary left - cut it into token-sized slices
+    parts = []
+    while unit:
+        head = routing.truncate_to_tokens(unit, max_tokens)
+        parts.append(head)
+        unit = unit[len(head):].lstrip()
+    return parts
+
+def split_chunks(text, max_tokens=CHUNK_TOKENS):
+    """Split text into chunks of at most ~max_tokens on structural boundaries.
+
+    Paragraphs (blank lines) are packed greedily; a heading starts a new
+    chunk once the current one is half full so sections stay together.
+    """
+    units = []
+    for paragraph in re.split(r"\n\s*\n|\f", text):
+        if not paragraph.strip():
+            continue
+        if routing.estimate_tokens(paragraph) > max_tokens:
+            units.extend(_split_oversize(paragraph, max_tokens))
+        else:
+            units.append(paragraph.strip())
+
+    chunks, current, current_tokens = [], [], 0
+    for unit in units:
+        tokens = routing.estimate_tokens(unit)
+        is_heading = bool(_HEADING.match(unit.split("\n", 1)[0].strip()))
+        if current and (current_tokens + tokens > max_tokens or (is_heading and current_tokens >= max_tokens // 2)):
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+# ─── MAP / REDUCE ─────────────────────────────────────────────────
+
+def chunk_hash(text):
+    """Cache key for a chunk summary - changes with the chunk, the model or the prompt"""
+    return hashlib.sha256(f"{PROMPT_VERSION}|{MAP_MODEL}|{text}".encode("utf-8")).hexdigest()
+
+def _map_route(text):
+    tokens = routing.estimate_tokens(text)
+    return {
+        "name": f"chunk/map/{MAP_MODEL}",
+        "content_type": "chunk",
+        "model": MAP_MODEL,
+        "max_tokens": CHUNK_SUMMARY_TOKENS,
+        "input_tokens": tokens,
+        "content_tokens": tokens,
+        "estimated_cost": round(routing.estimate_cost(MAP_MODEL, tokens, CHUNK_SUMMARY_TOKENS), 5),
+    }
+
+def summarize_chunks(chunks, complete, log_f=None):
+    """Summarize chunks concurrently, reusing cached summaries.
+
+    complete is called as complete(model, messages, max_tokens, route=...)
+    and returns the reply text. Returns (summaries, cached_count).
+    """
+    keys = [chunk_hash(chunk) for chunk in chunks]
+    summaries = [registry.get_chunk_summary(key) for key in keys]
+    missing = [i for i, summary in enumerate(summaries) if summary is None]
+
+    def summarize_one(i):
+        prompt = MAP_PROMPT.format(index=i + 1, total=len(chunks), text=chunks[i])
+        summary = complete(
+            MAP_MODEL,
+            [
+                {"role": "system", "content": "You analyze content and extract semantic meaning."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=CHUNK_SUMMARY_TOKENS,
+            route=_map_route(chunks[i])
+        ).strip()
+        registry.store_chunk_summary(keys[i], MAP_MODEL, summary)
+        return summary
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(1, CHUNK_CONCURRENCY)) as pool:
+            for i, summary in zip(missing, pool.map(summarize_one, missing)):
+                summaries[i] = summary
+
+    if log_f:
+        log_f.write(f"Chunked summary: {len(chunks)} chunks, {len(chunks) - len(missing)} from cache\n")
+    return summaries, len(chunks) - len(missing)
+
+def condense(text, max_input_tokens, complete, log_f=None):
+    """Reduce a long text to section summaries that fit in max_input_tokens.
+
+    Summaries that are still too long together are chunked and summarized
+    again, so very long documents reduce hierarchically.
+    """
+    chunks = split_chunks(text)
+    if len(chunks) > MAX_CHUNKS:
+        if log_f:
+            log_f.write(f"Chunked summary: {len(chunks)} chunks, only the first {MAX_CHUNKS} are summarized\n")
+        chunks = chunks[:MAX_CHUNKS]
+
+    summaries, _ = summarize_chunks(chunks, complete, log_f=log_f)
+    combined = "\n\n".join(f"## Section {i + 1}\n{summary}" for i, summary in enumerate(summaries))
+
+    if routing.estimate_tokens(combined) > max_input_tokens and len(summaries) > 1:
+        return condense(combined, max_input_tokens, complete, log_f=log_f)
+    return (
+        f"[Summaries of {len(summaries)} consecutive sections of a long document]\n\n"
+        f"{routing.truncate_to_tokens(combined, max_input_tokens)}"
+    )
@@ -0,0 +1,21 @@
+# File: apps/pkm-indexer/tests/conftest.py
+import os
+import sys
+import importlib
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def vault(tmp_path, monkeypatch):
+    """An empty pkm/ tree as the working directory"""
+    for directory in ("pkm/Inbox", "pkm/Processed/Metadata", "pkm/Processed/Sources", "pkm/Logs"):
+        (tmp_path / directory).mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def filestats(vault):
+    """filestats with fresh counters and tombstones"""
+    import filestats
+    return importlib.reload(filestats)
@@ -0,0 +1,53 @@
+# File: apps/pkm-indexer/tests/test_events.py
+import asyncio
+import importlib
+import pytest
+import versions
+
+@pytest.fixture
+def events():
+    import events
+    return importlib.reload(events)
+
+def subscribe(events, last_event_id=None):
+    async def run():
+        subscription = events.Subscription(last_event_id=last_event_id)
+        received = []
+        while (event := await subscription.next(0.01)) is not None:
+            received.append(event["data"]["n"])
+        subscription.close()
+        return subscription.gap, received
+    return asyncio.run(run())
+
+def test_ids_carry_the_process_epoch(events):
+    event = events.publish("file-staged", n=1)
+    assert event["id"] == f"{versions.EPOCH}.1"
+    assert events.parse_event_id(event["id"]) == 1
+    assert events.parse_event_id("0ldep0ch.1") is None
+
+def test_reconnect_replays_what_was_missed(events):
+    first = events.publish("file-staged", n=1)
+    events.publish("file-staged", n=2)
+    events.publish("file-staged", n=3)
+    assert subscribe(events, first["id"]) == (False, [2, 3])
+    assert subscribe(events) == (False, [1, 2, 3])
+
+def test_reconnect_after_a_restart_asks_for_a_resync(events, monkeypatch):
+    # The client last saw event 700 from the previous process
+    monkeypatch.setattr(versions, "EPOCH", "0ldep0ch")
+    before_restart = events.publish("file-staged", n=700)["id"]
+    monkeypatch.undo()
+    events = importlib.reload(events)
+
+    events.publish("file-staged", n=1)
+    events.publish("file-staged", n=2)
+    gap, received = subscribe(events, before_restart)
+    assert gap
+    assert received == [1, 2]
+
+def test_reconnect_past_the_backlog_asks_for_a_resync(events, monkeypatch):
+    monkeypatch.setattr(events, "_backlog", events.deque(maxlen=2))
+    first = events.publish("file-staged", n=1)
+    for n in range(2, 5):
+        events.publish("file-staged", n=n)
+    assert subscribe(events, first["id"]) == (True, [3, 4])
@@ -0,0 +1,46 @@
+# File: apps/pkm-indexer/tests/test_filestats.py
+import os
+import metafile
+
+LONG_EXTRACT = "A long extract line that pushes the flags past the first block.\n" * 200
+
+def write_record(name, body="body", **metadata):
+    path = os.path.join("pkm/Processed/Metadata", name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(metafile.dumps(metadata, body))
+    return path
+
+def test_flags_after_a_long_extract(filestats):
+    assert len(LONG_EXTRACT) > 8192
+    write_record("approved.md", title="A", extract_content=LONG_EXTRACT, reviewed=True)
+    write_record("failed.md", title="F", extract_content=LONG_EXTRACT, reviewed=False, reprocess_status="failed")
+    write_record("open.md", title="O", extract_content=LONG_EXTRACT, reviewed=False)
+    stats = filestats.snapshot()
+    assert stats["metadata_count"] == 3
+    assert stats["unreviewed_count"] == 2
+    assert stats["failed_count"] == 1
+
+def test_failed_tag_in_body_is_ignored(filestats):
+    write_record("note.md", body="mentions extraction_failed in passing", title="N", tags=["AI"], reviewed=False)
+    write_record("bad.md", title="B", tags=["extraction_failed"], reviewed=False)
+    assert filestats.snapshot()["failed_count"] == 1
+
+def test_approving_a_long_record_leaves_staging(filestats):
+    path = write_record("long.md", title="L", extract_content=LONG_EXTRACT, reviewed=False)
+    write_record("other.md", title="O", reviewed=False)
+    version = filestats.staging_version()
+    assert filestats.staged()[0] == ["long.md", "other.md"]
+
+    write_record("long.md", title="L", extract_content=LONG_EXTRACT, reviewed=True)
+    filestats.touch(path)
+
+    names, removed, reset, more = filestats.staged(since=version)
+    assert (names, removed, reset, more) == ([], ["long.md"], False, False)
+    assert filestats.staged()[0] == ["other.md"]
+
+def test_reconcile_picks_up_an_untouched_approval(filestats):
+    write_record("long.md", title="L", extract_content=LONG_EXTRACT, reviewed=False)
+    version = filestats.staging_version()
+    write_record("long.md", title="L", extract_content=LONG_EXTRACT, reviewed=True)
+    assert filestats.reconcile() == 1
+    assert filestats.staged(since=version)[:2] == ([], ["long.md"])
@@ -0,0 +1,63 @@
+# File: apps/pkm-indexer/tests/test_jobs.py
+import time
+import importlib
+import threading
+import pytest
+
+@pytest.fixture
+def jobs(vault):
+    import jobs
+    jobs = importlib.reload(jobs)
+    yield jobs
+    jobs.stop_workers(timeout=5)
+
+def wait_for(jobs, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = jobs.get_job(job_id)
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.02)
+    return jobs.get_job(job_id)
+
+def test_ingest_backlog_does_not_hold_other_jobs(jobs):
+    release = threading.Event()
+    jobs.register_handler("sync", lambda payload, job: release.wait(5), lane="ingest")
+    jobs.register_handler("reprocess", lambda payload, job: "done")
+    jobs.start_workers(count=1)
+
+    syncs = [jobs.enqueue("sync", {"n": n}) for n in range(3)]
+    reprocess = jobs.enqueue("reprocess")
+    assert wait_for(jobs, reprocess["id"], timeout=2)["status"] == "succeeded"
+    assert [jobs.get_job(job["id"])["status"] for job in syncs] == ["running", "queued", "queued"]
+
+    release.set()
+    assert all(wait_for(jobs, job["id"])["status"] == "succeeded" for job in syncs)
+
+def test_unregistered_kinds_fail_on_the_default_lane(jobs):
+    jobs.start_workers(count=1)
+    job = jobs.enqueue("mystery")
+    assert wait_for(jobs, job["id"])["status"] == "failed"
+
+def test_follow_up_job_keeps_the_latest_payload_and_waits(jobs):
+    release = threading.Event()
+    seen = []
+    def handler(payload, job):
+        seen.append(payload["notes"])
+        release.wait(5)
+    jobs.register_handler("reprocess", handler)
+    jobs.start_workers(count=2)
+
+    first = jobs.enqueue("reprocess", {"notes": "one"}, key="reprocess:a.md", coalesce_running=False, update_queued=True)
+    deadline = time.time() + 2
+    while jobs.get_job(first["id"])["status"] != "running" and time.time() < deadline:
+        time.sleep(0.02)
+    second = jobs.enqueue("reprocess", {"notes": "two"}, key="reprocess:a.md", coalesce_running=False, update_queued=True)
+    third = jobs.enqueue("reprocess", {"notes": "three"}, key="reprocess:a.md", coalesce_running=False, update_queued=True)
+    assert second["id"] != first["id"] and third["id"] == second["id"]
+
+    time.sleep(0.2)  # The idle worker must not start the follow-up alongside the running job
+    assert jobs.get_job(second["id"])["status"] == "queued"
+    release.set()
+    assert wait_for(jobs, second["id"])["status"] == "succeeded"
+    assert seen == ["one", "three"]
@@ -0,0 +1,46 @@
+# File: apps/pkm-indexer/tests/test_metafile.py
+from datetime import date, datetime
+import pytest
+import metafile
+
+RECORDS = [
+    {"title": "Plain", "reviewed": False, "tags": ["AI", "Notes"]},
+    {"title": "Colons: and # hashes", "date": date(2025, 1, 1), "processed_at": datetime(2025, 1, 2, 3, 4, 5)},
+    {"extract_content": "First line\nsecond: line\n---\n  indented\ntrailing space \n", "tags": []},
+    {"source_url": None, "score": 0.93, "rounds": "0", "looks_like_bool": "true", "looks_like_date": "2025-01-01"},
+    {"url_titles": {"https://example.com/a": "A", "https://example.com/b": "B: b"}, "referenced_urls": ["https://example.com/a"]},
+    {"zeta": 1, "alpha": 2, "middle": "order kept as given"},
+]
+
+@pytest.mark.parametrize("metadata", RECORDS)
+def test_round_trip(metadata):
+    body = "Body text\n---\nwith a delimiter line in it\n"
+    assert metafile.loads(metafile.dumps(metadata, body)) == (metadata, body)
+
+def test_key_order_is_kept():
+    metadata, _ = metafile.loads(metafile.dumps(RECORDS[-1]))
+    assert list(metadata) == ["zeta", "alpha", "middle"]
+
+def test_legacy_input_is_normalized_then_stable():
+    legacy = {"tags": "[a, 'b']", "reviewed": "True", "title": "Old", "referenced_resources": "x, y"}
+    canonical = metafile.normalize(legacy)
+    assert canonical == {"tags": ["a", "b"], "reviewed": True, "title": "Old", "referenced_resources": ["x", "y"]}
+    assert metafile.loads(metafile.dumps(legacy))[0] == canonical
+    assert metafile.loads(metafile.dumps(canonical))[0] == canonical
+
+def test_hand_built_legacy_record():
+    text = "---\nreviewed: true\ntitle: Old: style\ntags: \n- a\n- b\nextract_content: multi\nline text\n---\n\nbody\n"
+    metadata, body = metafile.loads(text)
+    assert metadata == {"reviewed": True, "title": "Old: style", "tags": ["a", "b"], "extract_content": "multi\nline text"}
+    assert body == "body\n"
+    assert metafile.loads(metafile.dumps(metadata, body)) == (metadata, body)
+
+def test_header_and_body_reads_match_loads(tmp_path):
+    metadata = {"title": "Long", "extract_content": "line\n" * 5000, "reviewed": False}
+    body = "é" * 3000
+    path = tmp_path / "record.md"
+    path.write_text(metafile.dumps(metadata, body), encoding="utf-8")
+    header, offset = metafile.read_header(str(path))
+    assert header == metadata
+    assert metafile.read_body(str(path), offset) == body
+    assert metafile.read_body(str(path), offset, max_chars=1000) == body[:1000]
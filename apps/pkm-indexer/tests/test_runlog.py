@@ -0,0 +1,23 @@
+# File: apps/pkm-indexer/tests/test_runlog.py
+import importlib
+import pytest
+
+@pytest.fixture
+def runlog(vault):
+    import runlog
+    return importlib.reload(runlog)
+
+def test_level_filters_mean_at_least_this_severe(runlog):
+    with runlog.open_run("sync") as log_f:
+        log_f.log("fine")
+    with runlog.open_run("sync") as log_f:
+        log_f.log("careful", level="warning")
+    with runlog.open_run("organize") as log_f:
+        log_f.log("broken", level="error")
+
+    warning_runs = {run["run_id"] for run in runlog.list_runs(level="warning")}
+    warning_entries = {entry["run_id"] for entry in runlog.read_entries(level="warning")}
+    assert len(warning_runs) == 2
+    assert warning_runs == warning_entries
+    assert len(runlog.list_runs(level="error")) == 1
+    assert len(runlog.list_runs(level="info")) == 3
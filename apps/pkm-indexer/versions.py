@@ -0,0 +1,47 @@
+# File: apps/pkm-indexer/versions.py
+import time
+import uuid
+import hashlib
+import threading
+
+# Version counters for state the read endpoints serve: "files" is bumped by
+# the metadata and ingestion writers (through filestats.touch), "logs" by
+# every log line. main.py turns them into ETag / Last-Modified headers, so
+# an unchanged poll is answered with 304 before any work is done.
+EPOCH = uuid.uuid4().hex[:8]  # New per process, so versions never repeat across restarts
+STARTED_AT = time.time()
+
+_versions = {}  # scope -> [version, changed_at]
+_lock = threading.Lock()
+
+def bump(scope):
+    """Advance a scope's version and return the new one"""
+    with _lock:
+        entry = _versions.setdefault(scope, [0, STARTED_AT])
+        entry[0] += 1
+        entry[1] = time.time()
+        return entry[0]
+
+def current(scope):
+    """Return (version, changed_at) for a scope"""
+    with _lock:
+        version, changed_at = _versions.get(scope, (0, STARTED_AT))
+    return version, changed_at
+
+def etag(*scopes):
+    """Weak ETag and last change time covering the given scopes.
+
+    Weak because the same version may be sent gzip-compressed or not.
+    """
+    parts = []
+    changed_at = STARTED_AT
+    for scope in scopes:
+        version, scope_changed_at = current(scope)
+        parts.append(f"{scope}{version}")
+        changed_at = max(changed_at, scope_changed_at)
+    return f'W/"{EPOCH}-{"-".join(parts)}"', changed_at
+
+def digest_etag(*values):
+    """Weak ETag for state that is cheap to read but has no counter"""
+    digest = hashlib.sha1(repr(values).encode("utf-8")).hexdigest()[:16]
+    return f'W/"{digest}"'